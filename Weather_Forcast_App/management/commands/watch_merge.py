@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from Weather_Forcast_App.scripts.Merge_watcher import MergeWatcher
+
+
+class Command(BaseCommand):
+    help = "Watch output/ and merge new crawl files into Merge_data in micro-batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--debounce", type=float, default=5.0)
+        parser.add_argument("--poll", type=float, default=2.0)
+        parser.add_argument("--max-delay", type=float, default=60.0)
+        parser.add_argument("--max-batch", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--no-export", action="store_true")
+        parser.add_argument("--no-watchdog", action="store_true")
+
+    def handle(self, *args, **options):
+        base_dir = Path(__file__).resolve().parents[2]
+        watcher = MergeWatcher(
+            base_dir,
+            debounce=options["debounce"],
+            poll_interval=options["poll"],
+            max_delay=options["max_delay"],
+            max_batch_files=options["max_batch"],
+            export_xlsx=not options["no_export"],
+            workers=options["workers"],
+            use_watchdog=not options["no_watchdog"],
+            log=lambda msg: self.stdout.write(msg),
+        )
+        watcher.run_forever()
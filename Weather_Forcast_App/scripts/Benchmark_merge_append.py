@@ -0,0 +1,162 @@
+"""
+Benchmark bước chuyển DataFrame -> dòng lưu kho của Merge_xlsx trên dữ liệu giả lập:
+so sánh cách cũ (itertuples + _to_store_value từng ô) với dataframe_to_store_rows (theo cột),
+và đo append_df_incremental trọn vẹn vào một kho SQLite tạm.
+
+    python scripts/Benchmark_merge_append.py [--rows 500000] [--missing 0.1] [--skip-store] [--json report.json]
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from Weather_Forcast_App.scripts.Merge_xlsx import (
+        MASTER_COLUMNS,
+        MergeStore,
+        _to_store_value,
+        append_df_incremental,
+        dataframe_to_store_rows,
+    )
+except ImportError:
+    from Merge_xlsx import (
+        MASTER_COLUMNS,
+        MergeStore,
+        _to_store_value,
+        append_df_incremental,
+        dataframe_to_store_rows,
+    )
+
+TEXT_COLUMNS = {
+    "Mã trạm", "Tên trạm", "Tỉnh/Thành phố", "Huyện",
+    "Nguồn dữ liệu", "Chất lượng dữ liệu", "Tình trạng",
+    "Hướng gió hiện tại", "Hướng gió trung bình",
+}
+DATETIME_COLUMNS = {"Dấu thời gian", "Thời gian cập nhật"}
+
+# Số dòng đầu dùng để kiểm tra hai cách cho kết quả giống nhau
+CHECK_ROWS = 20_000
+
+
+def build_frame(rows, missing_ratio=0.1, seed=42):
+    """DataFrame giống file vietnam_weather_: đủ MASTER_COLUMNS, một phần ô bị thiếu"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2026-01-01")
+    data = {}
+    for col in MASTER_COLUMNS:
+        if col == "Mã trạm":
+            values = pd.Series([f"ST{i:07d}" for i in range(rows)], dtype=object)
+        elif col == "Thời gian cập nhật":
+            values = pd.Series(start + pd.to_timedelta(np.arange(rows), unit="min"))
+        elif col in DATETIME_COLUMNS:
+            values = pd.Series(start + pd.to_timedelta(rng.integers(0, 525_600, rows), unit="min"))
+        elif col in TEXT_COLUMNS:
+            values = pd.Series(rng.choice(["A", "B", "C", "Đông Bắc", "Tốt"], rows), dtype=object)
+        else:
+            values = pd.Series(rng.normal(25, 8, rows).round(1))
+
+        if missing_ratio and col != "Mã trạm" and col != "Thời gian cập nhật":
+            values = values.mask(rng.random(rows) < missing_ratio)
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+def legacy_store_rows(df, header):
+    """Cách cũ: reindex rồi gọi _to_store_value cho từng ô"""
+    df = df.reindex(columns=header)
+    return (
+        [_to_store_value(x) for x in row]
+        for row in df.itertuples(index=False, name=None)
+    )
+
+
+def _time_consume(rows):
+    started = time.perf_counter()
+    count = 0
+    for _ in rows:
+        count += 1
+    return count, time.perf_counter() - started
+
+
+def run_benchmark(rows, missing_ratio, with_store=True):
+    df = build_frame(rows, missing_ratio)
+    header = list(MASTER_COLUMNS)
+    results = []
+
+    sample = df.head(CHECK_ROWS)
+    legacy = [tuple(r) for r in legacy_store_rows(sample, header)]
+    vectorized = list(dataframe_to_store_rows(sample, header))
+    if legacy != vectorized:
+        print("❌ Kết quả hai cách chuyển đổi không khớp trên mẫu kiểm tra")
+        sys.exit(1)
+
+    for name, make_rows in (
+        ("legacy_per_cell", legacy_store_rows),
+        ("vectorized", dataframe_to_store_rows),
+    ):
+        count, elapsed = _time_consume(make_rows(df, header))
+        results.append(
+            {
+                "step": name,
+                "rows": count,
+                "seconds": round(elapsed, 3),
+                "rows_per_sec": round(count / elapsed, 1) if elapsed else 0.0,
+            }
+        )
+
+    if with_store:
+        with tempfile.TemporaryDirectory() as tmp:
+            with MergeStore(Path(tmp) / "bench.sqlite3") as store:
+                store_header = store.ensure_category("bench")
+                store.ensure_key_index("bench")
+                started = time.perf_counter()
+                appended, skipped = append_df_incremental(store, "bench", store_header, df)
+                elapsed = time.perf_counter() - started
+        results.append(
+            {
+                "step": "append_df_incremental",
+                "rows": appended,
+                "skipped": skipped,
+                "seconds": round(elapsed, 3),
+                "rows_per_sec": round(appended / elapsed, 1) if elapsed else 0.0,
+            }
+        )
+    return results
+
+
+def print_report(results):
+    header = f"{'Bước':<24}{'Dòng':>10}{'Giây':>10}{'Dòng/s':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['step']:<24}{r['rows']:>10}{r['seconds']:>10.3f}{r['rows_per_sec']:>14.1f}")
+
+    by_step = {r["step"]: r for r in results}
+    if by_step["vectorized"]["seconds"]:
+        speedup = by_step["legacy_per_cell"]["seconds"] / by_step["vectorized"]["seconds"]
+        print(f"\n⚡ Chuyển đổi theo cột nhanh hơn {speedup:.1f} lần")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chuyển đổi dòng khi append vào kho merge")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--missing", type=float, default=0.1, help="Tỉ lệ ô bị thiếu (NaN)")
+    parser.add_argument("--skip-store", action="store_true", help="Không đo append vào SQLite")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(max(1, args.rows), args.missing, with_store=not args.skip_store)
+    print_report(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n📄 Đã ghi kết quả: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Benchmark offline các parser Vrain trên bộ fixture (TEST/vrain_fixtures):
+số bản ghi/giây, bộ nhớ cấp phát (tracemalloc) và độ khớp với kết quả kỳ vọng trong manifest.json.
+
+    python scripts/Benchmark_vrain_parsers.py [--iterations 50] [--selenium] [--json report.json]
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+import unicodedata
+from pathlib import Path
+
+try:
+    from Weather_Forcast_App.scripts.Vrain_browser import extract_embedded_json
+    from Weather_Forcast_App.scripts.Vrain_fixture_server import FIXTURES_DIR, start_fixture_server
+    from Weather_Forcast_App.scripts.Crawl_data_from_html_of_Vrain import parse_province_html
+except ImportError:
+    from Vrain_browser import extract_embedded_json
+    from Vrain_fixture_server import FIXTURES_DIR, start_fixture_server
+    from Crawl_data_from_html_of_Vrain import parse_province_html
+
+
+def _load_vrain_scraper():
+    try:
+        from Weather_Forcast_App.scripts.Crawl_data_from_Vrain_by_API import VrainScraper
+    except ImportError:
+        from Crawl_data_from_Vrain_by_API import VrainScraper
+    # Module API bật logging INFO cho mỗi lần parse -> tắt để không làm nhiễu số đo
+    logging.getLogger().setLevel(logging.WARNING)
+    return VrainScraper()
+
+
+def _load_selenium_crawler(**kwargs):
+    try:
+        from Weather_Forcast_App.scripts.Crawl_data_from_Vrain_by_Selenium import VrainCrawlerFinal
+    except ImportError:
+        from Crawl_data_from_Vrain_by_Selenium import VrainCrawlerFinal
+    return VrainCrawlerFinal(**kwargs)
+
+
+def normalize_rows(rows):
+    """Chuẩn hóa (tên trạm, lượng mưa) để so sánh giữa các parser"""
+    normalized = set()
+    for name, rain in rows:
+        name = " ".join(unicodedata.normalize("NFC", str(name)).split())
+        try:
+            rain = f"{float(str(rain).replace(',', '.')):.1f}"
+        except ValueError:
+            rain = str(rain)
+        normalized.add((name, rain))
+    return normalized
+
+
+class ParserBenchmark:
+    def __init__(self, fixtures_dir=FIXTURES_DIR, iterations=50):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.iterations = iterations
+        self.manifest = json.loads((self.fixtures_dir / "manifest.json").read_text(encoding="utf-8"))
+        self.results = []
+
+        self._scraper = None
+        self._json_crawler = None
+
+    # === PARSER: mỗi hàm nhận nội dung fixture, trả về [(tên trạm, lượng mưa)] ===
+
+    def parse_regex_html(self, content):
+        """Regex của Crawl_data_from_html_of_Vrain (khối trạm render sẵn)"""
+        _, stations = parse_province_html(content)
+        return [
+            (s["Tên trạm"], s["Tổng lượng mưa"]) for s in stations if s["Tên trạm"] != "N/A"
+        ]
+
+    def parse_bs4_html(self, content):
+        """BeautifulSoup của VrainScraper.extract_real_data_from_html"""
+        if self._scraper is None:
+            self._scraper = _load_vrain_scraper()
+        rows = []
+        for item in self._scraper.extract_real_data_from_html(content):
+            name = item.get("station_name", item.get("ten_tram"))
+            rain = item.get("rainfall_value", item.get("gia_tri_luong_mua"))
+            if name is not None and rain is not None:
+                rows.append((name, rain))
+        return rows
+
+    def parse_embedded_json(self, content):
+        """JSON nhúng trong HTML (TransferState) + chuẩn hóa của VrainCrawlerFinal"""
+        crawler = self._get_json_crawler()
+        rows = []
+        for payload in extract_embedded_json(content):
+            rows.extend(crawler._process_json_data(payload))
+        return rows
+
+    def parse_api_json(self, content):
+        """Payload XHR/API + chuẩn hóa của VrainCrawlerFinal (nhánh network)"""
+        return self._get_json_crawler()._process_json_data(json.loads(content))
+
+    def _get_json_crawler(self):
+        if self._json_crawler is None:
+            self._json_crawler = _load_selenium_crawler(fetch_strategy="browser")
+        return self._json_crawler
+
+    # === ĐO ===
+
+    def _inputs(self, group):
+        for key, entry in self.manifest[group].items():
+            content = (self.fixtures_dir / entry["file"]).read_text(encoding="utf-8")
+            yield key, entry, content
+
+    def _measure(self, parser_name, parse, fixture, content, expected):
+        rows = parse(content)
+        got = normalize_rows(rows)
+        missing = expected - got
+        extra = got - expected
+        duplicates = len(rows) - len(got)
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        parse(content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            parse(content)
+        elapsed = time.perf_counter() - started
+
+        records = len(rows) * self.iterations
+        self.results.append(
+            {
+                "parser": parser_name,
+                "fixture": fixture,
+                "records": len(rows),
+                "records_per_sec": round(records / elapsed, 1) if elapsed and records else 0.0,
+                "ms_per_parse": round(elapsed * 1000 / self.iterations, 3),
+                "peak_alloc_kb": round((peak - before) / 1024, 1),
+                "match": not missing and not extra and not duplicates,
+                "missing": len(missing),
+                "extra": len(extra),
+                "duplicates": duplicates,
+            }
+        )
+
+    def run(self):
+        # Mỗi parser chỉ được đo trên loại trang mà nó được thiết kế để đọc
+        html_parsers = [
+            ("regex_html", self.parse_regex_html, {"rendered", "client_rendered"}),
+            ("bs4_html", self.parse_bs4_html, {"rendered", "embedded_json", "client_rendered"}),
+            ("embedded_json", self.parse_embedded_json, {"embedded_json", "client_rendered"}),
+        ]
+        for key, entry, content in self._inputs("pages"):
+            expected = normalize_rows(entry["stations"])
+            for parser_name, parse, kinds in html_parsers:
+                if entry["kind"] in kinds:
+                    self._measure(parser_name, parse, f"pages/{key}", content, expected)
+
+        for key, entry, content in self._inputs("api"):
+            expected = normalize_rows(entry["stations"])
+            self._measure("api_json", self.parse_api_json, f"api/{key}", content, expected)
+
+        return self.results
+
+    def run_selenium(self):
+        """Nhánh DOM của VrainCrawlerFinal qua Chrome thật, trỏ vào server fixture cục bộ"""
+        server = start_fixture_server(fixtures_dir=self.fixtures_dir)
+        crawler = _load_selenium_crawler(
+            max_workers=1, max_retries=0, fetch_strategy="browser", block_resources=False
+        )
+        crawler.base_url = server.base_url
+        try:
+            for key, entry, _ in self._inputs("pages"):
+                expected = normalize_rows(entry["stations"])
+                crawler.unique_stations.clear()
+
+                started = time.perf_counter()
+                try:
+                    crawler.crawl_province(int(key))
+                except Exception as e:
+                    print(f"⚠️  Selenium lỗi ở pages/{key}: {str(e)[:60]}")
+                elapsed = time.perf_counter() - started
+
+                rows = [
+                    (row["tram"], row["luong_mua"]) for row in crawler.unique_stations.values()
+                ]
+                got = normalize_rows(rows)
+                self.results.append(
+                    {
+                        "parser": "selenium_dom",
+                        "fixture": f"pages/{key}",
+                        "records": len(got),
+                        "records_per_sec": round(len(got) / elapsed, 1) if got else 0.0,
+                        "ms_per_parse": round(elapsed * 1000, 1),
+                        "peak_alloc_kb": None,
+                        "match": got == expected,
+                        "missing": len(expected - got),
+                        "extra": len(got - expected),
+                        "duplicates": len(rows) - len(got),
+                    }
+                )
+        finally:
+            crawler.driver_pool.shutdown()
+            server.shutdown()
+        return self.results
+
+    def print_report(self):
+        header = f"{'Parser':<15}{'Fixture':<28}{'Records':>8}{'Rec/s':>12}{'ms/parse':>10}{'Peak KB':>9}  Khớp"
+        print(header)
+        print("-" * len(header))
+        for r in self.results:
+            peak = "-" if r["peak_alloc_kb"] is None else f"{r['peak_alloc_kb']:.1f}"
+            match = (
+                "✅"
+                if r["match"]
+                else f"❌ (thiếu {r['missing']}, thừa {r['extra']}, trùng {r['duplicates']})"
+            )
+            print(
+                f"{r['parser']:<15}{r['fixture']:<28}{r['records']:>8}{r['records_per_sec']:>12.1f}"
+                f"{r['ms_per_parse']:>10.3f}{peak:>9}  {match}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parser Vrain trên fixture offline")
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--selenium", action="store_true", help="Đo thêm nhánh DOM qua Chrome")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    fixtures_dir = Path(args.fixtures)
+    if not (fixtures_dir / "manifest.json").exists():
+        print(f"❌ Không tìm thấy manifest.json trong {fixtures_dir}")
+        sys.exit(1)
+
+    bench = ParserBenchmark(fixtures_dir, iterations=max(1, args.iterations))
+    bench.run()
+    if args.selenium:
+        bench.run_selenium()
+    bench.print_report()
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps(bench.results, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        print(f"\n📄 Đã ghi kết quả: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
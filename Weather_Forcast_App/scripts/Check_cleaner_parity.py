@@ -0,0 +1,152 @@
+"""
+Kiểm tra ChunkedCleaner với REPORT_CLEAN_RULES cho ra cùng dữ liệu như perform_cleaning cũ
+(bản nạp cả file vào RAM trước khi chuyển sang làm sạch theo khúc).
+
+    python scripts/Check_cleaner_parity.py [file.csv|file.xlsx ...] [--chunk-rows 2]
+
+Không truyền file -> chạy trên các bộ dữ liệu mẫu bên dưới. Thoát với mã 1 nếu có khác biệt.
+"""
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from Weather_Forcast_App.scripts.Chunked_cleaner import (
+        REPORT_CLEAN_RULES,
+        ChunkedCleaner,
+        iter_dataframe_chunks,
+    )
+except ImportError:
+    from Chunked_cleaner import REPORT_CLEAN_RULES, ChunkedCleaner, iter_dataframe_chunks
+
+
+NA_TOKENS = ["N/A", "NA", "null", "NULL", ""]
+
+
+def _is_text(col: pd.Series) -> bool:
+    # Bản cũ chạy trên pandas 2 (cột chữ là object); pandas mới dùng kiểu str riêng
+    return col.dtype == object or pd.api.types.is_string_dtype(col)
+
+
+def legacy_perform_cleaning(data_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Phần xử lý dữ liệu của perform_cleaning cũ (bỏ đọc/ghi file và báo cáo).
+    Dòng header lặp bị loại theo đúng ý của bản cũ ("hơn 50% cột trùng tên cột"):
+    bản cũ OR các cột lại trước khi đếm nên không bao giờ đạt ngưỡng khi có từ 2 cột.
+    """
+    data_df = data_df.copy()
+    data_df.columns = [str(c).strip() for c in data_df.columns]
+    data_df.replace(NA_TOKENS, np.nan, inplace=True)
+
+    first_col = data_df.columns[0]
+    data_df = data_df[~data_df[first_col].astype(str).str.contains("DANH SÁCH", case=False, na=False)]
+    if "Tên Trạm" in data_df.columns:
+        first = data_df.iloc[:, 0].astype(str).str.strip()
+        header_mask = data_df["Tên Trạm"].astype(str).str.strip().eq("Tên Trạm") & first.ne(
+            first.iloc[0] if len(data_df) > 0 else ""
+        )
+        data_df = data_df[~header_mask]
+
+    duplicate_header_count = pd.Series(0, index=data_df.index)
+    for col in data_df.columns:
+        if _is_text(data_df[col]):
+            duplicate_header_count += data_df[col].astype(str).str.strip().eq(col.strip())
+    data_df = data_df[~(duplicate_header_count > len(data_df.columns) * 0.5)]
+    data_df = data_df.reset_index(drop=True)
+
+    for col in data_df.select_dtypes(include=[np.number]).columns:
+        data_df.loc[data_df[col] < 0, col] = 0
+
+    for col in data_df.columns:
+        if _is_text(data_df[col]):
+            converted = pd.to_numeric(data_df[col], errors="coerce")
+            not_null_count = converted.notna().sum()
+            ratio = not_null_count / len(data_df[col]) if len(data_df[col]) else 0
+            if ratio >= 0.85 and not_null_count > 0:
+                data_df[col] = converted
+
+        col_l = col.lower()
+        if ("date" in col_l) or ("time" in col_l) or ("thời gian" in col_l) or ("ngày" in col_l):
+            data_df[col] = pd.to_datetime(data_df[col], errors="coerce")
+
+    num_cols = data_df.select_dtypes(include=[np.number]).columns.tolist()
+    dt_cols = data_df.select_dtypes(include=["datetime64[ns]"]).columns.tolist()
+    cat_cols = [c for c in data_df.columns if c not in num_cols and c not in dt_cols]
+    for c in num_cols:
+        m = data_df[c].mean()
+        data_df[c] = data_df[c].fillna(m if pd.notna(m) else 0)
+    for c in dt_cols:
+        mode = data_df[c].mode()
+        data_df[c] = data_df[c].fillna(mode.iloc[0] if not mode.empty else pd.NaT)
+    for c in cat_cols:
+        mode = data_df[c].mode()
+        data_df[c] = data_df[c].fillna(mode.iloc[0] if not mode.empty else "")
+    return data_df
+
+
+def sample_frames() -> dict:
+    return {
+        "negative_mean": pd.DataFrame({"Lượng mưa": [10, -30, np.nan, 20]}),
+        "vrain_report": pd.DataFrame(
+            {
+                "Tên trạm": ["A", "B", "Tên trạm", "C", "D", "E", None],
+                "Tỉnh": ["Hà Nội", "N/A", "Tỉnh", "Huế", "Huế", "", "Huế"],
+                "Tổng lượng mưa": ["1.5", "2", "Tổng lượng mưa", "N/A", "4", "0", "3"],
+                "Nhiệt độ": [30.0, -1.0, np.nan, 28.0, np.nan, 25.0, 27.0],
+                "Thời gian cập nhật": [
+                    "2024-03-05 10:00", "2024-03-05 11:00", "Thời gian cập nhật", None,
+                    "2024-03-05 10:00", "2024-03-05 12:00", "2024-03-05 10:00",
+                ],
+            }
+        ),
+    }
+
+
+def _roundtrip(df: pd.DataFrame, path: Path) -> pd.DataFrame:
+    """So sánh qua CSV như file thật được ghi ra (bỏ khác biệt dtype trong RAM)"""
+    df.to_csv(path, index=False, encoding="utf-8-sig")
+    return pd.read_csv(path, encoding="utf-8-sig", keep_default_na=False)
+
+
+def check_frame(name: str, df: pd.DataFrame, chunk_rows: int, work_dir: Path) -> bool:
+    expected = _roundtrip(legacy_perform_cleaning(df), work_dir / f"{name}_legacy.csv")
+
+    out_path = work_dir / f"{name}_chunked.csv"
+    ChunkedCleaner(REPORT_CLEAN_RULES, chunk_rows=chunk_rows).clean(
+        lambda: iter_dataframe_chunks(df, chunk_rows), out_path
+    )
+    actual = pd.read_csv(out_path, encoding="utf-8-sig", keep_default_na=False)
+
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=False)
+    except AssertionError as e:
+        print(f"❌ {name}: khác perform_cleaning cũ\n{e}")
+        return False
+    print(f"✅ {name}: {len(actual)} dòng khớp perform_cleaning cũ")
+    return True
+
+
+def _read_file(path: Path) -> pd.DataFrame:
+    if path.suffix.lower() in (".xlsx", ".xls"):
+        return pd.read_excel(path, engine="openpyxl")
+    return pd.read_csv(path, encoding="utf-8-sig")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--chunk-rows", type=int, default=2, help="Khúc nhỏ để kiểm cả đường gộp thống kê nhiều khúc")
+    args = parser.parse_args(argv)
+
+    frames = {p.stem: _read_file(p) for p in args.files} if args.files else sample_frames()
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = [check_frame(name, df, args.chunk_rows, Path(tmp)) for name, df in frames.items()]
+    return 0 if all(ok) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
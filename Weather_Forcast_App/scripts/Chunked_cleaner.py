@@ -0,0 +1,708 @@
+"""
+Làm sạch dữ liệu theo từng khúc (chunk) để file gộp hàng triệu dòng vẫn chạy trong bộ nhớ giới hạn.
+
+    Lượt 1: đọc lần lượt từng khúc, gom thống kê mỗi cột (số ô thiếu, tỉ lệ đọc được số/ngày giờ,
+            tổng/đếm cho mean, mẫu ngẫu nhiên cố định kích thước cho median, bộ đếm giới hạn cho mode).
+    Lượt 2: đọc lại từng khúc, chuẩn hóa + điền thiếu theo thống kê lượt 1, bỏ dòng trùng
+            (hash 64-bit mỗi dòng) và ghi CSV nối dần.
+
+Bộ nhớ tối đa ~ một khúc + mẫu median + bộ đếm mode + 8 byte/dòng cho chỉ mục dòng trùng.
+"""
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from numpy.dtypes import StringDType
+from openpyxl import load_workbook
+from pandas.tseries.api import guess_datetime_format
+
+
+DEFAULT_CHUNK_ROWS = 100_000
+# Số giá trị giữ lại cho mỗi cột để ước lượng median
+QUANTILE_SAMPLE_SIZE = 20_000
+# Số giá trị phân biệt tối đa mà bộ đếm mode giữ (Misra-Gries)
+MODE_COUNTER_SIZE = 1_000
+
+# Suy luận kiểu dữ liệu trên mẫu (bước nhảy cố định) của khúc đầu tiên
+INFER_SAMPLE_ROWS = 10_000
+TYPE_DECISION_CACHE_SIZE = 1_024
+
+DATETIME_NAME_HINTS = ["time", "date", "timestamp", "ngày", "giờ", "cap nhat", "cập nhật", "thời gian"]
+
+# Quy tắc của job clean trong View_Clear (_clean_dataframe cũ)
+VIEW_CLEAN_RULES = {
+    "na_tokens": ["nan", "None", ""],
+    "strip_strings": True,
+    "comma_decimal": True,
+    "numeric_min_ratio": 0.6,
+    "numeric_min_count": 5,
+    "numeric_ratio_base": "non_null",
+    "datetime_hints": ["time", "date", "timestamp", "ngày", "giờ", "cap nhat", "cập nhật"],
+    "datetime_min_ratio": 0.3,
+    "datetime_min_count": 5,
+    "dayfirst": True,
+    "numeric_fill": "median",
+    "datetime_fill": None,
+    "text_fill_default": "unknown",
+    "clip_negative": False,
+    "drop_header_rows": False,
+    "drop_duplicates": True,
+}
+
+# Quy tắc của Cleardata.perform_cleaning
+REPORT_CLEAN_RULES = {
+    "na_tokens": ["N/A", "NA", "null", "NULL", ""],
+    "strip_strings": False,
+    "comma_decimal": False,
+    "numeric_min_ratio": 0.85,
+    "numeric_min_count": 1,
+    "numeric_ratio_base": "rows",
+    "datetime_hints": ["date", "time", "thời gian", "ngày"],
+    "datetime_min_ratio": 0.0,
+    "datetime_min_count": 0,
+    "dayfirst": False,
+    "numeric_fill": "mean",
+    "datetime_fill": "mode",
+    "text_fill_default": "",
+    "clip_negative": True,
+    "drop_header_rows": True,
+    "drop_duplicates": False,
+}
+
+
+# Quyết định số/ngày giờ theo (phiên bản schema, tên cột); chỉ để bỏ bước suy luận trên mẫu,
+# kết quả cuối vẫn do _plan kiểm trên toàn bộ dữ liệu
+_TYPE_DECISIONS = OrderedDict()
+_TYPE_DECISIONS_LOCK = threading.Lock()
+
+
+# === NGUỒN DỮ LIỆU THEO KHÚC ===
+
+def _make_header(values) -> list[str]:
+    """Tên cột giống pd.read_excel: ô trống -> "Unnamed: i", tên trùng -> "x.1", "x.2"..."""
+    header, seen = [], {}
+    for i, v in enumerate(values):
+        name = f"Unnamed: {i}" if v is None or str(v).strip() == "" else str(v)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def iter_excel_chunks(path: Path, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """Đọc .xlsx ở chế độ read-only, trả về từng DataFrame tối đa chunk_rows dòng"""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        first = next(rows, None)
+        if first is None:
+            return
+        header = _make_header(first)
+
+        batch = []
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            row = list(row[: len(header)]) + [None] * (len(header) - len(row))
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        wb.close()
+
+
+def iter_csv_chunks(path: Path, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    for encoding in ("utf-8-sig", "utf-8"):
+        try:
+            reader = pd.read_csv(path, encoding=encoding, chunksize=chunk_rows, low_memory=False)
+            yield from reader
+            return
+        except UnicodeDecodeError:
+            continue
+
+
+def iter_file_chunks(path: Path, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    path = Path(path)
+    if path.suffix.lower() in (".xlsx", ".xls"):
+        return iter_excel_chunks(path, chunk_rows)
+    return iter_csv_chunks(path, chunk_rows)
+
+
+def iter_files_chunks(paths, chunk_rows: int = DEFAULT_CHUNK_ROWS, chunk_filter=None):
+    """Nối khúc của nhiều file liên tiếp; chunk_filter(df) -> df để lọc từng khúc (vd. theo khoảng thời gian)"""
+    for path in paths:
+        for chunk in iter_file_chunks(path, chunk_rows):
+            if chunk_filter is not None:
+                chunk = chunk_filter(chunk)
+            if len(chunk):
+                yield chunk
+
+
+def iter_dataframe_chunks(df: pd.DataFrame, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """DataFrame đã nằm trong RAM -> các lát cắt (view, không copy)"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# === THỐNG KÊ LUỒNG ===
+
+class QuantileSketch:
+    """
+    Mẫu ngẫu nhiên đều kích thước cố định (bottom-k theo khóa ngẫu nhiên) để ước lượng phân vị;
+    chính xác tuyệt đối khi số giá trị <= size.
+    """
+
+    def __init__(self, size=QUANTILE_SAMPLE_SIZE, seed=0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.values = np.empty(0, dtype=float)
+        self.keys = np.empty(0, dtype=float)
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        keys = np.concatenate([self.keys, self.rng.random(len(values))])
+        merged = np.concatenate([self.values, values])
+        if len(merged) > self.size:
+            keep = np.argpartition(keys, self.size - 1)[: self.size]
+            keys, merged = keys[keep], merged[keep]
+        self.keys, self.values = keys, merged
+
+    def quantile(self, q: float):
+        if not len(self.values):
+            return None
+        return float(np.quantile(self.values, q))
+
+
+class ModeCounter:
+    """Bộ đếm tần suất giới hạn kích thước (Misra-Gries): giữ đúng phần tử phổ biến nhất nếu nó đủ lớn"""
+
+    def __init__(self, size=MODE_COUNTER_SIZE):
+        self.size = size
+        self.counts = {}
+
+    def update(self, values: pd.Series) -> None:
+        for value, count in values.value_counts(dropna=True).items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.size:
+            ordered = sorted(self.counts.values(), reverse=True)
+            cut = ordered[self.size]
+            self.counts = {v: c - cut for v, c in self.counts.items() if c > cut}
+
+    def mode(self):
+        if not self.counts:
+            return None
+        # Cùng tần suất -> lấy giá trị nhỏ nhất như Series.mode()
+        best = max(self.counts.values())
+        candidates = [v for v, c in self.counts.items() if c == best]
+        try:
+            return min(candidates)
+        except TypeError:
+            return candidates[0]
+
+
+class RowHashIndex:
+    """Tập hash 64-bit của các dòng đã gặp (mảng uint64 đã sắp xếp, 8 byte/dòng)"""
+
+    def __init__(self):
+        self.seen = np.empty(0, dtype=np.uint64)
+
+    @staticmethod
+    def hash_rows(df: pd.DataFrame, numeric_cols=()) -> np.ndarray:
+        # Số nguyên/số thực cùng giá trị phải cho cùng hash dù mỗi khúc suy ra dtype khác nhau
+        frame = pd.DataFrame(
+            {
+                c: (df[c].astype("float64") if c in numeric_cols else df[c].astype(str))
+                for c in df.columns
+            },
+            index=df.index,
+        )
+        return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+
+    def mark_duplicates(self, hashes: np.ndarray) -> np.ndarray:
+        """True cho dòng đã gặp (ở khúc trước hoặc trước đó trong khúc này); thêm các dòng mới vào tập"""
+        dup = np.isin(hashes, self.seen, assume_unique=False)
+        _, first_idx = np.unique(hashes, return_index=True)
+        within = np.ones(len(hashes), dtype=bool)
+        within[first_idx] = False
+        dup |= within
+        self.seen = np.union1d(self.seen, hashes[~dup])
+        return dup
+
+
+def header_match_counts(df: pd.DataFrame) -> np.ndarray:
+    """
+    Số ô trên mỗi dòng có giá trị (đã strip) trùng đúng tên cột của nó.
+    So sánh cả mảng 2-D các cột chữ với vector tên cột một lần; cột số/ngày giờ không thể trùng tên cột.
+    """
+    text_idx = [
+        i for i, c in enumerate(df.columns)
+        if not pd.api.types.is_numeric_dtype(df.iloc[:, i]) and not pd.api.types.is_datetime64_any_dtype(df.iloc[:, i])
+    ]
+    if not text_idx or not len(df):
+        return np.zeros(len(df), dtype=np.int64)
+
+    values = df.iloc[:, text_idx].to_numpy(dtype=object)
+    present = ~pd.isna(values)
+    text = np.strings.strip(values.astype(StringDType()))
+    header = np.strings.strip(np.array([str(df.columns[i]) for i in text_idx], dtype=StringDType()))
+    return ((text == header) & present).sum(axis=1)
+
+
+class _ColumnStats:
+    def __init__(self):
+        self.non_null = 0
+        self.numeric_parsed = 0
+        self.datetime_parsed = 0
+        # Định dạng ngày giờ đoán từ giá trị đầu tiên, dùng chung cho mọi khúc
+        self.datetime_format = None
+        self.native_numeric = True
+        self.sum = 0.0
+        # Tổng phần âm đã bị cắt về 0 ở lượt 1 (để tính lại mean nếu cuối cùng cột không được cắt)
+        self.clipped_sum = 0.0
+        self.count = 0
+        self.sketch = QuantileSketch()
+        self.text_modes = ModeCounter()
+        self.datetime_modes = ModeCounter()
+
+
+# === ENGINE ===
+
+class EmptyInputError(ValueError):
+    """Nguồn dữ liệu không có khúc nào (file rỗng / chỉ có header) -> không có gì để làm sạch"""
+
+
+class ChunkedCleaner:
+    """
+    Làm sạch hai lượt theo khúc. chunk_source là hàm không tham số trả về iterator DataFrame mới
+    mỗi lần gọi (vd. lambda: iter_file_chunks(path)), vì lượt 2 phải đọc lại từ đầu.
+    """
+
+    def __init__(self, rules=None, chunk_rows=DEFAULT_CHUNK_ROWS, log=None, progress=None):
+        self.rules = dict(VIEW_CLEAN_RULES if rules is None else rules)
+        self.chunk_rows = chunk_rows
+        self.log = log or (lambda msg: None)
+        self.progress = progress or (lambda pct, step: None)
+
+        self.columns = None
+        self.stats = {}
+        self.schema_version = None
+        self.inference_sample_size = 0
+        # Cột -> {"kind": numeric|datetime|text|unknown, "sample_ratio", "cached"}
+        self.decisions = {}
+        self.numeric_cols = set()
+        self.datetime_cols = set()
+        self.fill_values = {}
+        self.first_value = None
+        self.report = {}
+        self.sample_rows = []
+        # Số dòng còn lại sau _normalize_chunk (đã bỏ header lặp) -> mẫu số khi numeric_ratio_base="rows"
+        self.rows_kept = 0
+
+    # --- chuẩn hóa không phụ thuộc thống kê (giống nhau ở cả hai lượt) ---
+
+    def _normalize_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        rules = self.rules
+        chunk = chunk.copy()
+        chunk.columns = [str(c).strip() for c in chunk.columns]
+        na_tokens = set(rules["na_tokens"])
+
+        for c in chunk.columns:
+            col = chunk[c]
+            if col.dtype != object and not pd.api.types.is_string_dtype(col):
+                continue
+            if rules["strip_strings"]:
+                text = col.astype(str).str.strip()
+                chunk[c] = text.where(~text.isin(na_tokens) & col.notna(), np.nan)
+            else:
+                chunk[c] = col.where(~col.isin(na_tokens), np.nan)
+
+        if rules["drop_header_rows"] and len(chunk):
+            chunk = self._drop_header_rows(chunk)
+        return chunk
+
+    def _drop_header_rows(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        first_col = chunk.columns[0]
+        first_text = chunk[first_col].astype(str)
+        keep = ~first_text.str.contains("DANH SÁCH", case=False, na=False)
+
+        if self.first_value is None and len(chunk):
+            self.first_value = first_text.iloc[0].strip()
+        if "Tên Trạm" in chunk.columns:
+            repeated = chunk["Tên Trạm"].astype(str).str.strip().eq("Tên Trạm")
+            keep &= ~(repeated & first_text.str.strip().ne(self.first_value))
+
+        # Dòng header lặp: hơn nửa số cột có giá trị đúng bằng tên cột
+        keep &= ~(header_match_counts(chunk) > len(chunk.columns) * 0.5)
+        return chunk.loc[keep]
+
+    def _to_numeric(self, col: pd.Series) -> pd.Series:
+        if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            return col
+        if self.rules["comma_decimal"]:
+            col = col.astype(str).str.replace(",", ".", regex=False)
+        return pd.to_numeric(col, errors="coerce")
+
+    def _to_datetime(self, col: pd.Series, fmt=None) -> pd.Series:
+        if pd.api.types.is_datetime64_any_dtype(col):
+            return col
+        return pd.to_datetime(col, errors="coerce", dayfirst=self.rules["dayfirst"], format=fmt)
+
+    def _guess_datetime_format(self, col: pd.Series):
+        sample = col.dropna()
+        sample = sample[sample.map(lambda v: isinstance(v, str))].head(1)
+        if sample.empty:
+            return None
+        return guess_datetime_format(sample.iloc[0], dayfirst=self.rules["dayfirst"])
+
+    def _is_datetime_hint(self, name: str) -> bool:
+        lower = str(name).lower()
+        return any(k in lower for k in self.rules["datetime_hints"])
+
+    # --- suy luận kiểu trên mẫu ---
+
+    def _schema_version(self, columns) -> str:
+        keys = ("na_tokens", "strip_strings", "comma_decimal", "numeric_min_ratio", "numeric_ratio_base",
+                "datetime_hints", "datetime_min_ratio", "dayfirst")
+        payload = json.dumps([list(columns), {k: self.rules[k] for k in keys}], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _decide_column(self, col: pd.Series, name: str) -> dict:
+        """Quyết định kiểu của một cột trên mẫu; "unknown" nếu mẫu không có giá trị nào"""
+        rules = self.rules
+        non_null = int(col.notna().sum())
+        if not non_null:
+            return {"kind": "unknown", "sample_ratio": None}
+        if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            return {"kind": "numeric", "sample_ratio": 1.0}
+
+        base = len(col) if rules["numeric_ratio_base"] == "rows" else non_null
+        num_ratio = int(self._to_numeric(col).notna().sum()) / base
+        if num_ratio >= rules["numeric_min_ratio"]:
+            return {"kind": "numeric", "sample_ratio": round(num_ratio, 4)}
+
+        if self._is_datetime_hint(name):
+            fmt = self._guess_datetime_format(col)
+            parsed = int(self._to_datetime(col, fmt).notna().sum())
+            dt_ratio = parsed / len(col)
+            if parsed and dt_ratio >= rules["datetime_min_ratio"]:
+                return {"kind": "datetime", "sample_ratio": round(dt_ratio, 4), "datetime_format": fmt}
+
+        return {"kind": "text", "sample_ratio": round(num_ratio, 4), "mixed": num_ratio > 0}
+
+    def _infer_types(self, chunk: pd.DataFrame) -> None:
+        """
+        Quyết định kiểu từng cột trên mẫu <= INFER_SAMPLE_ROWS dòng (bước nhảy cố định) của khúc đầu,
+        hoặc lấy lại quyết định đã cache cho cùng phiên bản schema. Lượt 1 chỉ parse ngày giờ cho cột
+        ngày giờ/có tên gợi ý ngày giờ; số được đếm cho mọi cột chữ để _plan kiểm lại quyết định trên mẫu.
+        """
+        self.schema_version = self._schema_version(self.columns)
+        stride = max(1, -(-len(chunk) // INFER_SAMPLE_ROWS))
+        sample = chunk.iloc[::stride]
+        self.inference_sample_size = len(sample)
+
+        for c in self.columns:
+            key = (self.schema_version, c)
+            with _TYPE_DECISIONS_LOCK:
+                cached = _TYPE_DECISIONS.get(key)
+                if cached is not None:
+                    _TYPE_DECISIONS.move_to_end(key)
+            if cached is not None:
+                self.decisions[c] = {**cached, "cached": True}
+            elif c in sample.columns:
+                self.decisions[c] = {**self._decide_column(sample[c], c), "cached": False}
+            else:
+                self.decisions[c] = {"kind": "unknown", "sample_ratio": None, "cached": False}
+
+            if self.decisions[c].get("datetime_format"):
+                self.stats[c].datetime_format = self.decisions[c]["datetime_format"]
+
+        self.log(
+            f"[INFO] Suy luận kiểu trên mẫu {len(sample)} dòng (bước {stride}), schema {self.schema_version}: "
+            + ", ".join(f"{k}={sum(1 for d in self.decisions.values() if d['kind'] == k)}"
+                        for k in ("numeric", "datetime", "text", "unknown"))
+        )
+
+    def _remember_decision(self, column: str, decision: dict) -> None:
+        # Chỉ cache quyết định số/ngày giờ: _plan luôn kiểm lại chúng trên toàn bộ dữ liệu.
+        # Quyết định "text" không được kiểm lại nên phải suy luận trên mẫu của từng file.
+        if decision["kind"] not in ("numeric", "datetime"):
+            return
+        entry = {k: v for k, v in decision.items() if k not in ("cached", "status")}
+        with _TYPE_DECISIONS_LOCK:
+            _TYPE_DECISIONS[(self.schema_version, column)] = entry
+            _TYPE_DECISIONS.move_to_end((self.schema_version, column))
+            while len(_TYPE_DECISIONS) > TYPE_DECISION_CACHE_SIZE:
+                _TYPE_DECISIONS.popitem(last=False)
+
+    def _forget_decision(self, column: str) -> None:
+        with _TYPE_DECISIONS_LOCK:
+            _TYPE_DECISIONS.pop((self.schema_version, column), None)
+
+    # --- lượt 1 ---
+
+    def _scan(self, chunk_source) -> None:
+        rows_before = rows_kept = missing_before = duplicates_before = 0
+        raw_hashes = RowHashIndex()
+
+        for i, raw in enumerate(chunk_source(), start=1):
+            if self.columns is None:
+                self.columns = [str(c).strip() for c in raw.columns]
+                self.stats = {c: _ColumnStats() for c in self.columns}
+
+            raw_numeric = [c for c in raw.columns if pd.api.types.is_numeric_dtype(raw[c])]
+            duplicates_before += int(raw_hashes.mark_duplicates(RowHashIndex.hash_rows(raw, raw_numeric)).sum())
+
+            chunk = self._normalize_chunk(raw)
+            rows_before += len(raw)
+            rows_kept += len(chunk)
+            missing_before += int(chunk.isna().sum().sum())
+
+            if not self.decisions:
+                self._infer_types(chunk)
+
+            for c in self.columns:
+                if c not in chunk.columns:
+                    continue
+                col = chunk[c]
+                st = self.stats[c]
+                notna = col.notna()
+                st.non_null += int(notna.sum())
+                native = pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col)
+                if not native and notna.any():
+                    st.native_numeric = False
+
+                kind = self.decisions[c]["kind"]
+                # Cột "text" trên mẫu vẫn được đếm số: khúc đầu có thể toàn rác/trống, _plan kiểm lại trên toàn bộ
+                if kind in ("numeric", "unknown", "text"):
+                    numeric = self._to_numeric(col)
+                    valid = numeric.dropna()
+                    # Lượt 2 cắt số âm về 0 trước khi điền -> mean/median cũng tính trên giá trị đã cắt
+                    if self.rules["clip_negative"] and native:
+                        negative = valid < 0
+                        if negative.any():
+                            st.clipped_sum += float(valid[negative].sum())
+                            valid = valid.mask(negative, 0)
+                    st.numeric_parsed += len(valid)
+                    st.sum += float(valid.sum())
+                    st.count += len(valid)
+                    st.sketch.update(valid.to_numpy(dtype=float))
+                    if kind == "text" or not native:
+                        # Cột số lưu dạng chữ có thể bị hạ về kiểu chữ ở _plan -> cần mode của cả cột
+                        st.text_modes.update(col.dropna())
+
+                if kind == "datetime" or (kind in ("unknown", "text") and self._is_datetime_hint(c)):
+                    if st.datetime_format is None:
+                        st.datetime_format = self._guess_datetime_format(col)
+                    parsed = self._to_datetime(col, st.datetime_format)
+                    st.datetime_parsed += int(parsed.notna().sum())
+                    st.datetime_modes.update(parsed.dropna())
+                    if kind == "datetime" and not pd.api.types.is_datetime64_any_dtype(col):
+                        st.text_modes.update(col.dropna())
+
+            self.progress(min(45, 10 + 3 * i), f"Lượt 1: đã đọc {rows_before} dòng")
+
+        self.rows_kept = rows_kept
+        self.report.update(
+            {
+                "rows_before": rows_before,
+                "cols": len(self.columns or []),
+                "missing_before": missing_before,
+                "duplicates_before": duplicates_before,
+            }
+        )
+        self.log(f"[INFO] Shape ban đầu: rows={rows_before} cols={len(self.columns or [])}")
+        self.log(f"[INFO] Missing trước: {missing_before}")
+        self.log(f"[INFO] Duplicate trước: {duplicates_before}")
+
+    def _plan(self) -> None:
+        """Chọn kiểu dữ liệu và giá trị điền thiếu cho từng cột từ thống kê lượt 1"""
+        rules = self.rules
+        rows = self.rows_kept
+        dtype_log = {}
+
+        mixed, failed = [], []
+
+        for c, st in self.stats.items():
+            decision = self.decisions.get(c, {"kind": "unknown"})
+            kind = decision["kind"]
+            base = rows if rules["numeric_ratio_base"] == "rows" else st.non_null
+
+            # Quyết định trên mẫu (số hay chữ) đều được kiểm lại bằng ngưỡng trên toàn bộ dữ liệu
+            if kind in ("numeric", "unknown", "text"):
+                if st.native_numeric and st.numeric_parsed:
+                    self.numeric_cols.add(c)
+                elif (
+                    base
+                    and st.numeric_parsed >= rules["numeric_min_count"]
+                    and st.numeric_parsed / base >= rules["numeric_min_ratio"]
+                ):
+                    self.numeric_cols.add(c)
+                    dtype_log[c] = f"string → numeric (parsed {st.numeric_parsed / base:.0%})"
+                    if kind == "text":
+                        decision["status"] = "promoted"
+                        self.log(f"[INFO] Cột {c}: mẫu là chữ nhưng toàn bộ đọc được "
+                                 f"{st.numeric_parsed / base:.0%} số -> kiểu số")
+                elif kind == "numeric":
+                    failed.append(c)
+                    decision["status"] = "failed"
+                    self.log(f"[WARN] Cột {c}: mẫu là số nhưng toàn bộ chỉ đọc được "
+                             f"{st.numeric_parsed / base if base else 0:.0%} -> giữ kiểu chữ")
+
+            if kind == "datetime" or (
+                kind in ("unknown", "text") and c not in self.numeric_cols and self._is_datetime_hint(c)
+            ):
+                if (
+                    st.datetime_parsed
+                    and st.datetime_parsed >= rules["datetime_min_count"]
+                    and st.datetime_parsed / max(rows, 1) >= rules["datetime_min_ratio"]
+                ):
+                    self.datetime_cols.add(c)
+                    dtype_log[c] = "→ datetime"
+                    self.log(f"[INFO] Parsed datetime column: {c}")
+                    if kind == "text":
+                        decision["status"] = "promoted"
+                elif kind == "datetime":
+                    failed.append(c)
+                    decision["status"] = "failed"
+                    self.log(f"[WARN] Cột {c}: mẫu là ngày giờ nhưng toàn bộ chỉ đọc được {st.datetime_parsed} ô -> giữ kiểu chữ")
+
+            if kind == "text" and decision.get("mixed") and decision.get("status") != "promoted":
+                mixed.append(c)
+                decision["status"] = "mixed"
+            decision.setdefault("status", "ok")
+            if decision["status"] == "failed":
+                self._forget_decision(c)
+            else:
+                self._remember_decision(c, decision)
+
+            if c in self.numeric_cols:
+                if rules["numeric_fill"] == "mean":
+                    total = st.sum if st.native_numeric else st.sum + st.clipped_sum
+                    value = total / st.count if st.count else None
+                else:
+                    value = st.sketch.quantile(0.5)
+                self.fill_values[c] = 0 if value is None else value
+            elif c in self.datetime_cols:
+                if rules["datetime_fill"] == "mode":
+                    self.fill_values[c] = st.datetime_modes.mode()
+            else:
+                mode = st.text_modes.mode()
+                self.fill_values[c] = rules["text_fill_default"] if mode is None else mode
+
+        self.report["datatype_standardized"] = dtype_log
+        self.report["dtype_inference"] = {
+            "schema_version": self.schema_version,
+            "sample_rows": self.inference_sample_size,
+            "columns": {c: {k: v for k, v in d.items() if k != "mixed"} for c, d in self.decisions.items()},
+            "mixed": mixed,
+            "failed": failed,
+        }
+        if mixed:
+            self.log(f"[WARN] Cột lẫn số/chữ (giữ kiểu chữ): {', '.join(mixed)}")
+
+    # --- lượt 2 ---
+
+    def _apply(self, chunk_source, out_path: Path) -> None:
+        rules = self.rules
+        rows_before = self.report.get("rows_before", 0) or 1
+        seen = RowHashIndex()
+        negative_fixed = {}
+        rows_after = missing_after = duplicates_removed = 0
+        header_written = False
+
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = out_path.with_name(out_path.name + ".tmp")
+        processed = 0
+        try:
+            for raw in chunk_source():
+                processed += len(raw)
+                chunk = self._normalize_chunk(raw)
+                chunk = chunk.reindex(columns=self.columns)
+
+                for c in self.columns:
+                    if c in self.numeric_cols:
+                        col = self._to_numeric(chunk[c])
+                        if rules["clip_negative"] and self.stats[c].native_numeric:
+                            negative = col < 0
+                            if negative.any():
+                                negative_fixed[c] = negative_fixed.get(c, 0) + int(negative.sum())
+                                col = col.mask(negative, 0)
+                        chunk[c] = col
+                    elif c in self.datetime_cols:
+                        chunk[c] = self._to_datetime(chunk[c], self.stats[c].datetime_format)
+
+                    fill = self.fill_values.get(c)
+                    if fill is not None:
+                        chunk[c] = chunk[c].fillna(fill)
+
+                if rules["drop_duplicates"] and len(chunk):
+                    dup = seen.mark_duplicates(RowHashIndex.hash_rows(chunk, self.numeric_cols))
+                    duplicates_removed += int(dup.sum())
+                    chunk = chunk.loc[~dup]
+
+                rows_after += len(chunk)
+                missing_after += int(chunk.isna().sum().sum())
+                if len(self.sample_rows) < 5:
+                    self.sample_rows.extend(chunk.head(5 - len(self.sample_rows)).to_dict(orient="records"))
+
+                if len(chunk) or not header_written:
+                    chunk.to_csv(
+                        tmp_path,
+                        mode="a" if header_written else "w",
+                        header=not header_written,
+                        index=False,
+                        encoding="utf-8" if header_written else "utf-8-sig",
+                    )
+                    header_written = True
+
+                self.progress(50 + int(45 * min(1.0, processed / rows_before)), f"Lượt 2: đã ghi {rows_after} dòng")
+
+            if not header_written:
+                pd.DataFrame(columns=self.columns or []).to_csv(tmp_path, index=False, encoding="utf-8-sig")
+            os.replace(tmp_path, out_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        self.report.update(
+            {
+                "negative_fixed": negative_fixed,
+                "duplicates_removed": duplicates_removed,
+                "missing_after": missing_after,
+                "rows_after": rows_after,
+            }
+        )
+        self.log(f"[INFO] Removed duplicates: {duplicates_removed}")
+        self.log(f"[INFO] Missing sau: {missing_after}")
+        self.log(f"[INFO] Shape sau: rows={rows_after} cols={len(self.columns or [])}")
+
+    def clean(self, chunk_source, out_path) -> dict:
+        """Chạy hai lượt, ghi CSV ra out_path; trả về báo cáo"""
+        self.progress(10, "Lượt 1: thống kê theo khúc")
+        self._scan(chunk_source)
+        if self.columns is None:
+            raise EmptyInputError("Không có dữ liệu để làm sạch")
+
+        self._plan()
+        self.progress(50, "Lượt 2: chuẩn hoá + điền thiếu + ghi file")
+        self._apply(chunk_source, Path(out_path))
+        return self.report
+
+
+def clean_file_chunked(path, out_path, rules=None, chunk_rows=DEFAULT_CHUNK_ROWS, log=None, progress=None) -> dict:
+    cleaner = ChunkedCleaner(rules, chunk_rows=chunk_rows, log=log, progress=progress)
+    return cleaner.clean(lambda: iter_file_chunks(path, chunk_rows), out_path)
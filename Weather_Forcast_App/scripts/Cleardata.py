@@ -14,6 +14,32 @@ from django.conf import settings
 from datetime import datetime
 from sklearn.impute import SimpleImputer
 
+try:
+    from Weather_Forcast_App.scripts.Chunked_cleaner import (
+        REPORT_CLEAN_RULES,
+        ChunkedCleaner,
+        EmptyInputError,
+        iter_dataframe_chunks,
+        iter_file_chunks,
+    )
+except ImportError:
+    from Chunked_cleaner import (
+        REPORT_CLEAN_RULES,
+        ChunkedCleaner,
+        EmptyInputError,
+        iter_dataframe_chunks,
+        iter_file_chunks,
+    )
+
+try:
+    from Weather_Forcast_App.scripts.Profile_cache import get_profile_cache
+except ImportError:
+    from Profile_cache import get_profile_cache
+
+
+# Số nhóm dòng tối đa của heatmap missing
+HEATMAP_BINS = 500
+
 
 def clean_data_view(request):
     if request.method != 'POST':
@@ -40,221 +66,175 @@ def clean_data_view(request):
             return JsonResponse({'success': False, 'message': 'File không tồn tại'})
 
         ext = os.path.splitext(file_path)[1].lower()
-        if ext in [".xlsx", ".xls"]:
-            data_df = pd.read_excel(file_path, engine="openpyxl")
-        elif ext == ".csv":
-            try:
-                data_df = pd.read_csv(file_path, encoding="utf-8")
-            except UnicodeDecodeError:
-                data_df = pd.read_csv(file_path, encoding="utf-8-sig")
-        else:
+        if ext not in [".xlsx", ".xls", ".csv"]:
             return JsonResponse({'success': False, 'message': 'Chỉ hỗ trợ CSV/XLSX'}, status=400)
 
-
-        if action == 'analyze':
+        if action == 'clean':
+            # Làm sạch theo khúc, không nạp cả file vào bộ nhớ
             return JsonResponse({
                 'success': True,
-                'analysis': analyze_missing_data(data_df, filename)
+                **perform_cleaning_file(file_path, filename, file_type)
             })
 
-        if action == 'clean':
+        if action == 'analyze':
+            # Profile đã có cho đúng phiên bản file -> trả về ngay, không đọc lại file
+            cache = get_profile_cache()
+            analysis = (cache.get(file_path) or {}).get("analysis")
+            if analysis is not None and analysis.get("heatmap_bins") == HEATMAP_BINS:
+                return JsonResponse({
+                    'success': True,
+                    'analysis': {**analysis, "filename": filename},
+                    'cached': True
+                })
+
+            if ext in [".xlsx", ".xls"]:
+                data_df = pd.read_excel(file_path, engine="openpyxl")
+            else:
+                try:
+                    data_df = pd.read_csv(file_path, encoding="utf-8")
+                except UnicodeDecodeError:
+                    data_df = pd.read_csv(file_path, encoding="utf-8-sig")
+
+            analysis = analyze_missing_data(data_df, filename)
+            cache.update(file_path, rows=analysis["total_rows"], analysis=analysis)
             return JsonResponse({
                 'success': True,
-                **perform_cleaning(data_df, filename, file_type)
+                'analysis': analysis,
+                'cached': False
             })
 
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)})
+def binned_missing_fractions(missing, bins=HEATMAP_BINS):
+    """
+    Gom ma trận thiếu (rows x cols, bool) thành tối đa `bins` nhóm dòng liên tiếp
+    và tính tỉ lệ ô thiếu của từng nhóm/cột -> ma trận nhỏ (bins x cols)
+    """
+    rows = missing.shape[0]
+    bins = max(1, min(bins, rows))
+    if rows == 0:
+        return np.zeros((1, missing.shape[1])), 0
+    edges = np.linspace(0, rows, bins + 1).astype(np.int64)
+    counts = np.add.reduceat(missing, edges[:-1], axis=0, dtype=np.int64)
+    sizes = np.diff(edges)[:, None]
+    return counts / sizes, int(np.ceil(rows / bins))
+
+
+def render_missing_heatmap(fractions, columns, rows_per_bin, filename):
+    """Vẽ heatmap tỉ lệ thiếu theo nhóm dòng; kích thước ảnh không phụ thuộc số dòng"""
+    plt.figure(figsize=(12, 8))
+    sns.heatmap(
+        fractions,
+        cmap="Blues",
+        vmin=0,
+        vmax=1,
+        yticklabels=False,
+        xticklabels=columns if len(columns) <= 60 else False,
+        cbar_kws={"label": "Tỉ lệ ô thiếu"},
+    )
+    plt.title(f"Missing Data Heatmap - {filename}")
+    plt.ylabel(f"Nhóm dòng (~{rows_per_bin} dòng/nhóm)")
+    plt.tight_layout()
+
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png")
+    plt.close()
+    return base64.b64encode(buf.getvalue()).decode()
+
+
 def analyze_missing_data(data_df, filename):
     total_rows = len(data_df)
     total_columns = len(data_df.columns)
 
     data_df.replace(["N/A", "NA", "null", ""], np.nan, inplace=True)
 
+    missing = data_df.isna().to_numpy()
+    missing_counts = missing.sum(axis=0)
+
     missing_report = []
-    for col in data_df.columns:
-        missing = data_df[col].isna().sum()
+    for i, col in enumerate(data_df.columns):
         missing_report.append({
             "column": col,
-            "missing_count": int(missing),
-            "percent": round(missing / total_rows * 100, 2),
+            "missing_count": int(missing_counts[i]),
+            "percent": round(missing_counts[i] / total_rows * 100, 2),
             "dtype": str(data_df[col].dtype)
         })
 
-    plt.figure(figsize=(12, 8))
-    sns.heatmap(data_df.isna(), cmap="Blues", yticklabels=False)
-    plt.title(f"Missing Data Heatmap - {filename}")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
-    heatmap = base64.b64encode(buf.getvalue()).decode()
+    fractions, rows_per_bin = binned_missing_fractions(missing, HEATMAP_BINS)
+    heatmap = render_missing_heatmap(fractions, list(data_df.columns), rows_per_bin, filename)
 
     return {
         "filename": filename,
         "total_rows": total_rows,
         "total_columns": total_columns,
         "missing_report": missing_report,
+        "dtypes": {str(c): str(t) for c, t in data_df.dtypes.items()},
+        "heatmap_bins": HEATMAP_BINS,
         "heatmap_image": heatmap
     }
 def perform_cleaning(data_df, filename, file_type="merged"):
-    original_df = data_df.copy()
-    cleaning_log = {}
-    file_type = (file_type or "merged").lower()
+    """Làm sạch DataFrame đã nằm trong bộ nhớ (cắt thành khúc, không copy cả bảng)"""
+    return _run_cleaning(lambda: iter_dataframe_chunks(data_df), filename, file_type)
 
-    if file_type not in ("merged", "output"):
-        file_type = "merged"
 
-    # =========================
-    # Chuẩn hóa missing
-    # =========================
-    data_df.columns = [str(c).strip() for c in data_df.columns]
-    data_df.replace(["N/A", "NA", "null", "NULL", ""], np.nan, inplace=True)
+def perform_cleaning_file(file_path, filename, file_type="merged"):
+    """Làm sạch trực tiếp từ file CSV/XLSX theo từng khúc (bộ nhớ giới hạn cho file gộp lớn)"""
+    return _run_cleaning(lambda: iter_file_chunks(file_path), filename, file_type)
 
-    # =========================
-    # Loại dòng rác / header lặp - CHỈ LOẠI DÒNG THỰC SỰ LÀ HEADER
-    # =========================
-    first_col = data_df.columns[0]
-    
-    # CHỈ xóa dòng có chứa "DANH SÁCH" trong cột đầu tiên
-    data_df = data_df[~data_df[first_col].astype(str).str.contains("DANH SÁCH", case=False, na=False)]
-    
-    # Kiểm tra cột "Tên Trạm" nếu có
-    if "Tên Trạm" in data_df.columns:
-        # CHỈ xóa dòng mà toàn bộ giá trị đều giống header (dòng header lặp)
-        header_mask = data_df["Tên Trạm"].astype(str).str.strip().eq("Tên Trạm") & \
-                     data_df.iloc[:, 0].astype(str).str.strip().ne(data_df.iloc[:, 0].astype(str).str.strip().iloc[0] if len(data_df) > 0 else "")
-        data_df = data_df[~header_mask]
-
-    # CHỈ xóa dòng trùng lặp nếu tất cả giá trị đều giống nhau
-    duplicate_header_mask = pd.Series([False] * len(data_df))
-    for col in data_df.columns:
-        if data_df[col].dtype == object:
-            duplicate_header_mask = duplicate_header_mask | data_df[col].astype(str).str.strip().eq(col.strip())
-    
-    # Chỉ xóa nếu có nhiều hơn 50% cột có giá trị trùng với tên cột
-    col_threshold = len(data_df.columns) * 0.5
-    rows_to_drop = duplicate_header_mask.groupby(duplicate_header_mask.index).sum() > col_threshold
-    data_df = data_df[~rows_to_drop]
-
-    # Reset index sau khi xóa
-    data_df = data_df.reset_index(drop=True)
 
-    # =========================
-    # KIỂM TRA: In ra số dòng sau khi xử lý
-    # =========================
-    print(f"Số dòng sau khi loại header: {len(data_df)}")
-    if len(data_df) > 0:
-        print(f"Mẫu dữ liệu đầu tiên:\n{data_df.head(2)}")
-    else:
-        print("KHÔNG CÓ DỮ LIỆU SAU KHI XỬ LÝ!")
+def _run_cleaning(chunk_source, filename, file_type="merged"):
+    file_type = (file_type or "merged").lower()
+    if file_type not in ("merged", "output"):
+        file_type = "merged"
 
-    # =========================
-    # Xử lý dữ liệu âm
-    # =========================
-    negative_fixed = {}
-    for col in data_df.select_dtypes(include=[np.number]).columns:
-        count = (data_df[col] < 0).sum()
-        if count > 0:
-            data_df.loc[data_df[col] < 0, col] = 0
-            negative_fixed[col] = int(count)
-    cleaning_log["negative_fixed"] = negative_fixed
+    today = datetime.now().strftime("%Y%m%d_%H%M%S")
+    clean_filename = f"{os.path.splitext(filename)[0]}_cleaned_{today}.csv"
 
-    # =========================
-    # Chuẩn hóa kiểu dữ liệu
-    # =========================
-    dtype_log = {}
-    for col in data_df.columns:
-        if data_df[col].dtype == object:
-            # Kiểm tra nếu cột có thể chuyển thành số
-            try:
-                converted = pd.to_numeric(data_df[col], errors="coerce")
-                not_null_count = converted.notna().sum()
-                total_count = len(data_df[col])
-                ratio = not_null_count / total_count if total_count > 0 else 0
-                
-                if ratio >= 0.85 and not_null_count > 0:
-                    data_df[col] = converted
-                    dtype_log[col] = f"string → numeric (parsed {ratio:.0%})"
-            except:
-                pass
-
-        col_l = col.lower()
-        if ("date" in col_l) or ("time" in col_l) or ("thời gian" in col_l) or ("ngày" in col_l):
-            try:
-                data_df[col] = pd.to_datetime(data_df[col], errors="coerce")
-                dtype_log[col] = "→ datetime"
-            except:
-                pass
-
-    cleaning_log["datatype_standardized"] = dtype_log
+    base = os.path.join(settings.BASE_DIR, "Weather_Forcast_App", "cleaned_data")
+    if file_type == "merged":
+        output_dir = os.path.join(base, "Clean_Data_For_File_Merge")
+    else:
+        output_dir = os.path.join(base, "Clean_Data_For_File_Not_Merge")
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, clean_filename)
 
     # =========================
-    # Xử lý missing values - CHỈ áp dụng nếu có dữ liệu
+    # Lượt 1: chuẩn hóa missing, loại header lặp, thống kê từng cột
+    # Lượt 2: số âm -> 0, chuẩn hóa kiểu, điền thiếu (mean/mode), ghi CSV nối dần
     # =========================
-    if len(data_df) > 0:
-        num_cols = data_df.select_dtypes(include=[np.number]).columns.tolist()
-        dt_cols = data_df.select_dtypes(include=["datetime64[ns]"]).columns.tolist()
-        cat_cols = [c for c in data_df.columns if c not in num_cols and c not in dt_cols]
-
-        for c in num_cols:
-            if c in data_df.columns and len(data_df[c]) > 0:
-                m = data_df[c].mean()
-                data_df[c] = data_df[c].fillna(m if pd.notna(m) else 0)
-
-        for c in dt_cols:
-            if c in data_df.columns and len(data_df[c]) > 0:
-                mode = data_df[c].mode()
-                data_df[c] = data_df[c].fillna(mode.iloc[0] if not mode.empty else pd.NaT)
-
-        for c in cat_cols:
-            if c in data_df.columns and len(data_df[c]) > 0:
-                mode = data_df[c].mode()
-                data_df[c] = data_df[c].fillna(mode.iloc[0] if not mode.empty else "")
-    else:
-        # Nếu không có dữ liệu, trả về DataFrame rỗng
+    cleaner = ChunkedCleaner(REPORT_CLEAN_RULES, log=print)
+    try:
+        report = cleaner.clean(chunk_source, output_path)
+    except EmptyInputError:
         return {
             "message": "Không có dữ liệu sau khi làm sạch",
             "output_file": None,
             "report_file": None
         }
 
-    # =========================
-    # So sánh trước – sau
-    # =========================
-    original_missing_like = original_df.replace(["N/A","NA","null","NULL",""], np.nan)
-    comparison = {
-        "rows_before": len(original_df),
-        "rows_after": len(data_df),
-        "columns_before": original_df.shape[1],
-        "columns_after": data_df.shape[1],
-        "missing_before": int(original_missing_like.isna().sum().sum()),
-        "missing_after": int(data_df.isna().sum().sum()),
-    }
-
-    # =========================
-    # Xuất file CSV - CHỈ nếu có dữ liệu
-    # =========================
-    if len(data_df) == 0:
+    if report["rows_after"] == 0:
+        os.remove(output_path)
         return {
             "message": "Không có dữ liệu để xuất file",
             "output_file": None,
             "report_file": None
         }
 
-    today = datetime.now().strftime("%Y%m%d_%H%M%S")
-    clean_filename = f"{os.path.splitext(filename)[0]}_cleaned_{today}.csv"
-
-    base = os.path.join(settings.BASE_DIR, "Weather_Forcast_App", "cleaned_data")
-    if file_type == "merged":
-        output_dir = os.path.join(base, "Clean_Data_For_File_Merge")
-    else:
-        output_dir = os.path.join(base, "Clean_Data_For_File_Not_Merge")
-    os.makedirs(output_dir, exist_ok=True)
-
-    output_path = os.path.join(output_dir, clean_filename)
-    data_df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    # =========================
+    # So sánh trước – sau
+    # =========================
+    comparison = {
+        "rows_before": report["rows_before"],
+        "rows_after": report["rows_after"],
+        "columns_before": report["cols"],
+        "columns_after": report["cols"],
+        "missing_before": report["missing_before"],
+        "missing_after": report["missing_after"],
+    }
+    cleaning_log = {
+        "negative_fixed": report["negative_fixed"],
+        "datatype_standardized": report["datatype_standardized"],
+    }
 
     # =========================
     # Xuất báo cáo JSON
@@ -264,12 +244,12 @@ def perform_cleaning(data_df, filename, file_type="merged"):
         json.dump({
             "comparison": comparison,
             "cleaning_log": cleaning_log,
-            "sample_data": data_df.head(5).to_dict(orient="records") if len(data_df) > 0 else []
-        }, f, ensure_ascii=False, indent=4)
+            "sample_data": cleaner.sample_rows
+        }, f, ensure_ascii=False, indent=4, default=str)
 
     return {
         "message": "Làm sạch dữ liệu hoàn tất",
         "output_file": clean_filename,
         "report_file": os.path.basename(report_path),
-        "rows_remaining": len(data_df)
-    }
\ No newline at end of file
+        "rows_remaining": report["rows_after"]
+    }
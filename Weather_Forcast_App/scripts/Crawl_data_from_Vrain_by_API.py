@@ -2,6 +2,7 @@ import requests
 import pandas as pd
 import time
 import json
+import hashlib
 from pathlib import Path
 from datetime import datetime, timedelta
 import logging
@@ -25,6 +26,7 @@ logging.basicConfig(
 
 BASE_DIR = Path(__file__).resolve().parent
 OUTPUT_DIR = "/media/voanhnhat/SDD_OUTSIDE5/PROJECT_WEATHER_FORECAST/Weather_Forcast_App/output"
+HTTP_CACHE_PATH = BASE_DIR.parent / "runtime" / "vrain_http_cache.json"
 
 class SQLiteManager:
     """Quản lý kết nối và thao tác với SQLite database"""
@@ -155,7 +157,6 @@ class SQLiteManager:
                     
                     created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     
-                    FOREIGN KEY (province_id) REFERENCES provinces (province_id),
                     FOREIGN KEY (station_id) REFERENCES stations (station_id)
                 )
             """
@@ -188,30 +189,54 @@ class SQLiteManager:
             """
             )
 
-            # Bảng tổng hợp theo ngày
+            # Bảng tổng hợp theo ngày (rollup theo tỉnh + ngày, cập nhật sau mỗi lần ghi)
+            # source = 'weather' (từ weather_data) hoặc 'vrain' (từ vrain_rainfall_data)
             self.cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS daily_summary (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT,
+                    date TEXT NOT NULL,
+                    source TEXT NOT NULL,
                     province_id TEXT,
-                    province_name TEXT,
+                    province_name TEXT NOT NULL,
                     station_count INTEGER,
+                    data_points INTEGER,
+                    
+                    -- Lượng mưa (rain_current với weather, rainfall_value với vrain)
+                    total_rainfall REAL,
+                    avg_rainfall REAL,
+                    max_rainfall REAL,
+                    min_rainfall REAL,
+                    total_rainfall_24h REAL,
+                    
                     avg_temperature REAL,
                     max_temperature REAL,
                     min_temperature REAL,
-                    total_rainfall REAL,
                     avg_humidity REAL,
                     avg_pressure REAL,
-                    data_points INTEGER,
                     
                     created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     
+                    UNIQUE (source, province_name, date),
                     FOREIGN KEY (province_id) REFERENCES provinces (province_id)
                 )
             """
             )
 
+            # Index phục vụ cập nhật rollup theo (tỉnh, ngày)
+            self.cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_weather_data_province_time
+                ON weather_data (province, timestamp)
+            """
+            )
+            self.cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_vrain_data_province_time
+                ON vrain_rainfall_data (province_name, measurement_time)
+            """
+            )
+
             self.conn.commit()
             logging.info("✅ Đã tạo/xác nhận các bảng trong database")
 
@@ -284,6 +309,7 @@ class SQLiteManager:
         """Chèn dữ liệu thời tiết vào database"""
         try:
             inserted_count = 0
+            affected_keys = set()
             for data in weather_data:
                 self.cursor.execute(
                     """
@@ -299,7 +325,7 @@ class SQLiteManager:
                         cloud_cover_current, cloud_cover_max, cloud_cover_min, cloud_cover_avg,
                         visibility_current, visibility_max, visibility_min, visibility_avg,
                         thunder_probability, error_reason
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                     (
                         data.get("station_id", ""),
@@ -348,9 +374,12 @@ class SQLiteManager:
                     ),
                 )
                 inserted_count += 1
+                affected_keys.add((data["province"], str(data["timestamp"])[:10]))
 
             self.conn.commit()
             logging.info(f"✅ Đã chèn {inserted_count} bản ghi thời tiết vào database")
+
+            self.refresh_daily_summary("weather", affected_keys)
             return inserted_count
 
         except Exception as e:
@@ -361,6 +390,7 @@ class SQLiteManager:
         """Chèn dữ liệu từ Vrain vào database"""
         try:
             inserted_count = 0
+            affected_keys = set()
             for data in vrain_data:
                 self.cursor.execute(
                     """
@@ -391,17 +421,113 @@ class SQLiteManager:
                     ),
                 )
                 inserted_count += 1
+                affected_keys.add(
+                    (
+                        data.get("province_name", ""),
+                        str(data.get("measurement_time", ""))[:10],
+                    )
+                )
 
             self.conn.commit()
             logging.info(
                 f"✅ Đã chèn {inserted_count} bản ghi dữ liệu Vrain vào database"
             )
+
+            self.refresh_daily_summary("vrain", affected_keys)
             return inserted_count
 
         except Exception as e:
             logging.error(f"❌ Lỗi chèn dữ liệu Vrain: {e}")
             return 0
 
+    def refresh_daily_summary(self, source, keys=None):
+        """
+        Cập nhật bảng daily_summary cho các cặp (tỉnh, ngày) bị ảnh hưởng.
+        Chỉ tổng hợp lại các dòng thuộc những cặp này (dùng index theo tỉnh + thời gian),
+        nên chi phí tỉ lệ với dữ liệu mới chứ không phải toàn bộ lịch sử.
+        keys=None: dựng lại toàn bộ rollup từ bảng gốc.
+        """
+        if source == "weather":
+            raw_table, province_col, time_col = "weather_data", "province", "timestamp"
+            select_sql = """
+                SELECT ?, (SELECT province_id FROM provinces WHERE province_name = ?),
+                       province, 'weather',
+                       COUNT(DISTINCT station_name), COUNT(*),
+                       SUM(rain_current), AVG(rain_current), MAX(rain_current), MIN(rain_current),
+                       SUM(rain_total),
+                       AVG(temperature_current), MAX(temperature_max), MIN(temperature_min),
+                       AVG(humidity_current), AVG(pressure_current)
+                FROM weather_data
+                WHERE province = ? AND timestamp >= ? AND timestamp < date(?, '+1 day')
+                GROUP BY province
+            """
+        elif source == "vrain":
+            raw_table, province_col, time_col = (
+                "vrain_rainfall_data",
+                "province_name",
+                "measurement_time",
+            )
+            select_sql = """
+                SELECT ?, (SELECT province_id FROM provinces WHERE province_name = ?),
+                       province_name, 'vrain',
+                       COUNT(DISTINCT station_name), COUNT(*),
+                       SUM(rainfall_value), AVG(rainfall_value),
+                       MAX(rainfall_value), MIN(rainfall_value),
+                       NULL, NULL, NULL, NULL, NULL, NULL
+                FROM vrain_rainfall_data
+                WHERE province_name = ? AND measurement_time >= ?
+                      AND measurement_time < date(?, '+1 day')
+                      AND rainfall_unit = 'mm'
+                GROUP BY province_name
+            """
+        else:
+            logging.error(f"❌ Nguồn rollup không hợp lệ: {source}")
+            return 0
+
+        try:
+            if keys is None:
+                self.cursor.execute(
+                    f"SELECT DISTINCT {province_col}, substr({time_col}, 1, 10) FROM {raw_table}"
+                )
+                keys = self.cursor.fetchall()
+
+            refreshed = 0
+            for province_name, day in keys:
+                if not province_name or not day:
+                    continue
+
+                self.cursor.execute(
+                    """
+                    DELETE FROM daily_summary
+                    WHERE source = ? AND province_name = ? AND date = ?
+                """,
+                    (source, province_name, day),
+                )
+                self.cursor.execute(
+                    f"""
+                    INSERT INTO daily_summary (
+                        date, province_id, province_name, source,
+                        station_count, data_points,
+                        total_rainfall, avg_rainfall, max_rainfall, min_rainfall,
+                        total_rainfall_24h,
+                        avg_temperature, max_temperature, min_temperature,
+                        avg_humidity, avg_pressure
+                    ) {select_sql}
+                """,
+                    (day, province_name, province_name, day, day),
+                )
+                refreshed += 1
+
+            self.conn.commit()
+            logging.info(
+                f"✅ Đã cập nhật daily_summary ({source}) cho {refreshed} cặp tỉnh/ngày"
+            )
+            return refreshed
+
+        except Exception as e:
+            logging.error(f"❌ Lỗi cập nhật daily_summary ({source}): {e}")
+            return 0
+
     def get_all_provinces(self):
         """Lấy danh sách tất cả tỉnh thành"""
         try:
@@ -445,41 +571,29 @@ class SQLiteManager:
             return []
 
     def get_province_rainfall_summary(self, date=None):
-        """Lấy tổng hợp lượng mưa theo tỉnh"""
+        """Lấy tổng hợp lượng mưa theo tỉnh (đọc từ rollup daily_summary)"""
         try:
             if date:
-                self.cursor.execute(
-                    """
-                    SELECT province_name, 
-                           COUNT(*) as data_points,
-                           AVG(rainfall_1h) as avg_rainfall_1h,
-                           AVG(rainfall_24h) as avg_rainfall_24h,
-                           SUM(rainfall_24h) as total_rainfall_24h,
-                           MAX(rainfall_1h) as max_rainfall_1h,
-                           MIN(rainfall_1h) as min_rainfall_1h
-                    FROM weather_data 
-                    WHERE date(timestamp) = ?
-                    GROUP BY province_name
-                    ORDER BY total_rainfall_24h DESC
-                """,
-                    (date,),
-                )
+                date_filter, params = "date = ?", (date,)
             else:
-                self.cursor.execute(
-                    """
-                    SELECT province_name, 
-                           COUNT(*) as data_points,
-                           AVG(rainfall_1h) as avg_rainfall_1h,
-                           AVG(rainfall_24h) as avg_rainfall_24h,
-                           SUM(rainfall_24h) as total_rainfall_24h,
-                           MAX(rainfall_1h) as max_rainfall_1h,
-                           MIN(rainfall_1h) as min_rainfall_1h
-                    FROM weather_data 
-                    WHERE timestamp >= datetime('now', '-1 day')
-                    GROUP BY province_name
-                    ORDER BY total_rainfall_24h DESC
-                """
-                )
+                date_filter, params = "date >= date('now', '-1 day')", ()
+
+            self.cursor.execute(
+                f"""
+                SELECT province_name, 
+                       SUM(data_points) as data_points,
+                       SUM(total_rainfall) / SUM(data_points) as avg_rainfall_1h,
+                       SUM(total_rainfall_24h) / SUM(data_points) as avg_rainfall_24h,
+                       SUM(total_rainfall_24h) as total_rainfall_24h,
+                       MAX(max_rainfall) as max_rainfall_1h,
+                       MIN(min_rainfall) as min_rainfall_1h
+                FROM daily_summary 
+                WHERE source = 'weather' AND {date_filter}
+                GROUP BY province_name
+                ORDER BY total_rainfall_24h DESC
+            """,
+                params,
+            )
 
             results = self.cursor.fetchall()
             columns = [
@@ -503,18 +617,18 @@ class SQLiteManager:
             return []
 
     def get_vrain_province_summary(self):
-        """Lấy tổng hợp dữ liệu Vrain theo tỉnh"""
+        """Lấy tổng hợp dữ liệu Vrain theo tỉnh (đọc từ rollup daily_summary)"""
         try:
             self.cursor.execute(
                 """
                 SELECT province_name, 
-                       COUNT(*) as station_count,
-                       AVG(rainfall_value) as avg_rainfall,
-                       MAX(rainfall_value) as max_rainfall,
-                       MIN(rainfall_value) as min_rainfall,
-                       SUM(rainfall_value) as total_rainfall
-                FROM vrain_rainfall_data 
-                WHERE rainfall_unit = 'mm'
+                       SUM(data_points) as station_count,
+                       SUM(total_rainfall) / SUM(data_points) as avg_rainfall,
+                       MAX(max_rainfall) as max_rainfall,
+                       MIN(min_rainfall) as min_rainfall,
+                       SUM(total_rainfall) as total_rainfall
+                FROM daily_summary 
+                WHERE source = 'vrain'
                 GROUP BY province_name
                 ORDER BY avg_rainfall DESC
             """
@@ -565,6 +679,13 @@ class VrainScraper:
 
         self.base_url = "https://www.vrain.vn"
 
+        # Cache cho request có điều kiện: {url: {etag, last_modified, content_hash, stations}}
+        self.http_cache_path = Path(HTTP_CACHE_PATH)
+        self.http_cache = self._load_http_cache()
+        self._pending_cache = {}
+        self.fetch_stats = {"fetched": 0, "not_modified": 0, "unchanged_hash": 0}
+        self.stations_not_modified = False
+
         # Danh sách các endpoint API thực tế có thể có
         self.api_endpoints = [
             f"{self.base_url}/api/rainfall/current",
@@ -598,6 +719,92 @@ class VrainScraper:
             "Bắc Từ Liêm",
         ]
 
+    def _load_http_cache(self) -> Dict:
+        """Đọc cache ETag/Last-Modified/hash của các URL đã crawl"""
+        try:
+            if self.http_cache_path.exists():
+                with self.http_cache_path.open("r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            logging.warning(f"⚠️ Không đọc được HTTP cache {self.http_cache_path}: {e}")
+        return {}
+
+    def _save_http_cache(self):
+        """Ghi cache ra file (ghi file tạm rồi thay thế để không hỏng khi bị ngắt)"""
+        try:
+            self.http_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.http_cache_path.with_suffix(".tmp")
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(self.http_cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.http_cache_path)
+        except Exception as e:
+            logging.warning(f"⚠️ Không ghi được HTTP cache {self.http_cache_path}: {e}")
+
+    def _conditional_get(self, url: str, timeout: int, force: bool = False):
+        """
+        GET có điều kiện: gửi If-None-Match/If-Modified-Since theo lần crawl trước.
+        Trả về (response, changed). changed=False khi server trả 304
+        hoặc nội dung có cùng hash với lần trước. force=True -> GET thường, luôn lấy nội dung.
+        """
+        entry = {} if force else self.http_cache.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.session.get(url, timeout=timeout, headers=headers)
+
+        if response.status_code == 304:
+            self.fetch_stats["not_modified"] += 1
+            return response, False
+
+        if response.status_code != 200:
+            return response, True
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if entry.get("content_hash") == content_hash:
+            self.fetch_stats["unchanged_hash"] += 1
+            return response, False
+
+        self.fetch_stats["fetched"] += 1
+        self._pending_cache[url] = {
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "content_hash": content_hash,
+            "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        return response, True
+
+    def _remember_response(self, url: str, stations: Optional[List[Dict]] = None):
+        """Ghi nhận URL (kèm danh sách trạm đã parse) vào cache sau khi nội dung đã được xử lý thành công"""
+        entry = self._pending_cache.pop(url, None)
+        if entry:
+            if stations is not None:
+                entry["stations"] = stations
+            self.http_cache[url] = entry
+            self._save_http_cache()
+
+    def _fetch_stations(self, url: str, timeout: int, parse) -> List[Dict]:
+        """
+        Lấy danh sách trạm từ url bằng GET có điều kiện; parse(response) -> list trạm.
+        304/cùng hash -> dùng lại danh sách trạm đã lưu ở lần crawl trước thay vì parse lại.
+        """
+        response, changed = self._conditional_get(url, timeout=timeout)
+        if not changed:
+            cached = self.http_cache.get(url, {}).get("stations")
+            if cached:
+                logging.info(f"⏭️ {url} không thay đổi, dùng lại {len(cached)} trạm đã lưu")
+                self.stations_not_modified = True
+                return cached
+            # Cache cũ chưa lưu danh sách trạm -> tải lại đầy đủ một lần
+            response, _ = self._conditional_get(url, timeout=timeout, force=True)
+
+        stations = parse(response) if response.status_code == 200 else []
+        if stations:
+            self._remember_response(url, stations)
+        return stations
+
     def _create_province_mapping(self):
         """Tạo mapping tỉnh thành từ dữ liệu thực tế"""
         return {
@@ -1110,6 +1317,13 @@ class VrainScraper:
     def crawl_all_stations(self) -> List[Dict]:
         """Crawl danh sách tất cả các trạm từ vrain.vn"""
         all_stations = []
+        self.stations_not_modified = False
+
+        def parse_json(response):
+            # Xử lý JSON data cho stations
+            if "application/json" not in response.headers.get("content-type", ""):
+                return []
+            return self._process_station_json(response.json())
 
         try:
             logging.info("🏢 Bắt đầu thu thập danh sách trạm từ vrain.vn")
@@ -1118,28 +1332,23 @@ class VrainScraper:
             for endpoint in self.api_endpoints:
                 try:
                     if "station" in endpoint.lower():
-                        response = self.session.get(endpoint, timeout=10)
-                        if response.status_code == 200:
-                            content_type = response.headers.get("content-type", "")
-                            if "application/json" in content_type:
-                                json_data = response.json()
-                                # Xử lý JSON data cho stations
-                                stations = self._process_station_json(json_data)
-                                if stations:
-                                    all_stations.extend(stations)
-                                    logging.info(
-                                        f"✅ Tìm thấy {len(stations)} trạm từ API: {endpoint}"
-                                    )
-                                    break
+                        stations = self._fetch_stations(endpoint, 10, parse_json)
+                        if stations:
+                            all_stations.extend(stations)
+                            logging.info(
+                                f"✅ Tìm thấy {len(stations)} trạm từ API: {endpoint}"
+                            )
+                            break
                 except:
                     continue
 
             # Nếu không có từ API, thử từ HTML
             if not all_stations:
-                response = self.session.get(self.base_url, timeout=15)
-                if response.status_code == 200:
-                    stations = self.extract_stations_from_html(response.text)
-                    all_stations.extend(stations)
+                all_stations.extend(
+                    self._fetch_stations(
+                        self.base_url, 15, lambda response: self.extract_stations_from_html(response.text)
+                    )
+                )
 
             # Nếu vẫn không có, tạo dữ liệu mẫu
             if not all_stations:
@@ -1328,15 +1537,16 @@ class VrainScraper:
 
         return enriched
 
-    def crawl_real_vrain_data(self) -> List[Dict]:
+    def crawl_real_vrain_data(self, stations: Optional[List[Dict]] = None) -> List[Dict]:
         """Crawl dữ liệu THỰC TẾ từ vrain.vn với tất cả trạm"""
         all_data = []
 
         try:
             logging.info("🌧️ Bắt đầu thu thập dữ liệu THỰC TẾ từ vrain.vn")
 
-            # Thu thập danh sách trạm trước
-            stations = self.crawl_all_stations()
+            # Thu thập danh sách trạm trước (nếu chưa được truyền vào)
+            if stations is None:
+                stations = self.crawl_all_stations()
 
             # Thu thập dữ liệu cho từng trạm
             for station in stations:
@@ -2144,8 +2354,14 @@ class VietnamWeatherCrawler:
             # Thu thập danh sách trạm
             stations_data = self.vrain_scraper.crawl_all_stations()
 
-            # Thu thập dữ liệu mưa cho tất cả trạm
-            vrain_data = self.vrain_scraper.crawl_real_vrain_data()
+            # Danh sách trạm chưa đổi -> chỉ bỏ qua bước tải/parse lại trạm, vẫn lấy dữ liệu từng trạm
+            if self.vrain_scraper.stations_not_modified:
+                logging.info(
+                    f"⏭️ Danh sách trạm Vrain chưa thay đổi, dùng lại bản đã lưu ({self.vrain_scraper.fetch_stats})"
+                )
+
+            # Thu thập dữ liệu mưa cho tất cả trạm đã lấy ở trên
+            vrain_data = self.vrain_scraper.crawl_real_vrain_data(stations_data)
 
             # Kết hợp dữ liệu trạm với dữ liệu mưa
             combined_data = []
@@ -2286,7 +2502,59 @@ class VietnamWeatherCrawler:
 
         return weather_data_list
 
-    def save_comprehensive_data(self, data):
+    def build_province_statistics(self, combined_data):
+        """
+        Tổng hợp thống kê theo tỉnh bằng một lần groupby:
+        số trạm, lượng mưa TB/max/min, trạng thái và thứ hạng.
+        Kết quả dùng chung cho báo cáo log và sheet "Thống Kê Tỉnh".
+        """
+        df = pd.DataFrame.from_records(
+            combined_data, columns=["province_name", "province", "rainfall_value"]
+        )
+        df["province_name"] = df["province_name"].fillna(df["province"]).fillna("")
+        df["rainfall_value"] = pd.to_numeric(
+            df["rainfall_value"], errors="coerce"
+        ).fillna(0)
+
+        stats = (
+            df.groupby("province_name", sort=True)["rainfall_value"]
+            .agg(
+                station_count="size",
+                avg_rainfall="mean",
+                max_rainfall="max",
+                min_rainfall="min",
+            )
+            .reset_index()
+        )
+
+        region_map = {
+            province["province_name"]: province.get("region", "Khác")
+            for province in self.provinces_data
+        }
+        stats["region"] = stats["province_name"].map(region_map).fillna("")
+
+        # Trạng thái theo lượng mưa trung bình
+        avg = stats["avg_rainfall"].to_numpy()
+        conditions = [avg == 0, avg < 1, avg < 5, avg < 10]
+        stats["status"] = np.select(
+            conditions, ["Không mưa", "Mưa nhỏ", "Mưa vừa", "Mưa to"], "Mưa rất to"
+        )
+        stats["status_color"] = np.select(
+            conditions, ["FFFFFF", "C6EFCE", "FFEB9C", "FFC7CE"], "FF9999"
+        )
+        stats["status_icon"] = np.select([avg == 0, avg < 5], ["☀️", "🌧️"], "⛈️")
+
+        # Thứ hạng (1 = cao nhất), hòa thì theo thứ tự tên tỉnh
+        stats["rank_by_stations"] = (
+            stats["station_count"].rank(method="first", ascending=False).astype(int)
+        )
+        stats["rank_by_rainfall"] = (
+            stats["avg_rainfall"].rank(method="first", ascending=False).astype(int)
+        )
+
+        return stats
+
+    def save_comprehensive_data(self, data, province_stats=None):
         """Lưu dữ liệu toàn diện vào database và Excel"""
         try:
             self.db_manager.connect()
@@ -2347,7 +2615,9 @@ class VietnamWeatherCrawler:
             )
 
             # Lưu ra Excel
-            excel_file = self.save_comprehensive_excel(data["combined"])
+            excel_file = self.save_comprehensive_excel(
+                data["combined"], province_stats=province_stats
+            )
 
             return excel_file
 
@@ -2355,7 +2625,7 @@ class VietnamWeatherCrawler:
             logging.error(f"❌ Lỗi lưu dữ liệu toàn diện: {e}")
             return None
 
-    def save_comprehensive_excel(self, combined_data, output_dir=None):
+    def save_comprehensive_excel(self, combined_data, output_dir=None, province_stats=None):
         """Lưu dữ liệu toàn diện ra file Excel"""
         if output_dir is None:
             output_dir = str(OUTPUT_DIR)
@@ -2467,71 +2737,22 @@ class VietnamWeatherCrawler:
             )
             cell.alignment = Alignment(horizontal="center", vertical="center")
 
-        # Tính toán thống kê theo tỉnh
-        province_stats = {}
-        for data in combined_data:
-            province_name = data.get("province_name", "")
-            if province_name not in province_stats:
-                province_stats[province_name] = {
-                    "stations": [],
-                    "rainfall_values": [],
-                    "region": "",
-                }
-
-            province_stats[province_name]["stations"].append(
-                data.get("station_name", "")
-            )
-            province_stats[province_name]["rainfall_values"].append(
-                data.get("rainfall_value", 0)
-            )
-
-            # Tìm vùng cho tỉnh
-            if not province_stats[province_name]["region"]:
-                for province in self.provinces_data:
-                    if province["province_name"] == province_name:
-                        province_stats[province_name]["region"] = province.get(
-                            "region", "Khác"
-                        )
-                        break
+        # Thống kê theo tỉnh (dùng lại kết quả đã tính nếu có)
+        if province_stats is None:
+            province_stats = self.build_province_statistics(combined_data)
 
         # Dữ liệu thống kê
         row_idx = 4
-        for idx, (province_name, stats) in enumerate(
-            sorted(province_stats.items()), start=1
-        ):
-            rainfall_values = stats["rainfall_values"]
-            avg_rainfall = (
-                sum(rainfall_values) / len(rainfall_values) if rainfall_values else 0
-            )
-            max_rainfall = max(rainfall_values) if rainfall_values else 0
-            min_rainfall = min(rainfall_values) if rainfall_values else 0
-
-            # Xác định trạng thái
-            if avg_rainfall == 0:
-                status = "Không mưa"
-                status_color = "FFFFFF"
-            elif avg_rainfall < 1:
-                status = "Mưa nhỏ"
-                status_color = "C6EFCE"
-            elif avg_rainfall < 5:
-                status = "Mưa vừa"
-                status_color = "FFEB9C"
-            elif avg_rainfall < 10:
-                status = "Mưa to"
-                status_color = "FFC7CE"
-            else:
-                status = "Mưa rất to"
-                status_color = "FF9999"
-
+        for idx, stats in enumerate(province_stats.itertuples(index=False), start=1):
             row_data = [
                 idx,
-                province_name,
-                stats["region"],
-                len(stats["stations"]),
-                round(avg_rainfall, 2),
-                round(max_rainfall, 2),
-                round(min_rainfall, 2),
-                status,
+                stats.province_name,
+                stats.region,
+                int(stats.station_count),
+                round(float(stats.avg_rainfall), 2),
+                round(float(stats.max_rainfall), 2),
+                round(float(stats.min_rainfall), 2),
+                stats.status,
             ]
 
             for col_idx, value in enumerate(row_data, start=1):
@@ -2541,8 +2762,8 @@ class VietnamWeatherCrawler:
                 # Đánh dấu màu cho trạng thái
                 if col_idx == 8:
                     cell.fill = PatternFill(
-                        start_color=status_color,
-                        end_color=status_color,
+                        start_color=stats.status_color,
+                        end_color=stats.status_color,
                         fill_type="solid",
                     )
 
@@ -2598,33 +2819,22 @@ def main_comprehensive():
         weather_data = result["weather"]
 
         if combined_data:
+            # Thống kê theo tỉnh (tính một lần, dùng cho cả Excel và báo cáo)
+            province_stats = crawler.build_province_statistics(combined_data)
+
             # Lưu vào database và Excel
-            excel_file = crawler.save_comprehensive_data(result)
+            excel_file = crawler.save_comprehensive_data(
+                result, province_stats=province_stats
+            )
 
             # Hiển thị báo cáo chi tiết
             logging.info("=" * 80)
             logging.info("📊 BÁO CÁO DỮ LIỆU TOÀN DIỆN")
             logging.info("=" * 80)
 
-            # Thống kê theo tỉnh
-            province_summary = {}
-            for data in combined_data:
-                province_name = data.get("province", data.get("province_name", ""))
-                if province_name not in province_summary:
-                    province_summary[province_name] = {
-                        "stations": [],
-                        "rainfall_values": [],
-                    }
-                province_summary[province_name]["stations"].append(
-                    data.get("station_name", "")
-                )
-                province_summary[province_name]["rainfall_values"].append(
-                    data.get("rainfall_value", 0)
-                )
-
             # Hiển thị thống kê cơ bản
             total_stations = len(combined_data)
-            total_provinces = len(province_summary)
+            total_provinces = len(province_stats)
 
             logging.info(f"📈 TỔNG QUAN:")
             logging.info(f"   📊 Tổng số trạm: {total_stations}")
@@ -2633,52 +2843,22 @@ def main_comprehensive():
 
             # Hiển thị chi tiết theo tỉnh
             logging.info("🏙️ CHI TIẾT THEO TỈNH:")
-            for province_name, stats in sorted(province_summary.items()):
-                station_count = len(stats["stations"])
-                rainfall_values = stats["rainfall_values"]
-                avg_rainfall = (
-                    sum(rainfall_values) / len(rainfall_values)
-                    if rainfall_values
-                    else 0
-                )
-                max_rainfall = max(rainfall_values) if rainfall_values else 0
-
-                status = "☀️" if avg_rainfall == 0 else "🌧️" if avg_rainfall < 5 else "⛈️"
-
+            for stats in province_stats.itertuples(index=False):
                 logging.info(
-                    f"   {status} {province_name}: {station_count} trạm, {avg_rainfall:.1f} mm TB"
+                    f"   {stats.status_icon} {stats.province_name}: {stats.station_count} trạm, {stats.avg_rainfall:.1f} mm TB"
                 )
 
             # Top 5 tỉnh có nhiều trạm nhất
-            sorted_by_stations = sorted(
-                province_summary.items(),
-                key=lambda x: len(x[1]["stations"]),
-                reverse=True,
-            )[:5]
-
             logging.info("🏆 TOP 5 TỈNH CÓ NHIỀU TRẠM NHẤT:")
-            for i, (province, stats) in enumerate(sorted_by_stations, 1):
-                logging.info(f"   {i}. {province}: {len(stats['stations'])} trạm")
+            top_by_stations = province_stats.nsmallest(5, "rank_by_stations")
+            for i, stats in enumerate(top_by_stations.itertuples(index=False), 1):
+                logging.info(f"   {i}. {stats.province_name}: {stats.station_count} trạm")
 
             # Top 5 tỉnh có mưa nhiều nhất
-            sorted_by_rainfall = sorted(
-                province_summary.items(),
-                key=lambda x: (
-                    sum(x[1]["rainfall_values"]) / len(x[1]["rainfall_values"])
-                    if x[1]["rainfall_values"]
-                    else 0
-                ),
-                reverse=True,
-            )[:5]
-
             logging.info("🌧️ TOP 5 TỈNH CÓ LƯỢNG MƯA CAO NHẤT:")
-            for i, (province, stats) in enumerate(sorted_by_rainfall, 1):
-                avg_rain = (
-                    sum(stats["rainfall_values"]) / len(stats["rainfall_values"])
-                    if stats["rainfall_values"]
-                    else 0
-                )
-                logging.info(f"   {i}. {province}: {avg_rain:.1f} mm TB")
+            top_by_rainfall = province_stats.nsmallest(5, "rank_by_rainfall")
+            for i, stats in enumerate(top_by_rainfall.itertuples(index=False), 1):
+                logging.info(f"   {i}. {stats.province_name}: {stats.avg_rainfall:.1f} mm TB")
 
             logging.info("=" * 80)
             logging.info(f"📁 File Excel: {excel_file}")
@@ -7,16 +7,102 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 import pandas as pd
 import time
 import json
+import base64
 import os
 import re
+import heapq
+import random
 import unicodedata
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
 import threading
 
+try:
+    from Weather_Forcast_App.scripts.Vrain_browser import (
+        DriverPool,
+        ResourceBlocker,
+        StaticFetcher,
+        extract_embedded_json,
+        extract_title,
+        wait_for_stable_count,
+    )
+    from Weather_Forcast_App.scripts.Crawl_data_from_html_of_Vrain import parse_province_html
+except ImportError:
+    from Vrain_browser import (
+        DriverPool,
+        ResourceBlocker,
+        StaticFetcher,
+        extract_embedded_json,
+        extract_title,
+        wait_for_stable_count,
+    )
+    from Crawl_data_from_html_of_Vrain import parse_province_html
+
 
 class VrainCrawlerFinal:
-    def __init__(self, headless=True, max_workers=5, max_retries=3):
+    STATION_ROW_SELECTORS = [
+        "div[class*='station-row']",
+        "div[class*='station']",
+        "tr.station-item",
+        ".station-list-item",
+        "table tbody tr",
+        "table tr",
+        ".data-row",
+    ]
+
+    PROVINCE_NAME_SELECTORS = [
+        "span[_ngcontent-ng-c641299110]",
+        "span[_ngcontent-serverapp-c641299110]",
+        "span[class*='ng-']",
+        ".app-title span",
+        "h1 span",
+        ".province-name",
+        "h1",
+        "title",
+    ]
+
+    # Một lần execute_script: lấy text của mọi phần tử khớp từng selector,
+    # việc chọn selector và tách dòng làm trong Python
+    DOM_SNAPSHOT_SCRIPT = """
+        const [rowSelectors, nameSelectors] = arguments;
+        const text = (el) => (el.innerText || el.textContent || "");
+        return {
+            rows: rowSelectors.map((sel) => Array.from(document.querySelectorAll(sel), text)),
+            names: nameSelectors.map((sel) => {
+                const el = document.querySelector(sel);
+                return el ? text(el) : null;
+            }),
+            title: document.title || "",
+        };
+    """
+
+    # Chỉ đọc JSON từ API của Vrain (host vrain.vn, đường dẫn có /api/): các khóa bên dưới rất
+    # chung chung, response JSON của bên thứ ba (analytics, bản đồ...) có thể bị đọc nhầm thành trạm
+    API_URL_PATTERN = r"^https?://([\w-]+\.)*vrain\.vn(:\d+)?/(.*/)?api/"
+
+    # Các khóa thường gặp trong JSON trạm đo (API nội bộ của trang Angular)
+    JSON_LIST_KEYS = ("stations", "data", "items", "result", "results")
+    JSON_NAME_KEYS = ("station_name", "stationName", "name", "station", "ten_tram", "tram")
+    JSON_RAIN_KEYS = ("rainfall", "total_rain", "totalRain", "rain", "value", "luong_mua", "depth")
+
+    def __init__(
+        self,
+        headless=True,
+        max_workers=5,
+        max_retries=3,
+        max_pages_per_driver=25,
+        max_wait=15,
+        poll_interval=0.5,
+        extraction_mode="network",
+        block_resources=True,
+        blocked_url_patterns=None,
+        dom_mode="snapshot",
+        fetch_strategy="hybrid",
+        retry_budget=None,
+        backoff_base=1.0,
+        backoff_max=30.0,
+        api_url_pattern=None,
+    ):
         self.base_url = "https://www.vrain.vn"
         self.all_rainfall_data = []
         self.headless = headless
@@ -25,6 +111,37 @@ class VrainCrawlerFinal:
         self.data_lock = threading.Lock()
         self.unique_stations = {}
         self.failed_provinces = []
+        # Retry chạy chung pool với lượt đầu: backoff mũ + jitter, giới hạn tổng số retry
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempts = []
+        # Chờ theo điều kiện (danh sách trạm ổn định) thay vì sleep cố định
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.timings = {}
+        # "network": đọc JSON từ XHR qua performance log, DOM chỉ là fallback
+        # "dom": chỉ đọc text DOM như trước
+        self.extraction_mode = extraction_mode
+        self.api_url_regex = re.compile(api_url_pattern or self.API_URL_PATTERN, re.IGNORECASE)
+        # "snapshot": một execute_script cho cả tên tỉnh lẫn danh sách trạm
+        # "elements": find_element/el.text cho từng phần tử như trước
+        self.dom_mode = dom_mode
+        # "hybrid": GET tĩnh + parser nhanh trước, chỉ mở Chrome khi HTML tĩnh không có trạm
+        # "browser": luôn dùng Selenium
+        self.fetch_strategy = fetch_strategy
+        self.static_fetcher = (
+            StaticFetcher(pool_size=max_workers) if fetch_strategy == "hybrid" else None
+        )
+        # Chặn ảnh/font/CSS/tile bản đồ/analytics để giảm thời gian tải mỗi tỉnh
+        self.resource_blocker = (
+            ResourceBlocker(url_patterns=blocked_url_patterns) if block_resources else None
+        )
+        self.performance_logging = (
+            extraction_mode == "network" or self.resource_blocker is not None
+        )
+        # Mỗi worker thread giữ một Chrome dùng lại cho nhiều tỉnh
+        self.driver_pool = DriverPool(self.create_driver, max_pages_per_driver)
 
     def create_driver(self):
         chrome_options = Options()
@@ -35,13 +152,23 @@ class VrainCrawlerFinal:
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
         chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_experimental_option(
-            "prefs", {"profile.default_content_setting_values": {"images": 2}}
-        )
+        if self.resource_blocker:
+            self.resource_blocker.apply_options(chrome_options)
+        else:
+            chrome_options.add_experimental_option(
+                "prefs", {"profile.default_content_setting_values": {"images": 2}}
+            )
         chrome_options.page_load_strategy = "eager"
+        if self.performance_logging:
+            chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
         driver = webdriver.Chrome(options=chrome_options)
         driver.set_page_load_timeout(30)
+        if self.resource_blocker:
+            try:
+                self.resource_blocker.apply_driver(driver)
+            except Exception as e:
+                print(f"⚠️  Không bật được chặn tài nguyên qua CDP: {str(e)[:50]}")
         return driver
 
     def normalize_string(self, text):
@@ -56,168 +183,434 @@ class VrainCrawlerFinal:
         match = re.search(r"(\d+[\.,]?\d*)", text)
         return match.group(1).replace(",", ".") if match else "0"
 
+    def _clean_province_name(self, text):
+        """Làm sạch text ứng viên tên tỉnh, trả về None nếu không hợp lệ"""
+        text = (text or "").strip()
+        if text and len(text) > 1:
+            text = re.sub(r"(VRAIN|Lượng mưa.*|[-|])", "", text).strip()
+            if text and not any(x in text.lower() for x in ["tại các trạm", "ngày"]):
+                return self.normalize_string(text)
+        return None
+
+    def _province_name_from_title(self, title):
+        if title and "VRAIN" in title:
+            text = title.replace("VRAIN", "").replace("-", "").strip()
+            if text:
+                return self.normalize_string(text)
+        return None
+
     def get_province_name(self, driver):
         """Lấy tên tỉnh từ các selector khác nhau"""
-        selectors = [
-            "span[_ngcontent-ng-c641299110]",
-            "span[_ngcontent-serverapp-c641299110]",
-            "span[class*='ng-']",
-            ".app-title span",
-            "h1 span",
-            ".province-name",
-            "h1",
-            "title",
-        ]
-
-        for selector in selectors:
+        for selector in self.PROVINCE_NAME_SELECTORS:
             try:
                 element = driver.find_element(By.CSS_SELECTOR, selector)
-                text = element.text.strip()
-                if text and len(text) > 1:
-                    text = re.sub(r"(VRAIN|Lượng mưa.*|[-|])", "", text).strip()
-                    if text and not any(
-                        x in text.lower() for x in ["tại các trạm", "ngày"]
-                    ):
-                        return self.normalize_string(text)
+                name = self._clean_province_name(element.text)
+                if name:
+                    return name
             except:
                 continue
 
         try:
-            title = driver.title
-            if title and "VRAIN" in title:
-                text = title.replace("VRAIN", "").replace("-", "").strip()
-                if text:
-                    return self.normalize_string(text)
+            return self._province_name_from_title(driver.title)
         except:
-            pass
+            return None
+
+    def take_dom_snapshot(self, driver):
+        """Chụp text của trang bằng một lệnh execute_script duy nhất"""
+        snapshot = driver.execute_script(
+            self.DOM_SNAPSHOT_SCRIPT,
+            self.STATION_ROW_SELECTORS,
+            self.PROVINCE_NAME_SELECTORS,
+        )
+        return snapshot or {"rows": [], "names": [], "title": ""}
+
+    def province_name_from_snapshot(self, snapshot):
+        """Chọn tên tỉnh từ snapshot theo đúng thứ tự selector của get_province_name"""
+        for text in snapshot.get("names") or []:
+            name = self._clean_province_name(text)
+            if name:
+                return name
+        return self._province_name_from_title(snapshot.get("title"))
+
+    def stations_from_snapshot(self, snapshot):
+        """Chọn selector đầu tiên có hơn 2 phần tử và tách trạm từ text đã chụp"""
+        texts = []
+        for texts in snapshot.get("rows") or []:
+            if len(texts) > 2:
+                break
+        return self._parse_station_texts(texts)
+
+    def _read_performance_log(self, driver):
+        """Lấy (và xả) các sự kiện CDP Network từ performance log của Chrome"""
+        try:
+            return driver.get_log("performance")
+        except Exception:
+            return []
+
+    def capture_json_responses(self, driver, log_entries):
+        """Lấy body của các response JSON mà trang đã tải qua XHR từ API của Vrain (api_url_regex)"""
+        payloads = []
+        for entry in log_entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+                if message.get("method") != "Network.responseReceived":
+                    continue
 
-        return None
+                params = message.get("params", {})
+                response = params.get("response", {})
+                if "json" not in response.get("mimeType", ""):
+                    continue
+                if not self.api_url_regex.match(response.get("url", "")):
+                    continue
+
+                body = driver.execute_cdp_cmd(
+                    "Network.getResponseBody", {"requestId": params["requestId"]}
+                )
+                text = body.get("body", "")
+                if body.get("base64Encoded"):
+                    text = base64.b64decode(text).decode("utf-8", errors="replace")
+                payloads.append(json.loads(text))
+            except Exception:
+                continue
+        return payloads
+
+    def _process_json_data(self, json_data):
+        """Chuẩn hóa JSON trạm đo thành danh sách (tên trạm, lượng mưa)"""
+        rows = []
+
+        if isinstance(json_data, dict):
+            for key in self.JSON_LIST_KEYS:
+                if key in json_data:
+                    return self._process_json_data(json_data[key])
+
+        elif isinstance(json_data, list):
+            for item in json_data:
+                if not isinstance(item, dict):
+                    continue
+
+                name = next((item[k] for k in self.JSON_NAME_KEYS if item.get(k)), None)
+                rain = next(
+                    (item[k] for k in self.JSON_RAIN_KEYS if item.get(k) is not None),
+                    None,
+                )
+                if name is None or rain is None:
+                    continue
+
+                rows.append(
+                    (self.normalize_string(str(name)), self.extract_rainfall(str(rain)))
+                )
+
+        return rows
+
+    def extract_stations_from_network(self, driver, log_entries):
+        """Trích xuất trạm từ JSON bắt được qua CDP Network"""
+        rows = []
+        for payload in self.capture_json_responses(driver, log_entries):
+            rows.extend(self._process_json_data(payload))
+        return rows
+
+    def extract_stations_from_dom(self, driver):
+        """Trích xuất trạm từ text DOM (mỗi phần tử một lần gọi WebDriver)"""
+        elements = []
+        for selector in self.STATION_ROW_SELECTORS:
+            elements = driver.find_elements(By.CSS_SELECTOR, selector)
+            if len(elements) > 2:
+                break
+
+        texts = []
+        for el in elements:
+            try:
+                texts.append(el.text)
+            except:
+                continue
+        return self._parse_station_texts(texts)
+
+    def _parse_station_texts(self, texts):
+        """Tách (tên trạm, lượng mưa) từ text của từng dòng trạm"""
+        rows = []
+        for text_content in texts:
+            text_content = (text_content or "").strip()
+            if not text_content or "Lượng mưa" in text_content:
+                continue
+
+            lines = [
+                line.strip()
+                for line in text_content.split("\n")
+                if line.strip()
+            ]
+
+            if len(lines) >= 2:
+                rows.append(
+                    (
+                        self.normalize_string(lines[0]),
+                        self.extract_rainfall(lines[-1]),
+                    )
+                )
+        return rows
+
+    def _add_stations(self, province_id, province_name, rows, crawl_time):
+        """Thêm các trạm chưa có vào kết quả, trả về số trạm mới"""
+        found_count = 0
+        with self.data_lock:
+            for station_name, rainfall_val in rows:
+                unique_key = f"{province_name}_{station_name}".lower()
+                if unique_key not in self.unique_stations:
+                    self.unique_stations[unique_key] = {
+                        "province_id": province_id,
+                        "tinh": province_name,
+                        "tram": station_name,
+                        "luong_mua": float(rainfall_val),
+                        "thoi_gian": crawl_time,
+                    }
+                    found_count += 1
+        return found_count
+
+    def crawl_province(self, province_id, attempt=0):
+        """
+        Crawl một tỉnh (một lần thử). Trả về số trạm lấy được, 0 nếu trang chưa có dữ liệu;
+        lỗi trình duyệt thì bỏ driver hiện tại và ném lại để run() xếp lịch thử lại.
+        """
+        started = time.monotonic()
+        if self.static_fetcher:
+            province_name, rows = self.crawl_province_static(province_id)
+            if province_name and rows:
+                with self.data_lock:
+                    self.timings[province_id] = {
+                        "path": "static",
+                        "elapsed_s": round(time.monotonic() - started, 2),
+                        "wait_s": 0.0,
+                        "rows": len(rows),
+                    }
+                return self._finish_province(province_id, province_name, rows, "static", attempt)
 
-    def crawl_province(self, province_id, retry_count=0):
-        """Crawl một tỉnh với cơ chế retry"""
-        driver = None
         try:
-            driver = self.create_driver()
+            driver = self.driver_pool.acquire()
             url = f"{self.base_url}/{province_id}/overview?public_map=windy"
+            if self.performance_logging:
+                # Xả log của trang trước để chỉ đọc sự kiện của trang này
+                self._read_performance_log(driver)
             driver.get(url)
 
-            wait = WebDriverWait(driver, 15)
+            wait = WebDriverWait(driver, self.max_wait)
             wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "body")))
-            time.sleep(4)
+            row_count, waited = wait_for_stable_count(
+                driver,
+                ", ".join(self.STATION_ROW_SELECTORS),
+                timeout=self.max_wait,
+                poll_interval=self.poll_interval,
+            )
+            with self.data_lock:
+                self.timings[province_id] = {
+                    "path": "selenium",
+                    "wait_s": round(waited, 2),
+                    "rows": row_count,
+                }
+
+            log_entries = (
+                self._read_performance_log(driver) if self.performance_logging else []
+            )
+            if self.resource_blocker:
+                self.resource_blocker.record(log_entries)
 
-            province_name = self.get_province_name(driver)
+            snapshot = None
+            if self.dom_mode == "snapshot":
+                snapshot = self.take_dom_snapshot(driver)
+                province_name = self.province_name_from_snapshot(snapshot)
+            else:
+                province_name = self.get_province_name(driver)
 
             if not province_name:
                 province_name = f"ID_{province_id}"
 
-            found_count = 0
-            crawl_time = datetime.now().strftime("%d/%m/%Y %H:%M")
-
-            selectors = [
-                "div[class*='station-row']",
-                "div[class*='station']",
-                "tr.station-item",
-                ".station-list-item",
-                "table tbody tr",
-                "table tr",
-                ".data-row",
-            ]
+            rows, mode = [], "dom"
+            if self.extraction_mode == "network":
+                rows, mode = (
+                    self.extract_stations_from_network(driver, log_entries),
+                    "network",
+                )
+            if not rows:
+                if snapshot is not None:
+                    rows, mode = self.stations_from_snapshot(snapshot), "snapshot"
+                else:
+                    rows, mode = self.extract_stations_from_dom(driver), "dom"
 
-            elements = []
-            for selector in selectors:
-                elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                if len(elements) > 2:
-                    break
+            with self.data_lock:
+                self.timings[province_id]["elapsed_s"] = round(time.monotonic() - started, 2)
 
-            for el in elements:
-                try:
-                    text_content = el.text.strip()
-                    if not text_content or "Lượng mưa" in text_content:
-                        continue
+        except Exception:
+            self.driver_pool.discard()
+            raise
 
-                    lines = [
-                        line.strip()
-                        for line in text_content.split("\n")
-                        if line.strip()
-                    ]
-
-                    if len(lines) >= 2:
-                        station_name = self.normalize_string(lines[0])
-                        rainfall_val = self.extract_rainfall(lines[-1])
-
-                        unique_key = f"{province_name}_{station_name}".lower()
-
-                        with self.data_lock:
-                            if unique_key not in self.unique_stations:
-                                record = {
-                                    "province_id": province_id,
-                                    "tinh": province_name,
-                                    "tram": station_name,
-                                    "luong_mua": float(rainfall_val),
-                                    "thoi_gian": crawl_time,
-                                }
-                                self.unique_stations[unique_key] = record
-                                found_count += 1
-                except:
-                    continue
+        return self._finish_province(province_id, province_name, rows, mode, attempt)
 
-            if found_count == 0 or province_name.startswith("ID_"):
-                if retry_count < self.max_retries:
-                    print(
-                        f"⚠️  ID {province_id}: {province_name} - Không có dữ liệu, thử lại lần {retry_count + 1}..."
-                    )
-                    if driver:
-                        driver.quit()
-                    time.sleep(2)
-                    return self.crawl_province(province_id, retry_count + 1)
-                else:
-                    print(
-                        f"❌ ID {province_id}: Thất bại sau {self.max_retries} lần thử"
-                    )
-                    with self.data_lock:
-                        self.failed_provinces.append(province_id)
-                    return 0
+    def crawl_province_static(self, province_id):
+        """
+        Thử GET tĩnh (requests dùng chung pool) và parser nhanh: JSON nhúng trong
+        <script type="application/json"> trước, sau đó các khối trạm render sẵn.
+        Trả về (tên tỉnh, rows); rows rỗng nghĩa là cần Selenium.
+        """
+        url = f"{self.base_url}/{province_id}/overview?public_map=windy"
+        try:
+            page_html = self.static_fetcher.get(url)
+        except Exception:
+            return None, []
+
+        rows = []
+        for payload in extract_embedded_json(page_html):
+            rows.extend(self._process_json_data(payload))
+
+        html_name, stations = parse_province_html(page_html)
+        if not rows:
+            rows = [
+                (
+                    self.normalize_string(station["Tên trạm"]),
+                    self.extract_rainfall(station["Tổng lượng mưa"]),
+                )
+                for station in stations
+                if station["Tên trạm"] != "N/A"
+            ]
 
-            print(f"✅ ID {province_id}: {province_name} - Lấy được {found_count} trạm")
-            return found_count
+        province_name = None
+        if html_name != "Không xác định":
+            province_name = self._clean_province_name(html_name)
+        if not province_name:
+            province_name = self._province_name_from_title(extract_title(page_html))
+        return province_name, rows
+
+    def _finish_province(self, province_id, province_name, rows, mode, attempt):
+        """Ghi các trạm của tỉnh, trả về số trạm mới (0 nếu cần thử lại)"""
+        crawl_time = datetime.now().strftime("%d/%m/%Y %H:%M")
+        found_count = self._add_stations(province_id, province_name, rows, crawl_time)
+        with self.data_lock:
+            self.timings[province_id]["mode"] = mode
+
+        if found_count == 0 or province_name.startswith("ID_"):
+            return 0
+
+        retry_note = f", lần thử {attempt + 1}" if attempt else ""
+        print(
+            f"✅ ID {province_id}: {province_name} - Lấy được {found_count} trạm ({mode}{retry_note})"
+        )
+        return found_count
 
+    def _attempt_province(self, province_id, attempt):
+        """Chạy một lần thử và ghi lại thời gian; trả về (province_id, attempt, số trạm, lỗi)"""
+        start = time.monotonic()
+        error = None
+        try:
+            found_count = self.crawl_province(province_id, attempt)
         except Exception as e:
-            if retry_count < self.max_retries:
-                print(
-                    f"⚠️  ID {province_id} lỗi: {str(e)[:30]} - Thử lại lần {retry_count + 1}..."
-                )
-                if driver:
-                    driver.quit()
-                time.sleep(2)
-                return self.crawl_province(province_id, retry_count + 1)
-            else:
-                print(
-                    f"❌ Lỗi ID {province_id} sau {self.max_retries} lần thử: {str(e)[:50]}"
-                )
-                with self.data_lock:
-                    self.failed_provinces.append(province_id)
-                return 0
-        finally:
-            if driver:
-                driver.quit()
+            found_count, error = 0, e
+
+        with self.data_lock:
+            self.attempts.append(
+                {
+                    "province_id": province_id,
+                    "attempt": attempt,
+                    "elapsed_s": round(time.monotonic() - start, 2),
+                    "found": found_count,
+                    "error": str(error)[:100] if error else None,
+                }
+            )
+        return province_id, attempt, found_count, error
+
+    def _backoff_delay(self, attempt):
+        """Backoff mũ có jitter: lần thử thứ n chờ trong khoảng [50%, 100%] của base * 2^n"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
 
     def run(self, start_id=1, end_id=63):
         print(f"🚀 Bắt đầu crawl từ ID {start_id} đến {end_id}...")
         print(f"🔄 Số lần thử lại tối đa: {self.max_retries}")
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            executor.map(self.crawl_province, range(start_id, end_id + 1))
+        province_ids = list(range(start_id, end_id + 1))
+        retry_budget = (
+            self.retry_budget if self.retry_budget is not None else len(province_ids)
+        )
+        retries_used = 0
+        self.failed_provinces = []
+        self.attempts = []
+        # Hàng đợi retry: (thời điểm được chạy, province_id, lần thử)
+        delayed = []
 
-        if self.failed_provinces:
-            print(f"\n🔄 Đang retry {len(self.failed_provinces)} tỉnh thất bại...")
-            retry_failed = []
-            for province_id in self.failed_provinces:
-                time.sleep(1)
-                result = self.crawl_province(province_id, 0)
-                if result == 0:
-                    retry_failed.append(province_id)
-
-            self.failed_provinces = retry_failed
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = {
+                    executor.submit(self._attempt_province, province_id, 0)
+                    for province_id in province_ids
+                }
+
+                while pending or delayed:
+                    now = time.monotonic()
+                    while delayed and delayed[0][0] <= now:
+                        _, province_id, attempt = heapq.heappop(delayed)
+                        pending.add(
+                            executor.submit(self._attempt_province, province_id, attempt)
+                        )
+
+                    timeout = max(0.0, delayed[0][0] - now) if delayed else None
+                    if not pending:
+                        time.sleep(timeout)
+                        continue
+
+                    done, pending = wait_futures(
+                        pending, timeout=timeout, return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        province_id, attempt, found_count, error = future.result()
+                        if found_count:
+                            continue
+
+                        reason = f"lỗi: {str(error)[:30]}" if error else "Không có dữ liệu"
+                        if attempt < self.max_retries and retries_used < retry_budget:
+                            retries_used += 1
+                            delay = self._backoff_delay(attempt)
+                            print(
+                                f"⚠️  ID {province_id}: {reason} - Thử lại lần {attempt + 1} sau {delay:.1f}s..."
+                            )
+                            heapq.heappush(
+                                delayed, (time.monotonic() + delay, province_id, attempt + 1)
+                            )
+                        else:
+                            limit = (
+                                f"sau {attempt + 1} lần thử"
+                                if attempt >= self.max_retries
+                                else "do hết ngân sách retry"
+                            )
+                            print(f"❌ ID {province_id}: Thất bại {limit} ({reason})")
+                            self.failed_provinces.append(province_id)
+        finally:
+            self.driver_pool.shutdown()
+            if self.static_fetcher:
+                self.static_fetcher.close()
+
+        self.failed_provinces.sort()
+
+        stats = self.driver_pool.stats
+        print(
+            f"🧭 Chrome: tạo {stats['created']}, thay mới {stats['recycled']}, "
+            f"lỗi {stats['crashed']}, tổng {stats['pages']} trang"
+        )
+        if self.timings:
+            paths = [t.get("path") for t in self.timings.values()]
+            print(
+                f"🧩 Nguồn dữ liệu: tĩnh {paths.count('static')} tỉnh, "
+                f"Selenium {paths.count('selenium')} tỉnh"
+            )
+            waits = [t["wait_s"] for t in self.timings.values() if t.get("path") == "selenium"]
+            if waits:
+                print(
+                    f"⏱️  Chờ render: TB {sum(waits) / len(waits):.2f}s, "
+                    f"lâu nhất {max(waits):.2f}s ({len(waits)} tỉnh)"
+                )
+        if self.resource_blocker:
+            print(f"🚫 Tài nguyên: {self.resource_blocker.summary()}")
+        if self.attempts:
+            elapsed = [a["elapsed_s"] for a in self.attempts]
+            print(
+                f"🔁 Lần thử: {len(self.attempts)} (retry {retries_used}/{retry_budget}), "
+                f"TB {sum(elapsed) / len(elapsed):.2f}s/lần, thất bại {len(self.failed_provinces)} tỉnh"
+            )
 
         self.all_rainfall_data = list(self.unique_stations.values())
         self.all_rainfall_data.sort(key=lambda x: (x["province_id"], x["tram"]))
@@ -1,53 +1,45 @@
 import re
 import csv
+import os
 import time
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-# === CẤU HÌNH SELENIUM ===
-options = webdriver.ChromeOptions()
-options.add_argument("--headless")
-options.add_argument("--no-sandbox")
-options.add_argument("--disable-dev-shm-usage")
-driver = webdriver.Chrome(options=options)
+try:
+    from Weather_Forcast_App.scripts.Vrain_browser import (
+        DriverPool,
+        ResourceBlocker,
+        StaticFetcher,
+        html_to_text,
+        wait_for_stable_count,
+        wait_for_text,
+    )
+except ImportError:
+    from Vrain_browser import (
+        DriverPool,
+        ResourceBlocker,
+        StaticFetcher,
+        html_to_text,
+        wait_for_stable_count,
+        wait_for_text,
+    )
 
-# === 1. LẤY NGÀY VÀ GIỜ CẬP NHẬT TỪ TRANG CHỦ ===
-print("Đang truy cập trang chủ để lấy ngày và giờ cập nhật...")
-driver.get("https://vrain.vn/landing")
-time.sleep(5)
+# Thời gian chờ tối đa (giây) cho mỗi trang; trang render nhanh sẽ đi tiếp ngay
+MAX_WAIT = 15
+POLL_INTERVAL = 0.5
 
-all_text = driver.find_element(By.TAG_NAME, "body").text
-print("  Đang tìm kiếm ngày và giờ trong văn bản trang...")
+# Số trang crawl song song (mỗi luồng giữ một Chrome)
+MAX_WORKERS = 4
 
-date_match = re.search(r"ngày\s*(\d{1,2}/\d{1,2})", all_text)
-hour_match = re.search(r"Tính từ\s*(\d{1,2})h", all_text)
-
-if date_match and hour_match:
-    date_from_main = date_match.group(1)
-    hour_from_main = hour_match.group(1)
-    current_year = datetime.now().strftime("%Y")
-    unified_datetime_info = f"{date_from_main}/{current_year} {hour_from_main}:00"
-    print(f"  Đã lấy ngày và giờ cập nhật từ trang chủ: {unified_datetime_info}")
-elif date_match:
-    date_from_main = date_match.group(1)
-    current_year = datetime.now().strftime("%Y")
-    unified_datetime_info = f"{date_from_main}/{current_year}"
-    print(
-        f"  Đã lấy ngày cập nhật từ trang chủ (không có giờ): {unified_datetime_info}"
-    )
-else:
-    unified_datetime_info = "N/A"
-    print("  Cảnh báo: Không tìm thấy ngày cập nhật. Sử dụng ngày và giờ hiện tại.")
-    unified_datetime_info = datetime.now().strftime("%d/%m/%Y %H:%M")
-
-current_crawl_datetime = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+LANDING_URL = "https://vrain.vn/landing"
 
 # Danh sách các URL tỉnh thành
-province_urls = [
+PROVINCE_URLS = [
     "https://vrain.vn/20/overview?public_map=windy",
     "https://vrain.vn/2/overview?public_map=windy",
     "https://vrain.vn/4/overview?public_map=windy",
@@ -85,121 +77,285 @@ province_urls = [
 ]
 
 OUTPUT_DIR = Path("/media/voanhnhat/SDD_OUTSIDE5/PROJECT_WEATHER_FORECAST/Weather_Forcast_App/output")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-csv_path = OUTPUT_DIR / f"Bao_cao_{timestamp}.csv"
-
-with open(csv_path, "w", newline="", encoding="utf-8-sig") as csvfile:
-    fieldnames = [
-        "Tỉnh/Thành phố",
-        "Tên trạm",
-        "Huyện",
-        "Tổng lượng mưa",
-        "Tình trạng",
-        "Dấu thời gian",
-        "Thời gian cập nhập",
-    ]
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-    writer.writeheader()
-
-    for url in province_urls:
+
+CSV_FIELDNAMES = [
+    "Tỉnh/Thành phố",
+    "Tên trạm",
+    "Huyện",
+    "Tổng lượng mưa",
+    "Tình trạng",
+    "Dấu thời gian",
+    "Thời gian cập nhập",
+]
+
+# === REGEX (biên dịch một lần cho cả phiên crawl) ===
+LANDING_DATE_RE = re.compile(r"ngày\s*(\d{1,2}/\d{1,2})")
+LANDING_HOUR_RE = re.compile(r"Tính từ\s*(\d{1,2})h")
+PROVINCE_NAME_RE = re.compile(
+    r"<div[^>]*app-title[^>]*>.*?<span[^>]*>([^<]+)</span>", re.DOTALL
+)
+GROUP_BLOCK_RE = re.compile(
+    r'<div[^>]*class="[^"]*\bgroup\b[^"]*"[^>]*>(.*?)</div>\s*</div>\s*</div>', re.DOTALL
+)
+STATION_BLOCK_RE = re.compile(
+    r'<div[^>]*class="[^"]*\bstation\b[^"]*"[^>]*>(.*?)</div>\s*</div>\s*</div>', re.DOTALL
+)
+STATION_NAME_RE = re.compile(
+    r'<div[^>]*station-row-1[^>]*>.*?<span[^>]*class="[^"]*\bmax-w-70\b[^"]*"[^>]*>([^<]+)</span>',
+    re.DOTALL,
+)
+LOCATION_RE = re.compile(
+    r'<div[^>]*station-row-2[^>]*>.*?<div[^>]*class="[^"]*\bsub-title\b[^"]*"[^>]*>([^<]+)</div>',
+    re.DOTALL,
+)
+RAINFALL_RE = re.compile(
+    r'<div[^>]*station-row-1[^>]*>.*?<span[^>]*class="[^"]*font-size-18px[^"]*"[^>]*>([\d.]+)\s*<span[^>]*>mm</span>',
+    re.DOTALL,
+)
+STATUS_RE = re.compile(
+    r'<div[^>]*station-row-2[^>]*>.*?<div[^>]*class="[^"]*\blevel\b[^"]*"[^>]*>.*?<span[^>]*>([^<]+)</span>',
+    re.DOTALL,
+)
+
+
+def parse_update_time(all_text, log=print):
+    """Lấy 'ngày dd/mm' và 'Tính từ HHh' trên trang chủ thành chuỗi thời gian cập nhật"""
+    date_match = LANDING_DATE_RE.search(all_text)
+    hour_match = LANDING_HOUR_RE.search(all_text)
+    current_year = datetime.now().strftime("%Y")
+
+    if date_match and hour_match:
+        unified_datetime_info = f"{date_match.group(1)}/{current_year} {hour_match.group(1)}:00"
+        log(f"  Đã lấy ngày và giờ cập nhật từ trang chủ: {unified_datetime_info}")
+    elif date_match:
+        unified_datetime_info = f"{date_match.group(1)}/{current_year}"
+        log(f"  Đã lấy ngày cập nhật từ trang chủ (không có giờ): {unified_datetime_info}")
+    else:
+        log("  Cảnh báo: Không tìm thấy ngày cập nhật. Sử dụng ngày và giờ hiện tại.")
+        unified_datetime_info = datetime.now().strftime("%d/%m/%Y %H:%M")
+    return unified_datetime_info
+
+
+def parse_province_html(page_html):
+    """
+    Trích xuất tên tỉnh và danh sách trạm từ HTML trang tỉnh.
+    Trả về (tên tỉnh, [{"Tên trạm", "Huyện", "Tổng lượng mưa", "Tình trạng"}, ...]).
+    """
+    province_match = PROVINCE_NAME_RE.search(page_html)
+    province_name = province_match.group(1).strip() if province_match else "Không xác định"
+
+    station_blocks = GROUP_BLOCK_RE.findall(page_html) or STATION_BLOCK_RE.findall(page_html)
+
+    stations = []
+    for block in station_blocks:
+        station_match = STATION_NAME_RE.search(block)
+        location_match = LOCATION_RE.search(block)
+        rainfall_match = RAINFALL_RE.search(block)
+        status_match = STATUS_RE.search(block)
+
+        stations.append(
+            {
+                "Tên trạm": station_match.group(1).strip() if station_match else "N/A",
+                "Huyện": location_match.group(1).strip() if location_match else "N/A",
+                "Tổng lượng mưa": rainfall_match.group(1).strip() if rainfall_match else "0.0",
+                "Tình trạng": status_match.group(1).strip() if status_match else "Không xác định",
+            }
+        )
+    return province_name, stations
+
+
+class VrainHtmlCrawler:
+    """
+    Crawl HTML các trang tỉnh của Vrain song song và ghi từng dòng vào CSV ngay khi mỗi trang xong.
+    Chế độ "hybrid": thử GET tĩnh + regex trước, chỉ mở Chrome (pool nhỏ) khi HTML tĩnh không có trạm.
+    """
+
+    def __init__(
+        self,
+        urls=None,
+        max_workers=MAX_WORKERS,
+        output_dir=OUTPUT_DIR,
+        max_wait=MAX_WAIT,
+        poll_interval=POLL_INTERVAL,
+        max_pages_per_driver=25,
+        fetch_strategy="hybrid",
+        log=print,
+    ):
+        self.urls = list(PROVINCE_URLS if urls is None else urls)
+        self.max_workers = max(1, int(max_workers))
+        self.output_dir = Path(output_dir)
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.log = log
+        # "hybrid": requests trước, Selenium khi cần; "browser": luôn dùng Selenium
+        self.fetch_strategy = fetch_strategy
+        self.static_fetcher = (
+            StaticFetcher(pool_size=self.max_workers) if fetch_strategy == "hybrid" else None
+        )
+        self.resource_blocker = ResourceBlocker()
+        # Chrome chỉ được mở khi có trang thực sự cần đến trình duyệt
+        self.driver_pool = DriverPool(self.create_driver, max_pages_per_driver)
+        self.page_stats = {}
+        self.wait_timings = []
+        self.failed_urls = []
+        self.row_count = 0
+
+    def create_driver(self):
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        self.resource_blocker.apply_options(options)
+        driver = webdriver.Chrome(options=options)
+        try:
+            self.resource_blocker.apply_driver(driver)
+        except Exception as e:
+            self.log(f"[WARN] Không bật được chặn tài nguyên qua CDP: {e}")
+        return driver
+
+    def fetch_update_time(self):
+        """Lấy ngày và giờ cập nhật từ trang chủ"""
+        self.log("Đang truy cập trang chủ để lấy ngày và giờ cập nhật...")
+        if self.static_fetcher:
+            try:
+                all_text = html_to_text(self.static_fetcher.get(LANDING_URL))
+                if LANDING_DATE_RE.search(all_text):
+                    self.log("  Trang chủ đọc được từ HTML tĩnh")
+                    return parse_update_time(all_text, log=self.log)
+            except Exception as e:
+                self.log(f"  HTML tĩnh của trang chủ lỗi ({e}), chuyển sang Selenium")
+
+        driver = self.driver_pool.acquire()
+        driver.get(LANDING_URL)
+        all_text, landing_wait = wait_for_text(
+            driver,
+            r"ngày\s*\d{1,2}/\d{1,2}",
+            timeout=self.max_wait,
+            poll_interval=self.poll_interval,
+        )
+        self.log(f"  Trang chủ sẵn sàng sau {landing_wait:.2f}s")
+        return parse_update_time(all_text, log=self.log)
+
+    def crawl_page_static(self, url):
+        """Thử GET tĩnh + regex; trả về (tên tỉnh, danh sách trạm), danh sách rỗng nếu cần Selenium"""
+        try:
+            province_name, stations = parse_province_html(self.static_fetcher.get(url))
+        except Exception:
+            return None, []
+        # Trang khung/chưa render vẫn khớp regex nhưng chỉ ra trạm "N/A" -> coi như rỗng để chuyển Selenium
+        return province_name, [s for s in stations if s["Tên trạm"] != "N/A"]
+
+    def crawl_page(self, url):
+        """Tải một trang tỉnh, trả về (tên tỉnh, danh sách trạm, số giây chờ render)"""
+        started = time.monotonic()
+        if self.static_fetcher:
+            province_name, stations = self.crawl_page_static(url)
+            if stations:
+                self.page_stats[url] = {
+                    "path": "static",
+                    "elapsed_s": round(time.monotonic() - started, 2),
+                }
+                return province_name, stations, 0.0
+
+        driver = self.driver_pool.acquire()
         try:
-            print(f"\nĐang truy cập: {url}")
             driver.get(url)
-            WebDriverWait(driver, 15).until(
+            WebDriverWait(driver, self.max_wait).until(
                 EC.presence_of_element_located((By.CLASS_NAME, "landing-content"))
             )
-            time.sleep(2)
-
+            _, waited = wait_for_stable_count(
+                driver,
+                "div.group, div.station",
+                timeout=self.max_wait,
+                poll_interval=self.poll_interval,
+            )
             page_html = driver.page_source
+            self.resource_blocker.record(driver.get_log("performance"))
+        except Exception:
+            self.driver_pool.discard()
+            raise
 
-            # === TRÍCH XUẤT DỮ LIỆU ===
-            # 1. Tên tỉnh
-            province_match = re.search(
-                r"<div[^>]*app-title[^>]*>.*?<span[^>]*>([^<]+)</span>",
-                page_html,
-                re.DOTALL,
-            )
-            province_name = (
-                province_match.group(1).strip() if province_match else "Không xác định"
-            )
-            print(f"  Tỉnh: {province_name}")
+        province_name, stations = parse_province_html(page_html)
+        self.page_stats[url] = {
+            "path": "selenium",
+            "elapsed_s": round(time.monotonic() - started, 2),
+        }
+        return province_name, stations, waited
 
-            # 2. SỬ DỤNG NGÀY VÀ GIỜ ĐÃ LẤY TỪ TRANG CHỦ
-            datetime_info = unified_datetime_info
+    def run(self):
+        """Chạy toàn bộ phiên crawl, trả về đường dẫn file CSV"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        csv_path = self.output_dir / f"Bao_cao_{timestamp}.csv"
+        # Ghi vào file ẩn rồi đổi tên khi xong -> watcher gộp không bắt được file đang ghi dở
+        part_path = csv_path.with_name(f".{csv_path.name}.part")
+        started = time.monotonic()
 
-            # 3. Tìm các khối thông tin trạm
-            station_blocks = re.findall(
-                r'<div[^>]*class="[^"]*\bgroup\b[^"]*"[^>]*>(.*?)</div>\s*</div>\s*</div>',
-                page_html,
-                re.DOTALL,
-            )
-            if not station_blocks:
-                station_blocks = re.findall(
-                    r'<div[^>]*class="[^"]*\bstation\b[^"]*"[^>]*>(.*?)</div>\s*</div>\s*</div>',
-                    page_html,
-                    re.DOTALL,
-                )
-
-            print(f"  Tìm thấy {len(station_blocks)} khối trạm")
-
-            for block in station_blocks:
-
-                station_match = re.search(
-                    r'<div[^>]*station-row-1[^>]*>.*?<span[^>]*class="[^"]*\bmax-w-70\b[^"]*"[^>]*>([^<]+)</span>',
-                    block,
-                    re.DOTALL,
-                )
-                station_name = (
-                    station_match.group(1).strip() if station_match else "N/A"
-                )
-
-                location_match = re.search(
-                    r'<div[^>]*station-row-2[^>]*>.*?<div[^>]*class="[^"]*\bsub-title\b[^"]*"[^>]*>([^<]+)</div>',
-                    block,
-                    re.DOTALL,
-                )
-                xa_phuong = location_match.group(1).strip() if location_match else "N/A"
-
-                rainfall_match = re.search(
-                    r'<div[^>]*station-row-1[^>]*>.*?<span[^>]*class="[^"]*font-size-18px[^"]*"[^>]*>([\d.]+)\s*<span[^>]*>mm</span>',
-                    block,
-                    re.DOTALL,
-                )
-                rainfall = rainfall_match.group(1).strip() if rainfall_match else "0.0"
-
-                status_match = re.search(
-                    r'<div[^>]*station-row-2[^>]*>.*?<div[^>]*class="[^"]*\blevel\b[^"]*"[^>]*>.*?<span[^>]*>([^<]+)</span>',
-                    block,
-                    re.DOTALL,
-                )
-                status = (
-                    status_match.group(1).strip() if status_match else "Không xác định"
-                )
-
-                writer.writerow(
-                    {
-                        "Tỉnh/Thành phố": province_name,
-                        "Tên trạm": station_name,
-                        "Huyện": xa_phuong,
-                        "Tổng lượng mưa": rainfall,
-                        "Tình trạng": status,
-                        "Dấu thời gian": datetime_info,
-                        "Thời gian cập nhập": current_crawl_datetime,
-                    }
-                )
-
-            print(f"  Đã trích xuất {len(station_blocks)} trạm.")
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                unified_datetime_info = executor.submit(self.fetch_update_time).result()
+                current_crawl_datetime = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
 
-        except Exception as e:
-            print(f"  Lỗi khi xử lý {url}: {e}")
+                with open(part_path, "w", newline="", encoding="utf-8-sig") as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+                    writer.writeheader()
+
+                    futures = {executor.submit(self.crawl_page, url): url for url in self.urls}
+                    for future in as_completed(futures):
+                        url = futures[future]
+                        try:
+                            province_name, stations, waited = future.result()
+                        except Exception as e:
+                            self.failed_urls.append(url)
+                            self.log(f"  Lỗi khi xử lý {url}: {e}")
+                            continue
+
+                        path = self.page_stats.get(url, {}).get("path", "selenium")
+                        if path == "selenium":
+                            self.wait_timings.append(waited)
+                        for station in stations:
+                            writer.writerow(
+                                {
+                                    "Tỉnh/Thành phố": province_name,
+                                    **station,
+                                    "Dấu thời gian": unified_datetime_info,
+                                    "Thời gian cập nhập": current_crawl_datetime,
+                                }
+                            )
+                        csvfile.flush()
+                        self.row_count += len(stations)
+                        elapsed = self.page_stats.get(url, {}).get("elapsed_s", 0.0)
+                        self.log(
+                            f"  {province_name}: {len(stations)} trạm "
+                            f"({path}, {elapsed:.2f}s) - {url}"
+                        )
+        finally:
+            self.driver_pool.shutdown()
+            if self.static_fetcher:
+                self.static_fetcher.close()
+            if part_path.exists():
+                os.replace(part_path, csv_path)
+
+        self.log("\n" + "=" * 50)
+        if self.wait_timings:
+            self.log(
+                f"Thời gian chờ render: TB {sum(self.wait_timings) / len(self.wait_timings):.2f}s, "
+                f"lâu nhất {max(self.wait_timings):.2f}s"
+            )
+        paths = [stat["path"] for stat in self.page_stats.values()]
+        self.log(
+            f"Nguồn trang: tĩnh {paths.count('static')}, Selenium {paths.count('selenium')} "
+            f"(Chrome đã mở {self.driver_pool.stats['created']} lần)"
+        )
+        self.log(f"Tài nguyên: {self.resource_blocker.summary()}")
+        self.log(
+            f"Hoàn thành {len(self.urls) - len(self.failed_urls)}/{len(self.urls)} trang, "
+            f"{self.row_count} trạm trong {time.monotonic() - started:.1f}s "
+            f"({self.max_workers} luồng)"
+        )
+        self.log(f"Dữ liệu đã được lưu vào: {csv_path}")
+        return csv_path
 
-try:
-    driver.quit()
-except Exception as e:
-    print(f"[WARN] Lỗi khi đóng trình duyệt: {e}")
 
-print("\n" + "=" * 50)
-print(f"Hoàn thành! Thời gian crawl: {current_crawl_datetime}")
-print(f"Dữ liệu đã được lưu vào: {csv_path}")
\ No newline at end of file
+if __name__ == "__main__":
+    VrainHtmlCrawler().run()
@@ -0,0 +1,329 @@
+"""
+Theo dõi thư mục output/ và tự gộp file mới vào kho merge theo từng lô nhỏ.
+
+- Dùng watchdog (inotify/FSEvents/ReadDirectoryChanges) nếu đã cài, nếu không thì poll mtime với con trỏ.
+- Theo dõi file .xlsx và .csv; file bắt đầu bằng "." hoặc "~$" (file tạm đang ghi) bị bỏ qua.
+- Debounce: file chỉ được gộp khi size/mtime không đổi trong `debounce` giây (crawler đã ghi xong).
+- Micro-batch: gộp khi hàng chờ yên lặng `debounce` giây, hoặc file cũ nhất đã chờ quá `max_delay` giây.
+- Export file merged .xlsx/phân vùng một lần khi hàng chờ đã hết (không export sau từng lô).
+
+    python scripts/Merge_watcher.py [--debounce 5] [--poll 2] [--max-delay 60] [--no-export]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+try:
+    from Weather_Forcast_App.scripts.Merge_xlsx import (
+        INPUT_SUFFIXES,
+        MERGE_DIR_NAME,
+        OUTPUT_DIR_NAME,
+        MergeBusyError,
+        ensure_merged_exports,
+        merge_excel_files_once,
+    )
+except ImportError:
+    from Merge_xlsx import (
+        INPUT_SUFFIXES,
+        MERGE_DIR_NAME,
+        OUTPUT_DIR_NAME,
+        MergeBusyError,
+        ensure_merged_exports,
+        merge_excel_files_once,
+    )
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+# Cùng loại file với lượt quét của Merge_xlsx: .xlsx (crawler API/Selenium) và .csv (crawler HTML Vrain)
+WATCH_SUFFIXES = set(INPUT_SUFFIXES)
+# Thời gian chờ trước khi thử gộp lại file lỗi (nhân đôi sau mỗi lần lỗi, tối đa MAX_RETRY_DELAY)
+RETRY_DELAY = 10.0
+MAX_RETRY_DELAY = 300.0
+
+
+class _OutputEventHandler(FileSystemEventHandler):
+    """Chuyển sự kiện tạo/sửa/đổi tên file từ watchdog sang watcher"""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class MergeWatcher:
+    """
+    Gom các file mới trong output/ và gọi merge_excel_files_once(files=...) cho từng lô,
+    chỉ với các file đã biết là mới (không quét lại cả thư mục mỗi lần gộp).
+    """
+
+    def __init__(
+        self,
+        base_dir,
+        debounce=5.0,
+        poll_interval=2.0,
+        max_delay=60.0,
+        max_batch_files=200,
+        export_xlsx=True,
+        workers=None,
+        use_watchdog=True,
+        log=print,
+    ):
+        self.base_dir = Path(base_dir)
+        self.output_dir = self.base_dir / OUTPUT_DIR_NAME
+        self.merge_dir = self.base_dir / MERGE_DIR_NAME
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.max_delay = max_delay
+        self.max_batch_files = max_batch_files
+        self.export_xlsx = export_xlsx
+        self.workers = workers
+        self.use_watchdog = use_watchdog and Observer is not None
+        self.log = log
+
+        # path -> {"size", "mtime_ns", "stable_since", "first_seen", "failures", "retry_at"}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+
+        # Con trỏ poll: mtime lớn nhất đã thấy + các tên file có đúng mtime đó
+        self._cursor_mtime_ns = 0
+        self._cursor_names = set()
+        # Kho đã có dữ liệu mới chưa được export ra .xlsx
+        self._exports_stale = False
+
+        self.stats = {"batches": 0, "files_merged": 0, "files_failed": 0, "busy_retries": 0, "errors": 0}
+
+    # === PHÁT HIỆN FILE MỚI ===
+
+    def notify(self, path):
+        """Đánh dấu một file có thể mới/đang được ghi (gọi từ watchdog hoặc poll)"""
+        path = Path(path)
+        if path.suffix.lower() not in WATCH_SUFFIXES or path.name.startswith(("~$", ".")):
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pending.get(path)
+            if entry is None:
+                self._pending[path] = {
+                    "size": None, "mtime_ns": None, "stable_since": now, "first_seen": now,
+                    "failures": 0, "retry_at": 0.0,
+                }
+            else:
+                entry["stable_since"] = now
+                # File vừa được ghi lại -> thử gộp ngay khi đứng yên, không chờ backoff
+                entry["retry_at"] = 0.0
+
+    def _poll_directory(self):
+        """Quét mtime với con trỏ: chỉ các file mới hơn con trỏ mới được đưa vào hàng chờ"""
+        if not self.output_dir.exists():
+            return
+        newest, newest_names = self._cursor_mtime_ns, set(self._cursor_names)
+        with os.scandir(self.output_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                mtime_ns = entry.stat().st_mtime_ns
+                if mtime_ns < self._cursor_mtime_ns:
+                    continue
+                if mtime_ns == self._cursor_mtime_ns and entry.name in self._cursor_names:
+                    continue
+                self.notify(entry.path)
+                if mtime_ns > newest:
+                    newest, newest_names = mtime_ns, {entry.name}
+                elif mtime_ns == newest:
+                    newest_names.add(entry.name)
+        self._cursor_mtime_ns, self._cursor_names = newest, newest_names
+
+    def _ready_batch(self):
+        """Các file đã đứng yên đủ debounce giây; trả về [] nếu lô chưa đến lúc gộp"""
+        now = time.monotonic()
+        ready, oldest_wait, last_change = [], 0.0, None
+        with self._lock:
+            for path, entry in list(self._pending.items()):
+                try:
+                    st = path.stat()
+                except OSError:
+                    # File bị xóa/đổi tên trước khi kịp gộp
+                    self._pending.pop(path, None)
+                    continue
+
+                if (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+                    entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns, stable_since=now)
+
+                if now < entry["retry_at"]:
+                    continue
+                last_change = max(last_change or 0.0, entry["stable_since"])
+                if now - entry["stable_since"] >= self.debounce and st.st_size > 0:
+                    ready.append(path)
+                    oldest_wait = max(oldest_wait, now - entry["first_seen"])
+
+        if not ready:
+            return []
+        quiet = now - last_change >= self.debounce
+        if quiet or oldest_wait >= self.max_delay or len(ready) >= self.max_batch_files:
+            return sorted(ready)[: self.max_batch_files]
+        return []
+
+    # === GỘP ===
+
+    def _merge_batch(self, files):
+        self.log(f"🔗 Gộp lô {len(files)} file mới: {', '.join(p.name for p in files[:5])}"
+                 + (" ..." if len(files) > 5 else ""))
+        workers = self.workers or min(len(files), os.cpu_count() or 1)
+        try:
+            failed = merge_excel_files_once(self.base_dir, export_xlsx=False, workers=workers, files=files)
+        except MergeBusyError as e:
+            # Đang có người khác ghi kho -> giữ nguyên hàng chờ, thử lại ở vòng sau
+            self.stats["busy_retries"] += 1
+            self.log(f"⏳ {e}, thử lại sau")
+            return
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"❌ Lỗi khi gộp lô: {type(e).__name__}: {e}")
+            failed = list(files)
+
+        # File lỗi (đọc/append thất bại, hoặc cả lô lỗi) ở lại hàng chờ và được thử lại sau backoff;
+        # con trỏ poll đã đi qua chúng nên không được bỏ khỏi hàng chờ
+        failed_names = {Path(p).name for p in failed or []}
+        merged = [p for p in files if p.name not in failed_names]
+        now = time.monotonic()
+        with self._lock:
+            for path in merged:
+                self._pending.pop(path, None)
+            for path in files:
+                entry = self._pending.get(path)
+                if entry is None or path.name not in failed_names:
+                    continue
+                entry["failures"] += 1
+                entry["retry_at"] = now + min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (entry["failures"] - 1))
+        if failed_names:
+            self.stats["files_failed"] += len(failed_names)
+            self.log(f"🔁 {len(failed_names)} file lỗi, giữ trong hàng chờ để thử lại")
+
+        self.stats["batches"] += 1
+        self.stats["files_merged"] += len(merged)
+        if not merged:
+            return
+        self._exports_stale = True
+
+    def _export_if_idle(self):
+        """Export một lần khi không còn file chờ gộp (file lỗi đang chờ thử lại không tính)"""
+        now = time.monotonic()
+        with self._lock:
+            idle = all(now < entry["retry_at"] for entry in self._pending.values())
+        if not (self.export_xlsx and self._exports_stale and idle):
+            return
+        try:
+            exported = ensure_merged_exports(self.merge_dir)
+            self._exports_stale = False
+            if exported:
+                self.log(f"📤 Export {len(exported)} file merged/phân vùng")
+        except MergeBusyError as e:
+            # Một lần gộp khác đang giữ kho -> giữ cờ export, thử lại ở vòng sau
+            self.stats["busy_retries"] += 1
+            self.log(f"⏳ {e}, export lại sau")
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"❌ Lỗi khi export: {type(e).__name__}: {e}")
+
+    def run_once(self):
+        """Một vòng: poll (nếu không dùng watchdog) rồi gộp lô đã sẵn sàng; trả về số file đã gộp"""
+        if not self.use_watchdog:
+            self._poll_directory()
+        batch = self._ready_batch()
+        if batch:
+            self._merge_batch(batch)
+        else:
+            self._export_if_idle()
+        return len(batch)
+
+    def start(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.use_watchdog:
+            self._observer = Observer()
+            self._observer.schedule(_OutputEventHandler(self), str(self.output_dir), recursive=False)
+            self._observer.start()
+            mode = "watchdog"
+        else:
+            mode = f"poll mtime mỗi {self.poll_interval}s"
+
+        # Lần đầu: đưa các file chưa gộp sẵn có vào hàng chờ (ledger sẽ bỏ qua file đã gộp)
+        self._poll_directory()
+        self.log(f"👀 Theo dõi {self.output_dir} ({mode}, debounce {self.debounce}s, tối đa {self.max_delay}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            self.log(
+                f"🛑 Dừng watcher: {self.stats['batches']} lô, {self.stats['files_merged']} file, "
+                f"{self.stats['files_failed']} lần file lỗi, "
+                f"{self.stats['busy_retries']} lần chờ khóa, {self.stats['errors']} lỗi"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tự động gộp file mới trong output/ vào kho merge")
+    parser.add_argument("--base-dir", default=str(Path(__file__).resolve().parent.parent))
+    parser.add_argument("--debounce", type=float, default=5.0, help="Số giây file phải đứng yên trước khi gộp")
+    parser.add_argument("--poll", type=float, default=2.0, help="Chu kỳ kiểm tra (giây)")
+    parser.add_argument("--max-delay", type=float, default=60.0, help="Độ trễ tối đa của một file (giây)")
+    parser.add_argument("--max-batch", type=int, default=200, help="Số file tối đa mỗi lô")
+    parser.add_argument("--workers", type=int, default=None, help="Số process đọc file mỗi lô")
+    parser.add_argument("--no-export", action="store_true", help="Không export file merged .xlsx khi hàng chờ đã hết")
+    parser.add_argument("--no-watchdog", action="store_true", help="Luôn dùng poll mtime")
+    args = parser.parse_args()
+
+    base_dir = Path(args.base_dir)
+    if not base_dir.exists():
+        print(f"❌ Không tìm thấy thư mục: {base_dir}")
+        sys.exit(1)
+
+    MergeWatcher(
+        base_dir,
+        debounce=args.debounce,
+        poll_interval=args.poll,
+        max_delay=args.max_delay,
+        max_batch_files=args.max_batch,
+        export_xlsx=not args.no_export,
+        workers=args.workers,
+        use_watchdog=not args.no_watchdog,
+    ).run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,29 @@
+import os
 import sys
 import re
+import json
+import sqlite3
+import hashlib
+import tempfile
+import argparse
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from datetime import date, datetime, time
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook, load_workbook
-from openpyxl.worksheet.worksheet import Worksheet
 
 
 if sys.platform == "win32":
     import io
+    import msvcrt
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
+else:
+    import fcntl
 
 
 MERGE_DIR_NAME = "Merge_data"
@@ -18,10 +32,50 @@ OUTPUT_DIR_NAME = "output"
 MERGE_FILENAME = "merged_vrain_data.xlsx"
 MERGE_VIETNAM_FILENAME = "merged_vietnam_weather_data.xlsx"
 
+# Log cu (chi ten file); nay chi doc mot lan de chuyen sang ledger trong kho gop
 LOG_FILENAME = "merged_files_log.txt"
 LOG_VIETNAM_FILENAME = "merged_vietnam_files_log.txt"
 
-SAVE_EVERY_N_ROWS = 30000
+# Kho gop append-only; file .xlsx chi la ban export khi can
+STORE_FILENAME = "merged_store.sqlite3"
+# File nguon: .xlsx tu crawler API/Selenium, .csv tu crawler HTML Vrain (Bao_cao_*.csv)
+INPUT_SUFFIXES = (".xlsx", ".csv")
+
+CATEGORY_VIETNAM = "vietnam_weather"
+CATEGORY_OTHER = "vrain"
+CATEGORY_EXPORTS = {
+    CATEGORY_VIETNAM: MERGE_VIETNAM_FILENAME,
+    CATEGORY_OTHER: MERGE_FILENAME,
+}
+
+# Khoa mot-nguoi-ghi cho kho gop (CLI, view, watcher dung chung)
+MERGE_LOCK_FILENAME = ".merge.lock"
+EXIT_MERGE_BUSY = 3
+
+INSERT_BATCH_ROWS = 5000
+# SQLite cu gioi han 999 tham so moi cau lenh
+KEY_LOOKUP_CHUNK = 900
+
+# Mot quan trac = (tram, thoi diem du lieu); dong trung khoa bi bo khi append
+DEDUP_KEY_COLUMNS = ["Mã trạm", "Thời gian cập nhật"]
+
+# Phan vung theo thang cua thoi diem du lieu; dong khong co thoi gian vao UNKNOWN_PARTITION
+# "Thoi gian cap nhap" (sai chinh ta) la ten cot cua cac file crawl Vrain
+PARTITION_TIME_COLUMNS = ["Thời gian cập nhật", "Thời gian cập nhập", "Dấu thời gian"]
+# Dinh dang ngay gio cua file Vrain (ngay truoc thang)
+PARTITION_TIME_FORMAT = "%d/%m/%Y %H:%M"
+# Tang khi doi cach gan phan vung -> cac dong "unknown" cu duoc gan lai mot lan
+PARTITION_RULES_VERSION = 2
+PARTITION_COLUMN = "_partition"
+UNKNOWN_PARTITION = "unknown"
+PARTITIONS_DIR_NAME = "partitions"
+MANIFEST_FILENAME = "manifest.json"
+# Excel toi da 1.048.576 dong/sheet -> tach phan vung lon thanh nhieu file part
+EXCEL_MAX_ROWS = 1_000_000
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# So process doc/chuan hoa file nguon song song (ghi vao kho van chi 1 luong)
+MAX_PARSE_WORKERS = os.cpu_count() or 1
 
 MASTER_COLUMNS = [
     "Mã trạm", "Tên trạm", "Tỉnh/Thành phố", "Huyện", "Vĩ độ", "Kinh độ",
@@ -47,6 +101,49 @@ COLUMN_ALIASES = {
 }
 
 
+# Dong tien do may doc duoc (bat bang --progress): "PROGRESS <pct> <json thong ke>"
+PROGRESS_PREFIX = "PROGRESS"
+
+
+class MergeBusyError(RuntimeError):
+    """Dang co mot tien trinh khac gop vao cung kho"""
+
+
+@contextmanager
+def merge_lock(merge_dir: Path):
+    """
+    Khoa file khong chan tren Merge_data/.merge.lock; he dieu hanh tu nha khoa khi
+    tien trinh chet nen khong co khoa treo. Nem MergeBusyError neu da co nguoi giu.
+    """
+    merge_dir = Path(merge_dir)
+    merge_dir.mkdir(parents=True, exist_ok=True)
+    f = (merge_dir / MERGE_LOCK_FILENAME).open("a+")
+    try:
+        try:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise MergeBusyError(f"Kho gop dang duoc ghi boi tien trinh khac ({merge_dir})")
+
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        f.close()
+
+
 def norm_col(x) -> str:
     s = re.sub(r"\s+", " ", str(x).strip())
     return COLUMN_ALIASES.get(s, s)
@@ -67,24 +164,23 @@ def load_processed_files(log_path: Path) -> set[str]:
     return processed
 
 
-def save_processed_files(log_path: Path, processed_files: set[str]) -> None:
-    try:
-        with log_path.open("w", encoding="utf-8") as f:
-            for name in sorted(processed_files):
-                f.write(name + "\n")
-    except Exception as e:
-        print(f"Loi khi ghi log file {log_path.name}: {e}")
+def file_sha256(file_path: Path) -> str:
+    h = hashlib.sha256()
+    with file_path.open("rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
 
-def read_excel_file(file_path: Path) -> pd.DataFrame:
-    try:
-        df = pd.read_excel(file_path)
-        if df is None or df.empty:
-            return pd.DataFrame()
-        return df
-    except Exception as e:
-        print(f"Loi khi doc file {file_path.name}: {e}")
-        return pd.DataFrame()
+def read_input_file(file_path: Path) -> pd.DataFrame:
+    """Doc file nguon .xlsx (crawler API/Selenium) hoac .csv (crawler HTML Vrain)"""
+    if file_path.suffix.lower() == ".csv":
+        return pd.read_csv(file_path, encoding="utf-8-sig")
+    return pd.read_excel(file_path)
+
+
+def file_category(file_path: Path) -> str:
+    return CATEGORY_VIETNAM if file_path.name.startswith("vietnam_weather_") else CATEGORY_OTHER
 
 
 def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
@@ -100,181 +196,1146 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def get_new_excel_files(output_dir: Path, processed_files: set[str]) -> tuple[list[Path], list[Path]]:
+def compute_row_keys(df: pd.DataFrame) -> pd.Series | None:
+    """
+    Hash 64-bit (int64, de luu duoc vao SQLite) cua (Ma tram, Thoi gian cap nhat) cho tung dong.
+    Thoi gian duoc chuan hoa ve "%Y-%m-%d %H:%M:%S" de datetime va chuoi ISO cho cung khoa.
+    Dong thieu mot trong hai gia tri co khoa <NA> (khong dedup duoc); None neu df thieu cot khoa.
+    """
+    if any(c not in df.columns for c in DEDUP_KEY_COLUMNS):
+        return None
+
+    station = df[DEDUP_KEY_COLUMNS[0]]
+    when = df[DEDUP_KEY_COLUMNS[1]]
+    valid = station.notna() & when.notna()
+
+    parsed = pd.to_datetime(when, errors="coerce", format="mixed")
+    when_text = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").where(parsed.notna(), when.astype(str).str.strip())
+    parts = pd.DataFrame(
+        {"station": station.astype(str).str.strip(), "when": when_text.astype(str)},
+        index=df.index,
+    )
+
+    hashes = pd.util.hash_pandas_object(parts, index=False).to_numpy(dtype=np.uint64).view(np.int64)
+    return pd.Series(hashes, index=df.index, dtype="Int64").where(valid)
+
+
+def _parse_partition_time(values: pd.Series) -> pd.Series:
+    """
+    Doc theo dinh dang Vrain "dd/mm/YYYY HH:MM" truoc, roi ISO (YYYY-mm-dd),
+    phan con lai doc linh hoat voi ngay truoc thang.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    parsed = pd.to_datetime(values, errors="coerce", format=PARTITION_TIME_FORMAT).astype("datetime64[ns]")
+    for options in ({"format": "ISO8601"}, {"format": "mixed", "dayfirst": True}):
+        rest = parsed.isna() & values.notna()
+        if not rest.any():
+            break
+        extra = pd.to_datetime(values[rest], errors="coerce", **options)
+        if getattr(extra.dt, "tz", None) is not None:
+            extra = extra.dt.tz_localize(None)
+        parsed[rest] = extra
+    return parsed
+
+
+def compute_partitions(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """
+    Phan vung thang ("YYYY-MM") cua tung dong theo cot thoi gian dau tien co trong df,
+    kem thoi diem da chuan hoa "%Y-%m-%d %H:%M:%S" (<NA> neu khong doc duoc).
+    """
+    when = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    for col in PARTITION_TIME_COLUMNS:
+        if col in df.columns:
+            parsed = _parse_partition_time(df[col])
+            if getattr(parsed.dt, "tz", None) is not None:
+                parsed = parsed.dt.tz_localize(None)
+            when = when.fillna(parsed)
+
+    labels = when.dt.strftime("%Y-%m").fillna(UNKNOWN_PARTITION)
+    times = when.dt.strftime("%Y-%m-%d %H:%M:%S")
+    return labels, times
+
+
+def parse_input_file(file_path: Path) -> tuple[Path, pd.DataFrame | None, str | None]:
+    """
+    Doc + chuan hoa mot file nguon (chay trong process con).
+    Tra ve (file_path, df, loi); df rong neu file khong co du lieu, loi != None neu doc that bai.
+    """
+    try:
+        df = read_input_file(file_path)
+    except Exception as e:
+        return file_path, None, f"{type(e).__name__}: {e}"
+
+    if df is None or df.empty:
+        return file_path, pd.DataFrame(), None
+    return file_path, clean_dataframe(df), None
+
+
+def iter_parsed_files(file_list: list[Path], executor: ProcessPoolExecutor | None = None):
+    """
+    Doc cac file theo thu tu da sap xep. Neu co executor thi doc song song,
+    giu toi da 2 x so worker file dang cho de khong don het DataFrame vao RAM.
+    """
+    files = sorted(file_list)
+    if executor is None:
+        for file_path in files:
+            yield parse_input_file(file_path)
+        return
+
+    window = max(2, getattr(executor, "_max_workers", 1) * 2)
+    pending = deque()
+    queue = iter(files)
+
+    def _submit_next():
+        file_path = next(queue, None)
+        if file_path is not None:
+            pending.append((file_path, executor.submit(parse_input_file, file_path)))
+
+    for _ in range(window):
+        _submit_next()
+
+    while pending:
+        file_path, future = pending.popleft()
+        try:
+            yield future.result()
+        except Exception as e:
+            yield file_path, None, f"{type(e).__name__}: {e}"
+        _submit_next()
+
+
+def get_new_excel_files(
+    output_dir: Path, store: "MergeStore", candidates: list[Path] | None = None
+) -> tuple[list[dict], list[dict]]:
+    """
+    Tim file nguon chua gop: so stat (size, mtime) voi ledger truoc, chi hash khi stat doi.
+    File trung noi dung voi file da gop (doi ten, export lai) bi bo qua.
+    candidates: chi xet cac file nay thay vi quet ca thu muc (watcher da biet file nao moi).
+    Tra ve 2 list source (dict name/path/size/mtime_ns/sha256/category).
+    """
     if not output_dir.exists():
         print(f"Thu muc nguon khong ton tai: {output_dir}")
         return [], []
 
-    all_excel_files = sorted(output_dir.glob("*.xlsx"))
+    if candidates is None:
+        candidates = output_dir.iterdir()
+    all_excel_files = sorted(
+        {
+            Path(p) for p in candidates
+            if Path(p).suffix.lower() in INPUT_SUFFIXES and not Path(p).name.startswith(("~$", "."))
+            and Path(p).is_file()
+        }
+    )
     if not all_excel_files:
-        print(f"Khong tim thay file .xlsx nao trong thu muc: {output_dir}")
+        print(f"Khong tim thay file .xlsx/.csv nao trong thu muc: {output_dir}")
         return [], []
 
     vietnam_files, other_files = [], []
+    hashed = duplicated = 0
+    seen_hashes = set()
     for file_path in all_excel_files:
-        if file_path.name in processed_files:
+        try:
+            st = file_path.stat()
+        except OSError as e:
+            print(f"Khong doc duoc thong tin file {file_path.name}: {e}")
+            continue
+        if store.is_known_stat(file_path.name, st.st_size, st.st_mtime_ns):
+            continue
+
+        try:
+            digest = file_sha256(file_path)
+        except OSError as e:
+            print(f"Loi khi hash file {file_path.name}: {e}")
+            continue
+        hashed += 1
+
+        if digest in seen_hashes or store.is_merged_hash(digest):
+            # Noi dung da gop -> chi cap nhat stat de lan sau khong hash lai
+            store.remember_stat(file_path.name, st.st_size, st.st_mtime_ns, digest)
+            duplicated += 1
             continue
-        if file_path.name.startswith("vietnam_weather_"):
-            vietnam_files.append(file_path)
+        seen_hashes.add(digest)
+
+        source = {
+            "name": file_path.name,
+            "path": file_path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+            "category": file_category(file_path),
+        }
+        if source["category"] == CATEGORY_VIETNAM:
+            vietnam_files.append(source)
         else:
-            other_files.append(file_path)
+            other_files.append(source)
+    store.conn.commit()
 
-    print(f"Tong so file .xlsx trong output: {len(all_excel_files)}")
+    print(f"Tong so file .xlsx/.csv trong output: {len(all_excel_files)}")
+    print(f"So file da hash (stat thay doi): {hashed}, trung noi dung da gop: {duplicated}")
     print(f"So file vietnam_weather_ moi: {len(vietnam_files)}")
     print(f"So file khac moi: {len(other_files)}")
     return vietnam_files, other_files
 
 
-def _load_or_create_wb_ws(merge_path: Path) -> tuple[Workbook, Worksheet, list[str]]:
-    if merge_path.exists():
-        wb = load_workbook(merge_path)
-        ws = wb.active
-
-        header = []
-        max_col = ws.max_column
-        for col in range(1, max_col + 1):
-            v = ws.cell(row=1, column=col).value
-            if v is None:
-                continue
-            header.append(norm_col(v))
-
-        if not header:
-            header = list(MASTER_COLUMNS)
-            for i, col_name in enumerate(header, start=1):
-                ws.cell(row=1, column=i).value = col_name
-
-        return wb, ws, header
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "data"
-
-    header = list(MASTER_COLUMNS)
-    for i, col_name in enumerate(header, start=1):
-        ws.cell(row=1, column=i).value = col_name
-
-    wb.save(merge_path)
-    return wb, ws, header
+class MergeStore:
+    """
+    Kho gop append-only tren SQLite: moi nhom du lieu mot bang, cot theo MASTER_COLUMNS
+    (cong cac cot moi phat sinh). Moi file nguon duoc ghi trong mot transaction,
+    cung voi dong ledger cua no (merge_ledger theo sha256, merge_ledger_files theo ten file).
+    Moi dong mang cot _partition (thang du lieu); merge_partitions giu so dong, khoang thoi gian
+    va phien ban cua tung phan vung de chi export lai cac phan vung da thay doi.
+    """
+
+    def __init__(self, store_path: Path):
+        self.store_path = Path(store_path)
+        self.conn = sqlite3.connect(str(self.store_path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS store_meta (
+                category TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (category, key)
+            )
+            """
+        )
+        # Noi dung da gop (dinh danh theo sha256)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS merge_ledger (
+                sha256 TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                rows INTEGER,
+                category TEXT,
+                partition TEXT,
+                merged_at TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS merge_partitions (
+                category TEXT NOT NULL,
+                partition TEXT NOT NULL,
+                rows INTEGER NOT NULL DEFAULT 0,
+                time_min TEXT,
+                time_max TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
+                exported_version INTEGER,
+                PRIMARY KEY (category, partition)
+            )
+            """
+        )
+        # Stat gan nhat cua tung ten file -> so sanh nhanh truoc khi phai hash
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS merge_ledger_files (
+                name TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _table(self, category: str) -> str:
+        return self._quote(f"merged_{category}")
+
+    def has_category(self, category: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (f"merged_{category}",),
+        ).fetchone()
+        return row is not None
+
+    def ensure_category(self, category: str) -> list[str]:
+        if not self.has_category(category):
+            cols = ", ".join(self._quote(c) for c in MASTER_COLUMNS)
+            self.conn.execute(
+                f"CREATE TABLE {self._table(category)} (_row_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                f"{self._quote(PARTITION_COLUMN)} TEXT, {cols})"
+            )
+            self.conn.commit()
+        self.ensure_partitions(category)
+        return self.get_header(category)
+
+    def get_header(self, category: str) -> list[str]:
+        rows = self.conn.execute(f"PRAGMA table_info({self._table(category)})").fetchall()
+        return [r[1] for r in rows if r[1] not in ("_row_id", PARTITION_COLUMN)]
+
+    def ensure_partitions(self, category: str) -> None:
+        """
+        Them cot _partition (+ index) cho bang tao truoc khi co phan vung,
+        roi gan thang cho cac dong chua co phan vung (du lieu cu, file merged .xlsx cu).
+        """
+        cols = [r[1] for r in self.conn.execute(f"PRAGMA table_info({self._table(category)})")]
+        if PARTITION_COLUMN not in cols:
+            self.conn.execute(
+                f"ALTER TABLE {self._table(category)} ADD COLUMN {self._quote(PARTITION_COLUMN)} TEXT"
+            )
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self._quote(f'merged_{category}_partition_idx')} "
+            f"ON {self._table(category)} ({self._quote(PARTITION_COLUMN)})"
+        )
+
+        # Quy tac gan phan vung da doi (them cot thoi gian/dinh dang) -> gan lai cac dong "unknown"
+        if int(self.get_meta(category, "partition_rules_version", 1)) < PARTITION_RULES_VERSION:
+            self.conn.execute(
+                f"UPDATE {self._table(category)} SET {self._quote(PARTITION_COLUMN)} = NULL "
+                f"WHERE {self._quote(PARTITION_COLUMN)} = ?",
+                (UNKNOWN_PARTITION,),
+            )
+            self.conn.execute(
+                "DELETE FROM merge_partitions WHERE category = ? AND partition = ?",
+                (category, UNKNOWN_PARTITION),
+            )
+            self.set_meta(category, "partition_rules_version", PARTITION_RULES_VERSION)
+
+        time_cols = [c for c in PARTITION_TIME_COLUMNS if c in cols]
+        select_cols = ", ".join(["_row_id"] + [self._quote(c) for c in time_cols])
+        cur = self.conn.execute(
+            f"SELECT {select_cols} FROM {self._table(category)} "
+            f"WHERE {self._quote(PARTITION_COLUMN)} IS NULL"
+        )
+        labelled = 0
+        while True:
+            rows = cur.fetchmany(INSERT_BATCH_ROWS)
+            if not rows:
+                break
+            frame = pd.DataFrame(rows, columns=["_row_id"] + time_cols)
+            labels, times = compute_partitions(frame)
+            self.conn.executemany(
+                f"UPDATE {self._table(category)} SET {self._quote(PARTITION_COLUMN)} = ? WHERE _row_id = ?",
+                zip(labels.tolist(), frame["_row_id"].tolist()),
+            )
+            self.update_partitions(category, labels, times)
+            labelled += len(frame)
+
+        self.conn.commit()
+        if labelled:
+            print(f"  + Da gan phan vung thang cho {labelled} dong cu")
+
+    def update_partitions(self, category: str, labels: pd.Series, times: pd.Series) -> list[str]:
+        """Cong so dong/khoang thoi gian moi vao merge_partitions va tang version (chua commit)"""
+        if labels.empty:
+            return []
+        stats = (
+            pd.DataFrame({"partition": labels.to_numpy(), "time": times.to_numpy()})
+            .groupby("partition", dropna=False)["time"]
+            .agg(["size", "min", "max"])
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO merge_partitions (category, partition, rows, time_min, time_max, version)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (category, partition) DO UPDATE SET
+                rows = rows + excluded.rows,
+                time_min = CASE WHEN time_min IS NULL OR excluded.time_min < time_min
+                                THEN excluded.time_min ELSE time_min END,
+                time_max = CASE WHEN time_max IS NULL OR excluded.time_max > time_max
+                                THEN excluded.time_max ELSE time_max END,
+                version = version + 1
+            """,
+            [
+                (category, part, int(row["size"]),
+                 None if pd.isna(row["min"]) else row["min"],
+                 None if pd.isna(row["max"]) else row["max"])
+                for part, row in stats.iterrows()
+            ],
+        )
+        return list(stats.index)
+
+    def get_partitions(self, category: str) -> list[dict]:
+        cur = self.conn.execute(
+            "SELECT partition, rows, time_min, time_max, version, exported_version "
+            "FROM merge_partitions WHERE category = ? ORDER BY partition",
+            (category,),
+        )
+        keys = ["partition", "rows", "time_min", "time_max", "version", "exported_version"]
+        return [dict(zip(keys, row)) for row in cur.fetchall()]
+
+    def mark_partition_exported(self, category: str, partition: str, version: int) -> None:
+        self.conn.execute(
+            "UPDATE merge_partitions SET exported_version = ? WHERE category = ? AND partition = ?",
+            (version, category, partition),
+        )
+
+    def add_columns(self, category: str, cols: list[str]) -> None:
+        for c in cols:
+            self.conn.execute(f"ALTER TABLE {self._table(category)} ADD COLUMN {self._quote(c)}")
+        self.conn.commit()
+
+    def get_datetime_columns(self, category: str) -> set[str]:
+        """Cac cot tung nhan gia tri ngay gio (luu dang chuoi ISO, export lai thanh datetime)"""
+        return set(json.loads(self.get_meta(category, "datetime_columns", "[]")))
+
+    def mark_datetime_columns(self, category: str, cols) -> None:
+        current = self.get_datetime_columns(category)
+        if set(cols) - current:
+            self.set_meta(category, "datetime_columns", json.dumps(sorted(current | set(cols))))
+
+    def insert_rows(self, category: str, header: list[str], rows) -> int:
+        """Chen rows (chua commit); tra ve so dong da chen"""
+        cols = ", ".join(self._quote(c) for c in header)
+        marks = ", ".join("?" for _ in header)
+        sql = f"INSERT INTO {self._table(category)} ({cols}) VALUES ({marks})"
+
+        inserted = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH_ROWS:
+                self.conn.executemany(sql, batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            self.conn.executemany(sql, batch)
+            inserted += len(batch)
+        return inserted
+
+    def get_meta(self, category: str, key: str, default=None):
+        row = self.conn.execute(
+            "SELECT value FROM store_meta WHERE category = ? AND key = ?", (category, key)
+        ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, category: str, key: str, value) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO store_meta (category, key, value) VALUES (?, ?, ?)",
+            (category, key, str(value)),
+        )
+
+    def bump_version(self, category: str) -> int:
+        version = int(self.get_meta(category, "version", 0)) + 1
+        self.set_meta(category, "version", version)
+        return version
+
+    def is_known_stat(self, name: str, size: int, mtime_ns: int) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM merge_ledger_files f JOIN merge_ledger l ON l.sha256 = f.sha256 "
+            "WHERE f.name = ? AND f.size = ? AND f.mtime_ns = ?",
+            (name, size, mtime_ns),
+        ).fetchone()
+        return row is not None
+
+    def is_merged_hash(self, sha256: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM merge_ledger WHERE sha256 = ?", (sha256,)).fetchone()
+        return row is not None
+
+    def remember_stat(self, name: str, size: int, mtime_ns: int, sha256: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO merge_ledger_files (name, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (name, size, mtime_ns, sha256),
+        )
+
+    def record_source(self, source: dict, rows: int | None, partition: str | None) -> None:
+        """Ghi file nguon vao ledger (chua commit, di chung transaction voi du lieu)"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO merge_ledger "
+            "(sha256, name, size, mtime_ns, rows, category, partition, merged_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                source["sha256"], source["name"], source["size"], source["mtime_ns"],
+                rows, source["category"], partition,
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+        self.remember_stat(source["name"], source["size"], source["mtime_ns"], source["sha256"])
+
+    def _keys_table(self, category: str) -> str:
+        return self._quote(f"merged_{category}_keys")
+
+    def ensure_key_index(self, category: str) -> None:
+        """Tao bang khoa dedup cua nhom; lan dau thi dung lai tu cac dong da co trong kho"""
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._keys_table(category)} (key INTEGER PRIMARY KEY)"
+        )
+        if self.get_meta(category, "key_index") == "1":
+            return
+
+        header = self.get_header(category)
+        indexed = 0
+        if all(c in header for c in DEDUP_KEY_COLUMNS):
+            cols = ", ".join(self._quote(c) for c in DEDUP_KEY_COLUMNS)
+            cur = self.conn.execute(f"SELECT {cols} FROM {self._table(category)}")
+            while True:
+                rows = cur.fetchmany(INSERT_BATCH_ROWS)
+                if not rows:
+                    break
+                keys = compute_row_keys(pd.DataFrame(rows, columns=DEDUP_KEY_COLUMNS))
+                indexed += self.add_keys(category, keys.dropna().unique())
+        self.set_meta(category, "key_index", "1")
+        self.conn.commit()
+        if indexed:
+            print(f"  + Da dung chi muc khoa dedup: {indexed} khoa")
+
+    def existing_keys(self, category: str, keys) -> set[int]:
+        """Cac khoa trong keys da co trong kho (tra theo PRIMARY KEY, tung lo)"""
+        keys = [int(k) for k in keys]
+        found = set()
+        for i in range(0, len(keys), KEY_LOOKUP_CHUNK):
+            chunk = keys[i:i + KEY_LOOKUP_CHUNK]
+            marks = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(
+                f"SELECT key FROM {self._keys_table(category)} WHERE key IN ({marks})", chunk
+            ).fetchall()
+            found.update(r[0] for r in rows)
+        return found
+
+    def add_keys(self, category: str, keys) -> int:
+        """Them khoa vao chi muc (chua commit); tra ve so khoa moi"""
+        before = self.conn.total_changes
+        self.conn.executemany(
+            f"INSERT OR IGNORE INTO {self._keys_table(category)} (key) VALUES (?)",
+            ((int(k),) for k in keys),
+        )
+        return self.conn.total_changes - before
+
+    def ledger_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM merge_ledger").fetchone()[0]
+
+    def row_count(self, category: str) -> int:
+        if not self.has_category(category):
+            return 0
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self._table(category)}").fetchone()[0]
+
+    def iter_rows(
+        self, category: str, header: list[str], batch_size: int = INSERT_BATCH_ROWS, partition: str | None = None
+    ):
+        cols = ", ".join(self._quote(c) for c in header)
+        if partition is None:
+            cur = self.conn.execute(f"SELECT {cols} FROM {self._table(category)} ORDER BY _row_id")
+        else:
+            cur = self.conn.execute(
+                f"SELECT {cols} FROM {self._table(category)} "
+                f"WHERE {self._quote(PARTITION_COLUMN)} = ? ORDER BY _row_id",
+                (partition,),
+            )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
 
 
-def _ensure_header_has_columns(ws: Worksheet, header: list[str], cols_to_ensure: list[str]) -> list[str]:
-    changed = False
+def _ensure_header_has_columns(
+    store: MergeStore, category: str, header: list[str], cols_to_ensure: list[str]
+) -> list[str]:
+    new_cols = []
     for c in cols_to_ensure:
         c = norm_col(c)
-        if c not in header:
-            header.append(c)
-            ws.cell(row=1, column=len(header)).value = c
-            changed = True
-    if changed:
+        if c not in header and c not in new_cols:
+            new_cols.append(c)
+    if new_cols:
+        store.add_columns(category, new_cols)
+        header = header + new_cols
         print(f"  + Da mo rong schema, tong so cot hien tai: {len(header)}")
     return header
 
 
-def _to_excel_value(v):
+def _to_store_value(v):
     try:
         if pd.isna(v):
             return None
     except Exception:
         pass
-    if isinstance(v, pd.Timestamp):
-        return v.to_pydatetime()
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, (date, time)):
+        return v.isoformat()
+    return v
+
+
+# infer_dtype cua cot object khong the chua datetime/date/time
+_PLAIN_OBJECT_DTYPES = {"string", "integer", "floating", "mixed-integer-float", "boolean", "empty"}
+
+
+def _column_to_store_values(col: pd.Series) -> np.ndarray:
+    """Chuyen ca cot sang mang object luu duoc vao SQLite (ban vector cua _to_store_value)"""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        values = col.dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    else:
+        # Cot object tra ve view (chi doc) cua du lieu goc -> can copy truoc khi sua
+        values = col.to_numpy(dtype=object, copy=col.dtype == object)
+        # Cot object lan datetime/date/time (vd. o ngay trong Excel) -> chi chuyen cac o do
+        if col.dtype == object and pd.api.types.infer_dtype(col, skipna=True) not in _PLAIN_OBJECT_DTYPES:
+            for i, v in enumerate(values):
+                if isinstance(v, (date, time)):
+                    values[i] = _to_store_value(v)
+
+    missing = col.isna().to_numpy()
+    if missing.any():
+        values[missing] = None
+    return values
+
+
+def dataframe_to_store_rows(df: pd.DataFrame, header: list[str]):
+    """Reindex theo header mot lan, chuyen tung cot roi sinh cac dong tuple"""
+    df = df.reindex(columns=header)
+    columns = [_column_to_store_values(df.iloc[:, i]) for i in range(len(header))]
+    return zip(*columns)
+
+
+def _from_store_value(v, is_datetime: bool):
+    if is_datetime and isinstance(v, str):
+        try:
+            return datetime.fromisoformat(v)
+        except ValueError:
+            return v
     return v
 
 
 def append_df_incremental(
-    wb: Workbook,
-    ws: Worksheet,
+    store: MergeStore,
+    category: str,
     header: list[str],
     df: pd.DataFrame,
-    merge_path: Path,
-    save_every_n_rows: int = SAVE_EVERY_N_ROWS,
-) -> int:
-    for c in header:
-        if c not in df.columns:
-            df[c] = pd.NA
+    source: dict | None = None,
+) -> tuple[int, int]:
+    """
+    Ghi df vao kho gop trong mot transaction; tra ve (so dong da append, so dong trung bi bo).
+    Dong trung khoa (Ma tram, Thoi gian cap nhat) voi kho hoac voi dong truoc do trong df bi bo.
+    Neu co source thi dong ledger cua file duoc ghi trong cung transaction.
+    """
+    datetime_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+
+    keys = compute_row_keys(df)
+    new_keys = []
+    skipped = 0
+    if keys is not None:
+        has_key = keys.notna()
+        known = store.existing_keys(category, keys[has_key].unique())
+        dup = has_key & (keys.isin(known).fillna(False) | (keys.duplicated() & has_key))
+        skipped = int(dup.sum())
+        if skipped:
+            df = df.loc[~dup.to_numpy()]
+        new_keys = keys[has_key & ~dup].tolist()
+
+    labels, times = compute_partitions(df)
+    rows = dataframe_to_store_rows(df.assign(**{PARTITION_COLUMN: labels}), header + [PARTITION_COLUMN])
+    try:
+        appended = store.insert_rows(category, header + [PARTITION_COLUMN], rows)
+        store.update_partitions(category, labels, times)
+        store.add_keys(category, new_keys)
+        store.mark_datetime_columns(category, datetime_cols)
+        if appended:
+            store.bump_version(category)
+        if source is not None:
+            partitions = ",".join(sorted(labels.unique()))
+            store.record_source(source, appended, partitions or None)
+        store.conn.commit()
+    except Exception:
+        store.conn.rollback()
+        raise
+    return appended, skipped
+
+
+def _import_legacy_workbook(store: MergeStore, category: str, merge_path: Path) -> int:
+    """Chuyen file merged .xlsx cu vao kho gop (chi chay mot lan khi bang chua ton tai)"""
+    print(f"  + Chuyen file merge cu vao kho: {merge_path.name}")
+    wb = load_workbook(merge_path, read_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(values_only=True)
+        first = next(rows, None)
+        file_header = [norm_col(v) for v in first if v is not None] if first else []
+
+        header = store.ensure_category(category)
+        header = _ensure_header_has_columns(store, category, header, file_header)
+        positions = [file_header.index(c) if c in file_header else None for c in header]
+        datetime_cols = set()
+
+        def _rows():
+            for row in rows:
+                if row is None or all(v is None for v in row):
+                    continue
+                values = []
+                for col, i in zip(header, positions):
+                    v = row[i] if i is not None and i < len(row) else None
+                    if isinstance(v, datetime):
+                        datetime_cols.add(col)
+                    values.append(_to_store_value(v))
+                yield values
+
+        imported = store.insert_rows(category, header, _rows())
+        store.mark_datetime_columns(category, datetime_cols)
+        version = store.bump_version(category)
+        # File cu da khop voi kho -> khong can export lai
+        store.set_meta(category, "exported_version", version)
+        store.conn.commit()
+    finally:
+        wb.close()
+
+    store.ensure_partitions(category)
+
+    print(f"  + Da chuyen {imported} dong tu file cu")
+    return imported
+
+
+def _write_xlsx_atomic(xlsx_path: Path, header: list[str], rows, is_dt: list[bool]) -> None:
+    """Ghi workbook write-only ra file tam roi os.replace, reader khong bao gio thay file do"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("data")
+    ws.append(header)
+    for row in rows:
+        ws.append([_from_store_value(v, d) for v, d in zip(row, is_dt)])
+
+    xlsx_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=str(xlsx_path.parent), suffix=".xlsx.tmp")
+    os.close(fd)
+    try:
+        wb.save(tmp_name)
+        os.replace(tmp_name, xlsx_path)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def export_category_xlsx(store: MergeStore, category: str, xlsx_path: Path, force: bool = False) -> bool:
+    """
+    Export mot nhom du lieu ra .xlsx (workbook write-only, ghi luong).
+    Bo qua neu ban export hien co da khop phien ban kho, hoac nhom da vuot gioi han dong
+    cua Excel (khi do dung cac file phan vung); tra ve True neu da ghi file.
+    """
+    if not store.has_category(category):
+        return False
+
+    version = store.get_meta(category, "version", "0")
+    if not force and xlsx_path.exists() and store.get_meta(category, "exported_version") == version:
+        return False
+
+    total = store.row_count(category)
+    if total > EXCEL_MAX_ROWS:
+        print(f"Bo qua export {xlsx_path.name}: {total} dong vuot gioi han Excel, dung file phan vung")
+        return False
+
+    header = store.get_header(category)
+    datetime_cols = store.get_datetime_columns(category)
+    is_dt = [c in datetime_cols for c in header]
+    _write_xlsx_atomic(xlsx_path, header, store.iter_rows(category, header), is_dt)
+
+    store.set_meta(category, "exported_version", version)
+    store.conn.commit()
+    return True
+
+
+def partition_filenames(category: str, partition: str, rows: int) -> list[str]:
+    """Ten cac file cua mot phan vung; phan vung vuot EXCEL_MAX_ROWS duoc tach thanh nhieu part"""
+    parts = max(1, -(-int(rows or 0) // EXCEL_MAX_ROWS))
+    base = f"merged_{category}_{partition}"
+    return [f"{base}.xlsx"] + [f"{base}_part{i}.xlsx" for i in range(2, parts + 1)]
+
+
+def export_category_partitions(
+    store: MergeStore, category: str, partitions_dir: Path, force: bool = False
+) -> list[Path]:
+    """Export cac phan vung da thay doi ke tu lan export truoc (hoac thieu file); tra ve file da ghi"""
+    if not store.has_category(category):
+        return []
+    store.ensure_partitions(category)
+
+    header = store.get_header(category)
+    datetime_cols = store.get_datetime_columns(category)
+    is_dt = [c in datetime_cols for c in header]
+
+    written = []
+    partitions = store.get_partitions(category)
+    # Dong "unknown" da duoc gan lai het -> bo file cu de khong con du lieu trung
+    if all(part["partition"] != UNKNOWN_PARTITION for part in partitions):
+        for stale in partitions_dir.glob(f"merged_{category}_{UNKNOWN_PARTITION}*.xlsx"):
+            stale.unlink(missing_ok=True)
+
+    for part in partitions:
+        files = [partitions_dir / name for name in partition_filenames(category, part["partition"], part["rows"])]
+        up_to_date = part["exported_version"] == part["version"] and all(f.exists() for f in files)
+        if up_to_date and not force:
+            continue
+
+        rows = store.iter_rows(category, header, partition=part["partition"])
+        for path in files:
+            chunk = (row for _, row in zip(range(EXCEL_MAX_ROWS), rows))
+            _write_xlsx_atomic(path, header, chunk, is_dt)
+            written.append(path)
+
+        store.mark_partition_exported(category, part["partition"], part["version"])
+        store.conn.commit()
+    return written
+
+
+def write_partition_manifest(store: MergeStore, partitions_dir: Path) -> Path:
+    """manifest.json: moi nhom -> danh sach phan vung, file, so dong va khoang thoi gian"""
+    manifest = {"generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "categories": {}}
+    for category in CATEGORY_EXPORTS:
+        if not store.has_category(category):
+            continue
+        partitions = []
+        for part in store.get_partitions(category):
+            partitions.append(
+                {
+                    "partition": part["partition"],
+                    "files": partition_filenames(category, part["partition"], part["rows"]),
+                    "rows": part["rows"],
+                    "time_min": part["time_min"],
+                    "time_max": part["time_max"],
+                    "version": part["version"],
+                }
+            )
+        manifest["categories"][category] = {
+            "rows": sum(p["rows"] for p in partitions),
+            "partitions": partitions,
+        }
+
+    partitions_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = partitions_dir / MANIFEST_FILENAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+
+# Mot lan export tai mot thoi diem trong process (job gop, job clean va export nen dung chung)
+_EXPORT_LOCK = threading.Lock()
+_BACKGROUND_EXPORT = {"thread": None}
+
+
+def _export_merged(merge_dir: Path) -> list[Path]:
+    """Phan export cua ensure_merged_exports; nguoi goi phai dang giu merge_lock"""
+    store_path = Path(merge_dir) / STORE_FILENAME
+    if not store_path.exists():
+        return []
+
+    partitions_dir = Path(merge_dir) / PARTITIONS_DIR_NAME
+    exported = []
+    with _EXPORT_LOCK, MergeStore(store_path) as store:
+        for category, filename in CATEGORY_EXPORTS.items():
+            xlsx_path = Path(merge_dir) / filename
+            if export_category_xlsx(store, category, xlsx_path):
+                exported.append(xlsx_path)
+            exported.extend(export_category_partitions(store, category, partitions_dir))
+        if exported or not (partitions_dir / MANIFEST_FILENAME).exists():
+            write_partition_manifest(store, partitions_dir)
+    return exported
+
+
+def ensure_merged_exports(merge_dir: Path) -> list[Path]:
+    """
+    Export cac file merged .xlsx va cac phan vung thang da cu so voi kho gop, cap nhat manifest.
+    Giu merge_lock nhu mot lan gop (nem MergeBusyError neu dang co tien trinh gop/export khac).
+    Co the mat nhieu phut voi kho lon -> chi goi tu job nen/CLI; view dung ensure_merged_exports_async
+    """
+    if not (Path(merge_dir) / STORE_FILENAME).exists():
+        return []
+    with merge_lock(merge_dir):
+        return _export_merged(merge_dir)
+
+
+def ensure_merged_exports_async(merge_dir: Path) -> bool:
+    """
+    Chay ensure_merged_exports tren thread nen neu chua co thread nao dang chay va tra ve ngay;
+    view chi doc cac file da export san. Tra ve True neu vua khoi chay export moi.
+    """
+    if not (Path(merge_dir) / STORE_FILENAME).exists():
+        return False
+
+    def _run():
+        try:
+            ensure_merged_exports(merge_dir)
+        except MergeBusyError as e:
+            # Lan gop dang chay se export khi xong
+            print(f"Bo qua export nen: {e}")
+        except Exception as e:
+            print(f"WARNING: Could not export merged data: {e}")
+
+    with _EXPORT_LOCK:
+        running = _BACKGROUND_EXPORT["thread"]
+        if running is not None and running.is_alive():
+            return False
+        thread = threading.Thread(target=_run, daemon=True)
+        _BACKGROUND_EXPORT["thread"] = thread
+    thread.start()
+    return True
+
+
+def load_partition_manifest(merge_dir: Path) -> dict:
+    manifest_path = Path(merge_dir) / PARTITIONS_DIR_NAME / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {"categories": {}}
+    try:
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    except ValueError:
+        return {"categories": {}}
+
+
+def _window_bounds(start=None, end=None) -> tuple[str | None, str | None]:
+    """Chuan hoa khoang thoi gian ve chuoi "%Y-%m-%d %H:%M:%S"; end chi co ngay/thang thi lay het ngay/thang do"""
+    lo = hi = None
+    if start:
+        lo = pd.Timestamp(start).strftime("%Y-%m-%d %H:%M:%S")
+    if end:
+        ts = pd.Timestamp(end)
+        text = str(end).strip()
+        if isinstance(end, str) and len(text) <= 7:
+            ts = ts + pd.offsets.MonthEnd(0) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+        elif isinstance(end, str) and len(text) <= 10:
+            ts = ts + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+        hi = ts.strftime("%Y-%m-%d %H:%M:%S")
+    return lo, hi
+
+
+def partitions_for_window(merge_dir: Path, category: str, start=None, end=None) -> list[dict]:
+    """
+    Cac phan vung (theo manifest) giao voi khoang [start, end].
+    Phan vung khong co thoi gian chi duoc tra ve khi khong loc theo thoi gian.
+    """
+    lo, hi = _window_bounds(start, end)
+    parts = load_partition_manifest(merge_dir).get("categories", {}).get(category, {}).get("partitions", [])
+
+    selected = []
+    for part in parts:
+        if part.get("time_min") is None or part.get("time_max") is None:
+            if lo is None and hi is None:
+                selected.append(part)
+            continue
+        if lo is not None and part["time_max"] < lo:
+            continue
+        if hi is not None and part["time_min"] > hi:
+            continue
+        selected.append(part)
+    return selected
+
 
-    df = df[header]
+def partition_files_for_window(merge_dir: Path, category: str, start=None, end=None) -> list[Path]:
+    partitions_dir = Path(merge_dir) / PARTITIONS_DIR_NAME
+    return [
+        partitions_dir / name
+        for part in partitions_for_window(merge_dir, category, start, end)
+        for name in part["files"]
+    ]
 
-    appended = 0
-    buffer_count = 0
 
-    for row in df.itertuples(index=False, name=None):
-        excel_row = [_to_excel_value(x) for x in row]
-        ws.append(excel_row)
-        appended += 1
-        buffer_count += 1
+def read_merged_window(merge_dir: Path, category: str, start=None, end=None) -> pd.DataFrame:
+    """Chi doc cac file phan vung giao voi [start, end] roi loc dung khoang theo cot thoi gian"""
+    frames = [pd.read_excel(path) for path in partition_files_for_window(merge_dir, category, start, end)
+              if path.exists()]
+    if not frames:
+        return pd.DataFrame()
+    return filter_window(pd.concat(frames, ignore_index=True), start, end)
 
-        if save_every_n_rows > 0 and buffer_count >= save_every_n_rows:
-            wb.save(merge_path)
-            buffer_count = 0
 
-    wb.save(merge_path)
-    return appended
+def filter_window(df: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    """Giu cac dong co thoi gian nam trong [start, end] (khong loc neu ca hai deu trong)"""
+    lo, hi = _window_bounds(start, end)
+    if lo is None and hi is None:
+        return df
+    _, times = compute_partitions(df)
+    mask = times.notna()
+    if lo is not None:
+        mask &= times >= lo
+    if hi is not None:
+        mask &= times <= hi
+    return df.loc[mask.fillna(False).to_numpy()].reset_index(drop=True)
+
+
+def migrate_legacy_logs(store: MergeStore, output_dir: Path, log_paths: list[Path]) -> int:
+    """
+    Chuyen cac log .txt cu (chi co ten file) vao ledger, mot lan khi ledger con trong.
+    File trong log nhung khong con trong output thi khong the hash -> bo qua.
+    """
+    if store.ledger_count() > 0:
+        return 0
+
+    names = set()
+    for log_path in log_paths:
+        names |= load_processed_files(log_path)
+    if not names:
+        return 0
+
+    migrated = 0
+    for name in sorted(names):
+        file_path = output_dir / name
+        if not file_path.is_file():
+            continue
+        try:
+            st = file_path.stat()
+            digest = file_sha256(file_path)
+        except OSError as e:
+            print(f"  - Khong chuyen duoc {name} vao ledger: {e}")
+            continue
+        source = {
+            "name": name,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+            "category": file_category(file_path),
+        }
+        store.record_source(source, None, None)
+        migrated += 1
+    store.conn.commit()
+
+    print(f"Da chuyen {migrated}/{len(names)} file tu log cu vao ledger")
+    return migrated
+
+
+def parse_progress_line(line: str) -> tuple[int, dict] | None:
+    """Dong "PROGRESS <pct> <json>" -> (pct, thong ke); dong log thuong -> None"""
+    parts = line.strip().split(" ", 2)
+    if len(parts) != 3 or parts[0] != PROGRESS_PREFIX:
+        return None
+    try:
+        return int(parts[1]), json.loads(parts[2])
+    except ValueError:
+        return None
+
+
+class MergeProgress:
+    """Dem tien do mot lan gop; emit=True -> in dong PROGRESS sau moi thay doi cho tien trinh cha"""
+
+    def __init__(self, files_total: int, emit: bool = False):
+        self.emit = emit
+        self.stats = {
+            "files_total": files_total,
+            "files_done": 0,
+            "files_failed": 0,
+            "rows_appended": 0,
+            "rows_skipped": 0,
+            "current_file": None,
+        }
+        self._report()
+
+    @property
+    def pct(self) -> int:
+        total = self.stats["files_total"]
+        return int(100 * self.stats["files_done"] / total) if total else 100
+
+    def _report(self) -> None:
+        if self.emit:
+            print(f"{PROGRESS_PREFIX} {self.pct} {json.dumps(self.stats, ensure_ascii=False)}", flush=True)
+
+    def start_file(self, name: str) -> None:
+        self.stats["current_file"] = name
+        self._report()
+
+    def file_done(self, appended: int = 0, skipped: int = 0, failed: bool = False) -> None:
+        self.stats["files_done"] += 1
+        self.stats["files_failed"] += int(failed)
+        self.stats["rows_appended"] += appended
+        self.stats["rows_skipped"] += skipped
+        self._report()
 
 
 def merge_single_category_incremental(
     file_list: list[Path],
+    store: MergeStore,
+    category: str,
     merge_path: Path,
-    log_path: Path,
-    processed_files: set[str],
     category_name: str,
-) -> None:
+    executor: ProcessPoolExecutor | None = None,
+    progress: MergeProgress | None = None,
+) -> list[Path]:
+    """Gop cac file moi vao kho; tra ve danh sach file loi (chua ghi ledger, lan sau chay lai)"""
     if not file_list:
         print(f"Khong co file {category_name} moi de merge.")
-        return
+        return []
+    if progress is None:
+        progress = MergeProgress(len(file_list))
 
     print(f"\n=== MERGE INCREMENTAL: {category_name.upper()} ===")
     print(f"So luong file: {len(file_list)}")
-    print(f"File merge: {merge_path}")
+    print(f"Kho merge: {store.store_path} (bang {category})")
 
-    wb, ws, header = _load_or_create_wb_ws(merge_path)
+    if not store.has_category(category) and merge_path.exists():
+        _import_legacy_workbook(store, category, merge_path)
 
-    header = _ensure_header_has_columns(ws, header, MASTER_COLUMNS)
-    wb.save(merge_path)
+    header = store.ensure_category(category)
+    header = _ensure_header_has_columns(store, category, header, MASTER_COLUMNS)
+    store.ensure_key_index(category)
 
     ok_count = 0
-    for idx, file_path in enumerate(sorted(file_list), start=1):
+    skipped_total = 0
+    failed = []
+    sources = {src["path"]: src for src in file_list}
+    parsed = iter_parsed_files(list(sources), executor)
+    for idx, (file_path, df, error) in enumerate(parsed, start=1):
+        source = sources[file_path]
         print(f"\n[{idx}/{len(file_list)}] Dang xu ly: {file_path.name}")
+        progress.start_file(file_path.name)
 
-        df = read_excel_file(file_path)
+        if error:
+            print(f"  ✗ Loi khi doc file {file_path.name}: {error}")
+            print("  -> Khong danh dau processed (de lan sau chay lai).")
+            failed.append(file_path)
+            progress.file_done(failed=True)
+            continue
         if df.empty:
-            print("  - File rong/khong doc duoc, bo qua.")
+            print("  - File rong, ghi ledger voi 0 dong.")
+            store.record_source(source, 0, None)
+            store.conn.commit()
+            progress.file_done()
             continue
 
-        df = clean_dataframe(df)
-
         new_cols = [c for c in df.columns if c not in header]
         if new_cols:
             print(f"  + Phat hien {len(new_cols)} cot moi: {new_cols}")
-            header = _ensure_header_has_columns(ws, header, new_cols)
-            wb.save(merge_path)
+            header = _ensure_header_has_columns(store, category, header, new_cols)
 
         try:
-            appended = append_df_incremental(
-                wb=wb,
-                ws=ws,
+            appended, skipped = append_df_incremental(
+                store=store,
+                category=category,
                 header=header,
                 df=df,
-                merge_path=merge_path,
-                save_every_n_rows=SAVE_EVERY_N_ROWS,
+                source=source,
             )
             print(f"  ✓ Da append {appended} dong tu {file_path.name}")
-
-            processed_files.add(file_path.name)
-            save_processed_files(log_path, processed_files)
+            if skipped:
+                print(f"  - Bo qua {skipped} dong trung (Ma tram + Thoi gian cap nhat)")
+            skipped_total += skipped
             ok_count += 1
+            progress.file_done(appended, skipped)
         except Exception as e:
             print(f"  ✗ Loi khi append file {file_path.name}: {e}")
             print("  -> Khong danh dau processed (de lan sau chay lai).")
-
-    wb.save(merge_path)
-    print(f"\n=== XONG {category_name}: OK {ok_count}/{len(file_list)} file ===")
-
-
-def merge_excel_files_once(base_dir: Path) -> None:
+            failed.append(file_path)
+            progress.file_done(failed=True)
+
+    print(f"\n=== XONG {category_name}: OK {ok_count}/{len(file_list)} file, bo qua {skipped_total} dong trung ===")
+    return failed
+
+
+def merge_excel_files_once(
+    base_dir: Path,
+    export_xlsx: bool = False,
+    workers: int = MAX_PARSE_WORKERS,
+    files: list[Path] | None = None,
+    progress_lines: bool = False,
+) -> list[Path]:
+    """
+    Gop cac file moi trong output/ (hoac chi `files`); tra ve danh sach file loi chua duoc gop.
+    progress_lines=True -> in them dong PROGRESS cho tien trinh cha (view gop du lieu).
+    """
     output_dir = base_dir / OUTPUT_DIR_NAME
     merge_dir = base_dir / MERGE_DIR_NAME
     merge_dir.mkdir(parents=True, exist_ok=True)
+    store_path = merge_dir / STORE_FILENAME
 
     merge_vietnam_path = merge_dir / MERGE_VIETNAM_FILENAME
     log_vietnam_path = merge_dir / LOG_VIETNAM_FILENAME
@@ -282,37 +1343,64 @@ def merge_excel_files_once(base_dir: Path) -> None:
     merge_other_path = merge_dir / MERGE_FILENAME
     log_other_path = merge_dir / LOG_FILENAME
 
-    print("======== BAT DAU MERGE =========")
-    print(f"Thu muc nguon (output):     {output_dir}")
-    print(f"Thu muc merge (Merge_data): {merge_dir}")
-    print("================================")
-
-    processed_vietnam = load_processed_files(log_vietnam_path)
-    processed_other = load_processed_files(log_other_path)
+    # Chi mot tien trinh duoc ghi vao kho tai mot thoi diem
+    with merge_lock(merge_dir):
+        print("======== BAT DAU MERGE =========")
+        print(f"Thu muc nguon (output):     {output_dir}")
+        print(f"Thu muc merge (Merge_data): {merge_dir}")
+        print("================================")
+
+        with MergeStore(store_path) as store:
+            migrate_legacy_logs(store, output_dir, [log_vietnam_path, log_other_path])
+            vietnam_files, other_files = get_new_excel_files(output_dir, store, files)
+            progress = MergeProgress(len(vietnam_files) + len(other_files), emit=progress_lines)
+
+            workers = max(1, min(int(workers), len(vietnam_files) + len(other_files)))
+            executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            if executor:
+                print(f"Doc file song song: {workers} process")
+
+            try:
+                failed = merge_single_category_incremental(
+                    vietnam_files,
+                    store,
+                    CATEGORY_VIETNAM,
+                    merge_vietnam_path,
+                    "vietnam_weather_",
+                    executor,
+                    progress,
+                )
+
+                failed += merge_single_category_incremental(
+                    other_files,
+                    store,
+                    CATEGORY_OTHER,
+                    merge_other_path,
+                    "khac",
+                    executor,
+                    progress,
+                )
+            finally:
+                if executor:
+                    executor.shutdown()
+
+        if export_xlsx:
+            for path in _export_merged(merge_dir):
+                print(f"Da export: {path.name}")
+
+        print("\n======== KET THUC MERGE =========")
+    return failed
 
-    processed_all = processed_vietnam.union(processed_other)
-    vietnam_files, other_files = get_new_excel_files(output_dir, processed_all)
 
-    merge_single_category_incremental(
-        vietnam_files,
-        merge_vietnam_path,
-        log_vietnam_path,
-        processed_vietnam,
-        "vietnam_weather_"
-    )
-
-    merge_single_category_incremental(
-        other_files,
-        merge_other_path,
-        log_other_path,
-        processed_other,
-        "khac"
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gop cac file output vao kho merge")
+    parser.add_argument("--export", action="store_true", help="Export file merged .xlsx sau khi gop")
+    parser.add_argument(
+        "--workers", type=int, default=MAX_PARSE_WORKERS, help="So process doc file nguon song song"
     )
+    parser.add_argument("--progress", action="store_true", help="In dong PROGRESS <pct> <json> cho tien trinh cha")
+    args = parser.parse_args()
 
-    print("\n======== KET THUC MERGE =========")
-
-
-if __name__ == "__main__":
     SCRIPT_DIR = Path(__file__).parent
     BASE_DIR = SCRIPT_DIR.parent
 
@@ -324,4 +1412,10 @@ if __name__ == "__main__":
         print(f"ERROR: Khong tim thay thu muc output tai: {output_dir}")
         sys.exit(1)
 
-    merge_excel_files_once(BASE_DIR)
+    try:
+        merge_excel_files_once(
+            BASE_DIR, export_xlsx=args.export, workers=args.workers, progress_lines=args.progress
+        )
+    except MergeBusyError as e:
+        print(f"ERROR: {e}")
+        sys.exit(EXIT_MERGE_BUSY)
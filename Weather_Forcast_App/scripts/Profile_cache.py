@@ -0,0 +1,146 @@
+"""
+Cache profile của file dữ liệu (missing report, dtype, số dòng, heatmap) trong một SQLite nhỏ.
+
+Khóa là đường dẫn tuyệt đối; profile chỉ hợp lệ khi (size, mtime_ns) còn khớp, hoặc khi mtime đổi
+nhưng nội dung (sha256) vẫn như cũ (file được copy/touch lại). sha256 chỉ được tính khi lưu một
+phiên bản file mới; cập nhật profile của file chưa đổi dùng lại hash đã lưu. Vượt giới hạn số mục hoặc dung lượng
+thì xóa các profile lâu không dùng nhất (LRU theo last_used).
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import closing
+
+
+CACHE_PATH = Path(__file__).resolve().parent.parent / "runtime" / "profile_cache.sqlite3"
+MAX_ENTRIES = 256
+MAX_BYTES = 64 * 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ProfileCache:
+    """Mỗi thao tác mở một kết nối riêng -> dùng được từ nhiều thread của Django"""
+
+    def __init__(self, cache_path: Path = CACHE_PATH, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.cache_path = Path(cache_path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.cache_path), timeout=30)
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS file_profiles (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            sha256 TEXT,
+                            payload TEXT NOT NULL,
+                            bytes INTEGER NOT NULL,
+                            last_used REAL NOT NULL
+                        )
+                        """
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_profiles_last_used ON file_profiles(last_used)")
+                    conn.commit()
+                    self._ready = True
+        return conn
+
+    def get(self, path) -> dict | None:
+        """Profile của file nếu còn đúng phiên bản, ngược lại None"""
+        path = Path(path).resolve()
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        if not self.cache_path.parent.exists():
+            return None
+
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT size, mtime_ns, sha256, payload FROM file_profiles WHERE path = ?",
+                (str(path),),
+            ).fetchone()
+            if row is None:
+                return None
+
+            size, mtime_ns, sha256, payload = row
+            if size != st.st_size:
+                return None
+            if mtime_ns != st.st_mtime_ns:
+                # Cùng kích thước nhưng mtime khác: chỉ dùng lại nếu nội dung không đổi
+                if not sha256 or _sha256(path) != sha256:
+                    return None
+                conn.execute("UPDATE file_profiles SET mtime_ns = ? WHERE path = ?", (st.st_mtime_ns, str(path)))
+
+            conn.execute("UPDATE file_profiles SET last_used = ? WHERE path = ?", (time.time(), str(path)))
+            conn.commit()
+        return json.loads(payload)
+
+    def put(self, path, profile: dict) -> None:
+        path = Path(path).resolve()
+        st = path.stat()
+        payload = json.dumps(profile, ensure_ascii=False, default=str)
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT size, mtime_ns, sha256 FROM file_profiles WHERE path = ?", (str(path),)).fetchone()
+            if row and row[2] and (row[0], row[1]) == (st.st_size, st.st_mtime_ns):
+                # Cùng phiên bản file (vd. update thêm số dòng) -> dùng lại hash, không đọc lại cả file
+                sha256 = row[2]
+            else:
+                sha256 = _sha256(path)
+                # File bị ghi trong lúc đang profile -> không lưu profile có thể đã cũ
+                if path.stat().st_mtime_ns != st.st_mtime_ns:
+                    return
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO file_profiles (path, size, mtime_ns, sha256, payload, bytes, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (str(path), st.st_size, st.st_mtime_ns, sha256, payload, len(payload.encode("utf-8")), time.time()),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def update(self, path, **fields) -> dict:
+        """Bổ sung trường vào profile hiện tại (nếu còn hợp lệ) rồi lưu lại"""
+        profile = self.get(path) or {}
+        profile.update(fields)
+        self.put(path, profile)
+        return profile
+
+    def _evict(self, conn) -> None:
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM file_profiles").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for path, size in conn.execute("SELECT path, bytes FROM file_profiles ORDER BY last_used ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM file_profiles WHERE path = ?", (path,))
+            count -= 1
+            total -= size
+
+
+_DEFAULT_CACHE = ProfileCache()
+
+
+def get_profile_cache() -> ProfileCache:
+    return _DEFAULT_CACHE
@@ -0,0 +1,316 @@
+"""
+Tiện ích trình duyệt dùng chung cho các crawler Selenium của Vrain.
+"""
+import re
+import json
+import html
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Những gì không cần cho dữ liệu trạm: ảnh, font, CSS, tile bản đồ, analytics
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+    "*.pbf", "*tile*", "*windy.com*", "*openstreetmap*", "*mapbox*", "*arcgis*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*facebook.com/tr*", "*hotjar*", "*clarity.ms*",
+]
+
+DEFAULT_BLOCKED_CONTENT_SETTINGS = {
+    "images": 2,
+    "notifications": 2,
+    "geolocation": 2,
+    "media_stream": 2,
+    "popups": 2,
+}
+
+# Kích thước ước lượng (byte) của mỗi loại tài nguyên bị chặn, dùng để tính dung lượng tiết kiệm
+ESTIMATED_RESOURCE_BYTES = {
+    "Image": 25_000,
+    "Font": 40_000,
+    "Stylesheet": 30_000,
+    "Script": 60_000,
+    "XHR": 5_000,
+    "Fetch": 5_000,
+    "Other": 10_000,
+}
+
+STATIC_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "vi-VN,vi;q=0.9,en-US;q=0.8,en;q=0.7",
+}
+
+EMBEDDED_JSON_RE = re.compile(
+    r"<script[^>]*type=[\"']application/json[\"'][^>]*>(.*?)</script>", re.DOTALL | re.I
+)
+TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.DOTALL | re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+
+# Angular TransferState escape các ký tự đặc biệt trong JSON nhúng
+_TRANSFER_STATE_ESCAPES = {"&q;": '"', "&s;": "'", "&l;": "<", "&g;": ">", "&a;": "&"}
+_TRANSFER_STATE_RE = re.compile("|".join(map(re.escape, _TRANSFER_STATE_ESCAPES)))
+
+
+class DriverPool:
+    """
+    Pool WebDriver theo thread: mỗi worker giữ một Chrome sống lâu,
+    kiểm tra sức khỏe giữa các trang, thay mới sau N trang hoặc khi bị crash,
+    và đóng toàn bộ khi shutdown().
+    """
+
+    def __init__(self, create_driver, max_pages_per_driver=25):
+        self.create_driver = create_driver
+        self.max_pages_per_driver = max_pages_per_driver
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._drivers = set()
+        self._generation = 0
+        self.stats = {"created": 0, "recycled": 0, "crashed": 0, "pages": 0}
+
+    def _is_alive(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _close_current(self, reason):
+        driver = getattr(self._local, "driver", None)
+        self._local.driver = None
+        self._local.pages = 0
+        if driver is None:
+            return
+
+        with self._lock:
+            self._drivers.discard(driver)
+            self.stats[reason] += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Lấy driver của thread hiện tại, tạo mới nếu chưa có, đã hỏng hoặc đủ số trang"""
+        driver = getattr(self._local, "driver", None)
+
+        # Driver của lần chạy trước shutdown() -> bỏ, không quit lại
+        if driver is not None and getattr(self._local, "generation", None) != self._generation:
+            self._local.driver = None
+            driver = None
+
+        if driver is not None:
+            if self._local.pages >= self.max_pages_per_driver:
+                self._close_current("recycled")
+                driver = None
+            elif not self._is_alive(driver):
+                self._close_current("crashed")
+                driver = None
+
+        if driver is None:
+            driver = self.create_driver()
+            self._local.driver = driver
+            self._local.pages = 0
+            self._local.generation = self._generation
+            with self._lock:
+                self._drivers.add(driver)
+                self.stats["created"] += 1
+
+        self._local.pages += 1
+        with self._lock:
+            self.stats["pages"] += 1
+        return driver
+
+    def discard(self):
+        """Bỏ driver hiện tại của thread (sau lỗi), lần acquire() sau sẽ tạo driver mới"""
+        self._close_current("crashed")
+
+    def shutdown(self):
+        """Đóng toàn bộ driver đang mở"""
+        with self._lock:
+            drivers = list(self._drivers)
+            self._drivers.clear()
+            self._generation += 1
+
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
+
+
+class ResourceBlocker:
+    """
+    Hồ sơ chặn tài nguyên cho Chrome headless: prefs chặn nội dung +
+    CDP Network.setBlockedURLs, kèm bộ đếm request bị chặn và dung lượng tiết kiệm (ước lượng).
+    """
+
+    def __init__(self, url_patterns=None, content_settings=None):
+        self.url_patterns = list(
+            DEFAULT_BLOCKED_URL_PATTERNS if url_patterns is None else url_patterns
+        )
+        self.content_settings = dict(
+            DEFAULT_BLOCKED_CONTENT_SETTINGS if content_settings is None else content_settings
+        )
+        self._lock = threading.Lock()
+        self.stats = {"blocked_requests": 0, "bytes_saved_est": 0, "by_type": {}}
+
+    def apply_options(self, chrome_options):
+        """Thêm prefs chặn nội dung và bật performance log (để đếm request bị chặn)"""
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.default_content_setting_values": self.content_settings}
+        )
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    def apply_driver(self, driver):
+        """Bật chặn URL qua CDP; chỉ cần gọi một lần cho mỗi driver"""
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.url_patterns})
+
+    def record(self, log_entries):
+        """Đếm các request bị chặn (Network.loadingFailed có blockedReason) trong performance log"""
+        blocked, saved, by_type = 0, 0, {}
+        for entry in log_entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except Exception:
+                continue
+            if message.get("method") != "Network.loadingFailed":
+                continue
+
+            params = message.get("params", {})
+            if not params.get("blockedReason"):
+                continue
+
+            resource_type = params.get("type", "Other")
+            blocked += 1
+            saved += ESTIMATED_RESOURCE_BYTES.get(resource_type, ESTIMATED_RESOURCE_BYTES["Other"])
+            by_type[resource_type] = by_type.get(resource_type, 0) + 1
+
+        with self._lock:
+            self.stats["blocked_requests"] += blocked
+            self.stats["bytes_saved_est"] += saved
+            for resource_type, count in by_type.items():
+                self.stats["by_type"][resource_type] = (
+                    self.stats["by_type"].get(resource_type, 0) + count
+                )
+        return blocked
+
+    def summary(self):
+        """Chuỗi tóm tắt để in log"""
+        stats = self.stats
+        by_type = ", ".join(f"{k}: {v}" for k, v in sorted(stats["by_type"].items()))
+        return (
+            f"chặn {stats['blocked_requests']} request, "
+            f"tiết kiệm ~{stats['bytes_saved_est'] / (1024 * 1024):.1f} MB"
+            + (f" ({by_type})" if by_type else "")
+        )
+
+
+class StaticFetcher:
+    """
+    GET tĩnh bằng một requests.Session dùng chung (pool kết nối keep-alive),
+    dùng để thử HTML render sẵn trước khi phải mở Chrome.
+    """
+
+    def __init__(self, pool_size=8, timeout=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(STATIC_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url):
+        """Trả về HTML của url; lỗi HTTP được ném ra để caller chuyển sang Selenium"""
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+
+def extract_embedded_json(page_html):
+    """Đọc các thẻ <script type="application/json"> (kể cả Angular TransferState) thành list payload"""
+    payloads = []
+    for raw in EMBEDDED_JSON_RE.findall(page_html or ""):
+        raw = raw.strip()
+        if not raw:
+            continue
+        if raw.startswith("{&q;") or raw.startswith("[&q;"):
+            raw = _TRANSFER_STATE_RE.sub(lambda m: _TRANSFER_STATE_ESCAPES[m.group(0)], raw)
+        try:
+            payloads.append(json.loads(raw))
+        except ValueError:
+            continue
+    return payloads
+
+
+def extract_title(page_html):
+    """Lấy nội dung thẻ <title> từ HTML tĩnh"""
+    match = TITLE_RE.search(page_html or "")
+    return html.unescape(match.group(1)).strip() if match else ""
+
+
+def html_to_text(page_html):
+    """Bỏ thẻ HTML, giữ lại text thô (đủ cho các regex ngày/giờ)"""
+    return html.unescape(TAG_RE.sub(" ", page_html or ""))
+
+
+def wait_for_stable_count(driver, css_selector, timeout=15, poll_interval=0.5, min_count=1):
+    """
+    Chờ đến khi có ít nhất min_count phần tử khớp css_selector và số lượng
+    không đổi qua hai lần poll liên tiếp (mỗi lần poll là một lệnh execute_script).
+    Trả về (số phần tử, số giây đã chờ); hết timeout thì trả về số phần tử hiện có.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    last_count = -1
+    count = 0
+
+    while True:
+        count = driver.execute_script(
+            "return document.querySelectorAll(arguments[0]).length", css_selector
+        )
+        if count >= min_count and count == last_count:
+            break
+        if time.monotonic() >= deadline:
+            break
+        last_count = count
+        time.sleep(poll_interval)
+
+    return count, time.monotonic() - start
+
+
+def wait_for_text(driver, pattern, timeout=15, poll_interval=0.5):
+    """
+    Chờ đến khi innerText của body khớp regex pattern.
+    Trả về (text của body, số giây đã chờ); hết timeout thì trả về text hiện có.
+    """
+    regex = re.compile(pattern)
+    start = time.monotonic()
+    deadline = start + timeout
+    text = ""
+
+    while True:
+        text = driver.execute_script(
+            "return document.body ? document.body.innerText : ''"
+        ) or ""
+        if regex.search(text) or time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+
+    return text, time.monotonic() - start
@@ -0,0 +1,123 @@
+"""
+Server tĩnh phục vụ bộ fixture Vrain (TEST/vrain_fixtures) theo đúng đường dẫn của vrain.vn,
+để chạy crawler và benchmark parser offline: đặt base_url = http://127.0.0.1:<port>.
+
+    /landing                 -> landing.html
+    /<id>/overview?...       -> pages/<id>.html
+    /api/<tên>               -> api/<tên>(.json)
+"""
+import sys
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = Path(__file__).resolve().parents[1] / "TEST" / "vrain_fixtures"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+}
+
+
+def resolve_fixture(fixtures_dir, path):
+    """Ánh xạ đường dẫn URL sang file fixture, None nếu không có"""
+    parts = [p for p in urlsplit(path).path.split("/") if p]
+
+    if parts == ["landing"]:
+        candidate = fixtures_dir / "landing.html"
+    elif len(parts) == 2 and parts[1] == "overview" and parts[0].isdigit():
+        candidate = fixtures_dir / "pages" / f"{parts[0]}.html"
+    elif len(parts) >= 2 and parts[0] == "api":
+        name = "_".join(parts[1:])
+        candidate = fixtures_dir / "api" / (name if name.endswith(".json") else f"{name}.json")
+    else:
+        return None
+
+    candidate = candidate.resolve()
+    if fixtures_dir.resolve() not in candidate.parents or not candidate.is_file():
+        return None
+    return candidate
+
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    fixtures_dir = FIXTURES_DIR
+    verbose = False
+
+    def do_GET(self):
+        fixture = resolve_fixture(self.fixtures_dir, self.path)
+        if fixture is None:
+            # Reason phrase của status line phải là latin-1
+            self.send_error(404, "Fixture not found")
+            return
+
+        body = fixture.read_bytes()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        # Hỗ trợ request có điều kiện để thử cache ETag của crawler
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(fixture.suffix, "application/octet-stream"))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def start_fixture_server(host="127.0.0.1", port=0, fixtures_dir=FIXTURES_DIR, verbose=False):
+    """
+    Chạy server fixture trong một thread nền (port=0 để hệ điều hành tự chọn).
+    Trả về server; server.base_url là địa chỉ dùng thay cho https://www.vrain.vn,
+    gọi server.shutdown() để dừng.
+    """
+    handler = type(
+        "BoundFixtureRequestHandler",
+        (FixtureRequestHandler,),
+        {"fixtures_dir": Path(fixtures_dir), "verbose": verbose},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server fixture Vrain cho crawl/benchmark offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR))
+    args = parser.parse_args()
+
+    fixtures_dir = Path(args.fixtures)
+    if not fixtures_dir.exists():
+        print(f"❌ Không tìm thấy thư mục fixture: {fixtures_dir}")
+        sys.exit(1)
+
+    handler = type(
+        "BoundFixtureRequestHandler",
+        (FixtureRequestHandler,),
+        {"fixtures_dir": fixtures_dir, "verbose": True},
+    )
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"🌐 Đang phục vụ {fixtures_dir} tại http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from django.urls import path
 from .views.Home import home_view
 from .views.View_Crawl_data_by_API import crawl_api_weather_view, api_weather_logs_view
 from .views.View_Datasets import datasets_view, dataset_download_view, dataset_view_view
-from .views.View_Merge_Data import merge_data_view
+from .views.View_Merge_Data import merge_data_view, merge_data_tail_view
 from .views.View_Clear import clean_data_view
 from .views.View_Crawl_data_from_html_of_Vrain import (
     crawl_vrain_html_view,
@@ -60,6 +60,7 @@ urlpatterns = [
     path("datasets/download/<str:folder>/<str:filename>/", dataset_download_view, name="dataset_download"),
     
     path("datasets/merge/", merge_data_view, name="merge_data"),
+    path("datasets/merge/tail/", merge_data_tail_view, name="merge_tail"),
     
     path("datasets/clean/", clean_data_view, name="clean_data"),
     path("datasets/clean/list/", clean_files_list_view, name="clean_list"),
@@ -5,11 +5,27 @@ from pathlib import Path
 from datetime import datetime
 
 import pandas as pd
-import numpy as np
 
 from django.http import JsonResponse, HttpResponseNotAllowed, Http404
 from django.views.decorators.http import require_http_methods
 
+from Weather_Forcast_App.scripts.Chunked_cleaner import (
+    VIEW_CLEAN_RULES,
+    ChunkedCleaner,
+    iter_file_chunks,
+    iter_files_chunks,
+)
+from Weather_Forcast_App.scripts.Merge_xlsx import (
+    CATEGORY_EXPORTS,
+    CATEGORY_VIETNAM,
+    MergeBusyError,
+    ensure_merged_exports,
+    ensure_merged_exports_async,
+    filter_window,
+    partition_files_for_window,
+    partitions_for_window,
+)
+
 
 APP_ROOT = Path(__file__).resolve().parents[1]
 MERGE_DIR = APP_ROOT / "Merge_data"
@@ -89,101 +105,20 @@ def _scan_files(directory: Path):
     return items
 
 
-def _load_df(file_path: Path, job_id: str) -> pd.DataFrame:
-    _push(job_id, f"[INFO] Đang đọc file: {file_path.name}")
-    if file_path.suffix.lower() in [".xlsx", ".xls"]:
-        return pd.read_excel(file_path)
-    # csv
-    return pd.read_csv(file_path, encoding="utf-8-sig", low_memory=False)
-
-
-def _clean_dataframe(df: pd.DataFrame, job_id: str):
-    """
-    Clean “an toàn” cho nhiều nguồn:
-    - trim string
-    - convert numeric nếu có thể
-    - parse datetime nếu tên cột gợi ý
-    - fill missing: numeric->median, text->mode/"unknown"
-    - drop duplicates
-    """
-    report = {}
-
-    _push(job_id, f"[INFO] Shape ban đầu: rows={len(df)} cols={df.shape[1]}")
-    report["rows_before"] = int(len(df))
-    report["cols"] = int(df.shape[1])
-
-    _set_progress(job_id, 15, "Profiling missing/duplicates")
-    missing_before = int(df.isna().sum().sum())
-    dup_before = int(df.duplicated().sum())
-    report["missing_before"] = missing_before
-    report["duplicates_before"] = dup_before
-    _push(job_id, f"[INFO] Missing trước: {missing_before}")
-    _push(job_id, f"[INFO] Duplicate trước: {dup_before}")
-
-    _set_progress(job_id, 30, "Chuẩn hoá string & numeric")
-    obj_cols = df.select_dtypes(include=["object"]).columns
-    for c in obj_cols:
-        df[c] = df[c].astype(str).str.strip().replace({"nan": np.nan, "None": np.nan, "": np.nan})
-
-    for c in obj_cols:
-        s = pd.to_numeric(df[c].str.replace(",", ".", regex=False), errors="coerce")
-        if s.notna().sum() >= max(5, int(0.6 * len(df[c].dropna()))):
-            df[c] = s
-
-    _set_progress(job_id, 45, "Parse datetime (nếu có)")
-    candidates = []
-    for c in df.columns:
-        name = str(c).lower()
-        if any(k in name for k in ["time", "date", "timestamp", "ngày", "giờ", "cap nhat", "cập nhật"]):
-            candidates.append(c)
-
-    for c in candidates:
-        try:
-            parsed = pd.to_datetime(df[c], errors="coerce", dayfirst=True, utc=False)
-            if parsed.notna().sum() >= max(5, int(0.3 * len(df))):
-                df[c] = parsed
-                _push(job_id, f"[INFO] Parsed datetime column: {c}")
-        except Exception:
-            pass
-
-    _set_progress(job_id, 60, "Impute missing")
-    num_cols = df.select_dtypes(include=[np.number]).columns
-    obj_cols = df.select_dtypes(include=["object"]).columns
-
-    for c in num_cols:
-        med = df[c].median(skipna=True)
-        if pd.isna(med):
-            med = 0
-        df[c] = df[c].fillna(med)
-
-    for c in obj_cols:
-        mode = None
-        try:
-            mode = df[c].mode(dropna=True)
-            mode = mode.iloc[0] if not mode.empty else None
-        except Exception:
-            mode = None
-        df[c] = df[c].fillna(mode if mode is not None else "unknown")
+def _merge_category(filename: str | None) -> str:
+    """Nhóm dữ liệu trong kho gộp ứng với file merged được chọn (mặc định vietnam_weather)"""
+    for category, export_name in CATEGORY_EXPORTS.items():
+        if filename and (filename == export_name or Path(filename).name.startswith(f"merged_{category}_")):
+            return category
+    return CATEGORY_VIETNAM
 
-    _set_progress(job_id, 75, "Drop duplicates")
-    before = len(df)
-    df = df.drop_duplicates()
-    removed = before - len(df)
-    report["duplicates_removed"] = int(removed)
-    _push(job_id, f"[INFO] Removed duplicates: {removed}")
 
-    _set_progress(job_id, 90, "Final check")
-    missing_after = int(df.isna().sum().sum())
-    report["missing_after"] = missing_after
-    report["rows_after"] = int(len(df))
-    _push(job_id, f"[INFO] Missing sau: {missing_after}")
-    _push(job_id, f"[INFO] Shape sau: rows={len(df)} cols={df.shape[1]}")
+def _read_window(payload_get, key: str) -> str | None:
+    value = (payload_get(key) or "").strip()
+    return value or None
 
-    _set_progress(job_id, 95, "Done cleaning")
-    return df, report
 
-
-def _worker(job_id: str, source: str, filename: str | None):
+def _worker(job_id: str, source: str, filename: str | None, start: str | None = None, end: str | None = None):
     try:
         _push(job_id, "========== START CLEAN ==========")
         _push(job_id, f"[INFO] source={source}")
@@ -198,6 +133,12 @@ def _worker(job_id: str, source: str, filename: str | None):
             in_dir = MERGE_DIR
             out_dir = CLEANED_MERGE_DIR
             out_folder_key = "cleaned_merge"
+            try:
+                for path in ensure_merged_exports(MERGE_DIR):
+                    _push(job_id, f"[INFO] Export lại từ kho gộp: {path.name}")
+            except MergeBusyError:
+                # File export được ghi nguyên tử nên bản hiện có vẫn đọc được, chỉ có thể chưa có dữ liệu mới nhất
+                _push(job_id, "[WARN] Kho gộp đang được gộp, làm sạch từ file export hiện có")
         elif source == "output":
             in_dir = OUTPUT_DIR
             out_dir = CLEANED_RAW_DIR
@@ -205,26 +146,40 @@ def _worker(job_id: str, source: str, filename: str | None):
         else:
             raise ValueError("Invalid source")
 
-        if not filename:
-            items = _scan_files(in_dir)
-            if not items:
-                raise FileNotFoundError("Không có file nào trong thư mục nguồn.")
-            filename = items[0]["name"]
-
-        file_path = _safe_pick_file(in_dir, filename)
-
-        _set_progress(job_id, 10, "Đọc dữ liệu")
-        df = _load_df(file_path, job_id)
+        if source == "merge" and (start or end):
+            # Chỉ mở các file phân vùng tháng giao với khoảng thời gian được chọn
+            category = _merge_category(filename)
+            parts = partitions_for_window(MERGE_DIR, category, start, end)
+            _push(job_id, f"[INFO] Khoảng thời gian: {start or '...'} → {end or '...'} ({len(parts)} phân vùng)")
+            paths = [p for p in partition_files_for_window(MERGE_DIR, category, start, end) if p.exists()]
+            if not paths:
+                raise FileNotFoundError("Không có dữ liệu đã gộp trong khoảng thời gian này.")
+            window = "_".join(v.replace(":", "").replace(" ", "T") for v in (start or "begin", end or "end"))
+            file_path = Path(f"merged_{category}_{window}")
+            chunk_source = lambda: iter_files_chunks(paths, chunk_filter=lambda df: filter_window(df, start, end))
+        else:
+            if not filename:
+                items = _scan_files(in_dir)
+                if not items:
+                    raise FileNotFoundError("Không có file nào trong thư mục nguồn.")
+                filename = items[0]["name"]
 
-        _set_progress(job_id, 20, "Clean dữ liệu")
-        df2, report = _clean_dataframe(df, job_id)
+            file_path = _safe_pick_file(in_dir, filename)
+            _push(job_id, f"[INFO] Đang đọc file theo khúc: {file_path.name}")
+            chunk_source = lambda: iter_file_chunks(file_path)
 
-        _set_progress(job_id, 96, "Ghi file output")
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         stem = file_path.stem
         out_name = f"cleaned_{source}_{stem}_{ts}.csv"
         out_path = out_dir / out_name
-        df2.to_csv(out_path, index=False, encoding="utf-8-sig")
+
+        # Hai lượt theo khúc: thống kê -> chuẩn hoá/điền thiếu/ghi nối dần, không nạp cả file vào RAM
+        cleaner = ChunkedCleaner(
+            VIEW_CLEAN_RULES,
+            log=lambda line: _push(job_id, line),
+            progress=lambda pct, step: _set_progress(job_id, pct, step),
+        )
+        report = cleaner.clean(chunk_source, out_path)
 
         size_mb = round(out_path.stat().st_size / (1024 * 1024), 2)
         _push(job_id, f"[INFO] Saved: {out_name} ({size_mb} MB)")
@@ -263,6 +218,8 @@ def _worker(job_id: str, source: str, filename: str | None):
 def clean_files_list_view(request):
     source = (request.GET.get("source") or "").strip().lower()
     if source == "merge":
+        # Không export trong request: export chạy nền, danh sách là các file đã có
+        ensure_merged_exports_async(MERGE_DIR)
         items = _scan_files(MERGE_DIR)
     elif source == "output":
         items = _scan_files(OUTPUT_DIR)
@@ -285,13 +242,22 @@ def clean_data_start_view(request):
             payload = {}
         source = (payload.get("source") or "").strip().lower()
         filename = (payload.get("filename") or "").strip() or None
+        start, end = _read_window(payload.get, "start"), _read_window(payload.get, "end")
     else:
         source = (request.POST.get("source") or "").strip().lower()
         filename = (request.POST.get("filename") or "").strip() or None
+        start, end = _read_window(request.POST.get, "start"), _read_window(request.POST.get, "end")
 
     if source not in ("merge", "output"):
         return JsonResponse({"ok": False, "message": "source phải là merge hoặc output"}, status=400)
 
+    try:
+        for value in (start, end):
+            if value:
+                pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return JsonResponse({"ok": False, "message": "start/end phải là ngày giờ hợp lệ (vd. 2026-10 hoặc 2026-10-01)"}, status=400)
+
     job_id = uuid.uuid4().hex
     with _JOBS_LOCK:
         _JOBS[job_id] = {
@@ -305,7 +271,7 @@ def clean_data_start_view(request):
             "result": None,
         }
 
-    t = threading.Thread(target=_worker, args=(job_id, source, filename), daemon=True)
+    t = threading.Thread(target=_worker, args=(job_id, source, filename, start, end), daemon=True)
     t.start()
     return JsonResponse({"ok": True, "job_id": job_id})
 
@@ -1,18 +1,19 @@
-import os
-import sys
 import threading
-import subprocess
 from pathlib import Path
 from datetime import datetime
 
 from django.http import JsonResponse, HttpResponseNotAllowed
 from django.shortcuts import render
 
+from Weather_Forcast_App.scripts.Crawl_data_from_html_of_Vrain import VrainHtmlCrawler
+
 
 APP_ROOT = Path(__file__).resolve().parents[1]
-SCRIPT_PATH = APP_ROOT / "scripts" / "Crawl_data_from_html_of_Vrain.py"
 OUTPUT_DIR = APP_ROOT / "output"
 
+# Số trang Vrain crawl song song trong cùng tiến trình Django
+CRAWL_WORKERS = 4
+
 
 _STATE = {
     "is_running": False,
@@ -57,27 +58,17 @@ def _scan_latest_output():
 def _run_script_worker():
     try:
         _push_log("========== START VRAIN HTML CRAWL ==========")
-        _push_log(f"Script: {SCRIPT_PATH}")
+        _push_log(f"Crawler: VrainHtmlCrawler ({CRAWL_WORKERS} luồng)")
         _push_log(f"Output dir: {OUTPUT_DIR}")
 
-        if not SCRIPT_PATH.exists():
-            _push_log("[ERROR] Script không tồn tại!")
-            _STATE["last_returncode"] = -1
-            return
-
-        proc = subprocess.Popen(
-            [sys.executable, str(SCRIPT_PATH)],
-            cwd=str(APP_ROOT),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
+        crawler = VrainHtmlCrawler(
+            max_workers=CRAWL_WORKERS,
+            output_dir=OUTPUT_DIR,
+            log=_push_log,
         )
+        crawler.run()
 
-        for line in proc.stdout:
-            _push_log(line)
-
-        rc = proc.wait()
+        rc = 0 if not crawler.failed_urls else 1
         _STATE["last_returncode"] = rc
         _STATE["last_crawl_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -10,6 +10,16 @@ from django.utils.html import escape
 from datetime import datetime
 from django.utils import timezone as dj_tz
 
+from openpyxl import load_workbook
+
+from Weather_Forcast_App.scripts.Merge_xlsx import (
+    CATEGORY_EXPORTS,
+    PARTITIONS_DIR_NAME,
+    ensure_merged_exports_async,
+    partitions_for_window,
+)
+from Weather_Forcast_App.scripts.Profile_cache import get_profile_cache
+
 def _base_dir() -> Path:
     """
     Trả về thư mục Weather_Forcast_App
@@ -37,6 +47,16 @@ def _merged_dir() -> Path:
     return _base_dir() / "Merge_data"
 
 
+def _merged_partitions_dir() -> Path:
+    """Trả về thư mục Merge_data/partitions (file gộp theo tháng)"""
+    return _merged_dir() / PARTITIONS_DIR_NAME
+
+
+def _refresh_merged_exports() -> None:
+    """Export lại file merged .xlsx trên thread nền nếu kho có dữ liệu mới hơn; view đọc file đã có sẵn"""
+    ensure_merged_exports_async(_merged_dir())
+
+
 def _cleaned_dir() -> Path:
     """Trả về thư mục cleaned_data"""
     return _base_dir() / "cleaned_data"
@@ -54,6 +74,7 @@ def _folder_to_dir(folder: str) -> Path | None:
     mapping = {
         "output": _output_dir(),
         "merged": _merged_dir(),
+        "merged_partitions": _merged_partitions_dir(),
         "cleaned": _cleaned_dir(),
         "cleaned_merge": _cleaned_merge_dir(),
         "cleaned_raw": _cleaned_raw_dir(),
@@ -106,12 +127,46 @@ def _get_files_info(folder_path: Path, folder_key: str | None = None):
 
 
 
+def _get_partition_items(start: str | None, end: str | None):
+    """File phân vùng tháng giao với khoảng [start, end] (theo manifest), mới nhất trước"""
+    try:
+        if start:
+            pd.Timestamp(start)
+        if end:
+            pd.Timestamp(end)
+    except (ValueError, TypeError):
+        start = end = None
+
+    items = []
+    for category in CATEGORY_EXPORTS:
+        for part in partitions_for_window(_merged_dir(), category, start, end):
+            for name in part["files"]:
+                path = _merged_partitions_dir() / name
+                if not path.is_file():
+                    continue
+                st = path.stat()
+                items.append({
+                    "name": name,
+                    "category": category,
+                    "partition": part["partition"],
+                    "rows": part["rows"],
+                    "time_min": part["time_min"] or "",
+                    "time_max": part["time_max"] or "",
+                    "size_mb": round(st.st_size / (1024 * 1024), 2),
+                    "folder": "merged_partitions",
+                })
+
+    items.sort(key=lambda x: (x["partition"], x["name"]), reverse=True)
+    return items
+
+
 def _tag(items, folder_key: str):
     return [dict(x, folder=folder_key) for x in items]
 
 def datasets_view(request):
     _output_dir().mkdir(parents=True, exist_ok=True)
     _merged_dir().mkdir(parents=True, exist_ok=True)
+    _refresh_merged_exports()
     cleaned_dir = _cleaned_dir()
     cleaned_merge_dir = _cleaned_merge_dir()
     cleaned_raw_dir = _cleaned_not_merge_dir()
@@ -120,6 +175,10 @@ def datasets_view(request):
     output_items = _get_files_info(_output_dir(), "output")
     merged_items = _get_files_info(_merged_dir(), "merged")
 
+    window_from = (request.GET.get("from") or "").strip() or None
+    window_to = (request.GET.get("to") or "").strip() or None
+    merged_partition_items = _get_partition_items(window_from, window_to)
+
     cleaned_root_items  = _get_files_info(_cleaned_dir(), "cleaned")
     cleaned_merge_items = _get_files_info(_cleaned_merge_dir(), "cleaned_merge")
     cleaned_raw_items   = _get_files_info(_cleaned_raw_dir(), "cleaned_raw")
@@ -146,6 +205,9 @@ def datasets_view(request):
     context = {
         "output_items": output_items,
         "merged_items": merged_items,
+        "merged_partition_items": merged_partition_items,
+        "window_from": window_from or "",
+        "window_to": window_to or "",
         "cleaned_items": cleaned_items,
 
         "latest_output": latest_output,
@@ -168,6 +230,8 @@ def dataset_download_view(request, folder: str, filename: str):
     base_dir = _folder_to_dir(folder)
     if not base_dir:
         raise Http404("Invalid folder")
+    if folder.strip().lower() in ("merged", "merged_partitions"):
+        _refresh_merged_exports()
 
     p = _safe_join(base_dir, filename)
     content_type, _ = mimetypes.guess_type(str(p))
@@ -187,10 +251,36 @@ def _get_file_type(filename: str) -> str:
         return 'txt'
 
 
+def _count_rows(p: Path, file_type: str) -> int:
+    if file_type == 'csv':
+        with open(p, 'r', encoding='utf-8') as f:
+            return sum(1 for line in f) - 1
+    wb = load_workbook(p, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        next(rows, None)
+        return sum(1 for row in rows if any(v is not None for v in row))
+    finally:
+        wb.close()
+
+
+def _total_rows(p: Path, file_type: str) -> int:
+    """Số dòng dữ liệu, lấy từ profile cache nếu file chưa đổi (dùng chung với phân tích missing)"""
+    cache = get_profile_cache()
+    profile = cache.get(p) or {}
+    if "rows" in profile:
+        return int(profile["rows"])
+    rows = _count_rows(p, file_type)
+    cache.update(p, rows=rows)
+    return rows
+
+
 def dataset_view_view(request, folder: str, filename: str):
     base_dir = _folder_to_dir(folder)
     if not base_dir:
         raise Http404("Invalid folder")
+    if folder.strip().lower() in ("merged", "merged_partitions"):
+        _refresh_merged_exports()
 
     p = _safe_join(base_dir, filename)
 
@@ -206,26 +296,19 @@ def dataset_view_view(request, folder: str, filename: str):
             start_row = (page - 1) * rows_per_page
             end_row = start_row + rows_per_page
             
+            total_rows = _total_rows(p, file_type)
+            # Giữ dòng header (dòng 0), bỏ đúng start_row dòng dữ liệu của các trang trước
+            page_skip = range(1, start_row + 1)
             if file_type == 'csv':
                 if is_ajax:
-                    df = pd.read_csv(p, encoding='utf-8', skiprows=range(1, start_row), nrows=rows_per_page)
-                    total_rows = 0
-                    with open(p, 'r', encoding='utf-8') as f:
-                        total_rows = sum(1 for line in f) - 1
+                    df = pd.read_csv(p, encoding='utf-8', skiprows=page_skip, nrows=rows_per_page)
                 else:
                     df = pd.read_csv(p, encoding='utf-8', nrows=rows_per_page)
-                    total_rows = 0
-                    with open(p, 'r', encoding='utf-8') as f:
-                        total_rows = sum(1 for line in f) - 1
             else:
                 if is_ajax:
-                    df_full = pd.read_excel(p, engine='openpyxl')
-                    total_rows = len(df_full)
-                    df = df_full.iloc[start_row:end_row]
+                    df = pd.read_excel(p, engine='openpyxl', skiprows=page_skip, nrows=rows_per_page)
                 else:
                     df = pd.read_excel(p, engine='openpyxl', nrows=rows_per_page)
-                    df_full = pd.read_excel(p, engine='openpyxl')
-                    total_rows = len(df_full)
             
             if is_ajax:
                 data = {
@@ -1,4 +1,7 @@
 import os
+import time
+import uuid
+import threading
 import subprocess
 from pathlib import Path
 from datetime import datetime
@@ -6,8 +9,92 @@ import sys
 
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from django.urls import reverse
 
+from Weather_Forcast_App.scripts.Merge_xlsx import (
+    EXIT_MERGE_BUSY,
+    MergeBusyError,
+    ensure_merged_exports,
+    parse_progress_line,
+)
+
+
+APP_ROOT = Path(__file__).resolve().parents[1]
+SCRIPT_PATH = APP_ROOT / "scripts" / "Merge_xlsx.py"
+OUTPUT_DIR = APP_ROOT / "output"
+MERGE_DIR = APP_ROOT / "Merge_data"
+
+LOG_LIMIT = 4000
+# Job đã xong được giữ lại để client đọc kết quả, rồi bị xoá khi quá hạn hoặc quá số lượng
+JOB_TTL_S = 60 * 60
+MAX_FINISHED_JOBS = 20
+
+
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+# Job gộp đang chạy trong process này (kho chỉ có một người ghi)
+_ACTIVE_JOB = {"job_id": None}
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _push(job_id: str, line: str):
+    line = (line or "").rstrip("\n")
+    if not line:
+        return
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if not job:
+            return
+        job["logs"].append(line)
+        if len(job["logs"]) > LOG_LIMIT:
+            job["logs"] = job["logs"][-LOG_LIMIT:]
+
+
+def _set_progress(job_id: str, pct: int, step: str):
+    pct = max(0, min(100, int(pct)))
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if not job:
+            return
+        job["progress"] = {"pct": pct, "step": step}
+
+
+def _evict_jobs():
+    """Xoá job đã xong quá JOB_TTL_S, rồi giữ tối đa MAX_FINISHED_JOBS job xong gần nhất (gọi khi giữ _JOBS_LOCK)"""
+    now = time.monotonic()
+    finished = sorted(
+        (job["finished_ts"], job_id)
+        for job_id, job in _JOBS.items()
+        if job["done"] and job_id != _ACTIVE_JOB["job_id"]
+    )
+    expired = {job_id for finished_ts, job_id in finished if now - finished_ts > JOB_TTL_S}
+    overflow = {job_id for _, job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]}
+    for job_id in expired | overflow:
+        del _JOBS[job_id]
+
+
+def _track_progress(job_id: str, pct: int, progress: dict, started: float):
+    """Cập nhật thống kê (file xong, dòng đã append, dòng/giây) từ một dòng PROGRESS của Merge_xlsx"""
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if not job:
+            return
+        stats = job["stats"]
+        stats.update({k: v for k, v in progress.items() if k in stats})
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        stats["elapsed_s"] = round(elapsed, 1)
+        stats["rows_per_sec"] = round(stats["rows_appended"] / elapsed, 1)
+
+        # Gộp chiếm 5% -> 90%, phần còn lại dành cho export
+        if stats["files_total"]:
+            step = f"Đã gộp {stats['files_done']}/{stats['files_total']} file"
+            job["progress"] = {"pct": 5 + int(85 * min(pct, 100) / 100), "step": step}
+
 
 def _latest_file_info(dir_path: str):
     p = Path(dir_path)
@@ -30,52 +117,165 @@ def _latest_file_info(dir_path: str):
     }
 
 
-@csrf_exempt
-def merge_data_view(request):
-    if request.method != "POST":
-        return JsonResponse({"success": False, "message": "Method not allowed."}, status=405)
+def _finish(job_id: str, error: str | None, result: dict):
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if job:
+            job["done"] = True
+            job["error"] = error
+            job["finished_at"] = _now()
+            job["finished_ts"] = time.monotonic()
+            job["result"] = result
+            job["progress"] = {"pct": 100, "step": "Lỗi" if error else "Hoàn thành"}
+        if _ACTIVE_JOB["job_id"] == job_id:
+            _ACTIVE_JOB["job_id"] = None
+        _evict_jobs()
 
-    try:
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        script_path = os.path.join(BASE_DIR, "scripts", "Merge_xlsx.py")
-        python_exe = sys.executable
-        output_dir = os.path.join(BASE_DIR, "output")
-        merge_dir = os.path.join(BASE_DIR, "Merge_data")
 
-        before_files = set(os.listdir(output_dir)) if os.path.exists(output_dir) else set()
+def _worker(job_id: str):
+    started = time.monotonic()
+    error = None
+    latest_merged = None
+    try:
+        _push(job_id, "========== START MERGE ==========")
+        _set_progress(job_id, 2, "Khởi chạy Merge_xlsx")
 
-        result = subprocess.run(
-            [python_exe, script_path],
-            capture_output=True,
+        env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+        proc = subprocess.Popen(
+            [sys.executable, "-u", str(SCRIPT_PATH), "--progress"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            check=False
+            encoding="utf-8",
+            errors="replace",
+            env=env,
         )
+        with _JOBS_LOCK:
+            _JOBS[job_id]["pid"] = proc.pid
 
-        after_files = set(os.listdir(output_dir)) if os.path.exists(output_dir) else set()
-        new_files_count = len(after_files - before_files)
+        for line in proc.stdout:
+            progress = parse_progress_line(line)
+            if progress is None:
+                _push(job_id, line)
+            else:
+                _track_progress(job_id, *progress, started)
+        returncode = proc.wait()
 
-        latest_merged = _latest_file_info(merge_dir)
+        if returncode == EXIT_MERGE_BUSY:
+            error = "Đang có một tiến trình gộp khác ghi vào kho, vui lòng thử lại sau."
+        elif returncode != 0:
+            error = f"Merge_xlsx kết thúc với mã lỗi {returncode}"
+        else:
+            # Kho gộp là SQLite; file .xlsx chỉ được export lại khi có dữ liệu mới
+            _set_progress(job_id, 95, "Export file merged")
+            try:
+                for path in ensure_merged_exports(MERGE_DIR):
+                    _push(job_id, f"[INFO] Export: {path.name}")
+            except MergeBusyError:
+                # Watcher/job khác vừa giữ kho; họ sẽ export khi xong
+                _push(job_id, "[WARN] Kho gộp đang bận, bỏ qua export lần này")
+
+        latest_merged = _latest_file_info(str(MERGE_DIR))
         if latest_merged:
             folder_key = "merged"
             latest_merged["folder"] = folder_key
             latest_merged["view_url"] = reverse("weather:dataset_view", args=[folder_key, latest_merged["name"]])
             latest_merged["download_url"] = reverse("weather:dataset_download", args=[folder_key, latest_merged["name"]])
 
-        if result.returncode != 0:
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    if error:
+        _push(job_id, f"[ERROR] {error}")
+    else:
+        _push(job_id, "========== DONE ==========")
+
+    with _JOBS_LOCK:
+        stats = dict(_JOBS[job_id]["stats"]) if job_id in _JOBS else {}
+    _finish(job_id, error, {
+        "success": error is None,
+        "message": "Gộp dữ liệu thành công!" if error is None else "Gộp dữ liệu thất bại!",
+        "new_files_count": stats.get("files_total", 0),
+        "stats": stats,
+        "latest_merged": latest_merged,
+    })
+
+
+@csrf_exempt
+def merge_data_view(request):
+    """Bắt đầu job gộp nền và trả về job_id ngay; nếu đang có job chạy thì trả về job đó"""
+    if request.method != "POST":
+        return JsonResponse({"success": False, "message": "Method not allowed."}, status=405)
+
+    with _JOBS_LOCK:
+        running = _ACTIVE_JOB["job_id"]
+        if running and not _JOBS.get(running, {}).get("done", True):
             return JsonResponse({
-                "success": False,
-                "message": "Gộp dữ liệu thất bại!",
-                "stderr": result.stderr,
-                "new_files_count": new_files_count,
-                "latest_merged": latest_merged
+                "success": True,
+                "job_id": running,
+                "already_running": True,
+                "message": "Đang có job gộp dữ liệu chạy, theo dõi tiến độ của job này.",
             })
 
-        return JsonResponse({
-            "success": True,
-            "message": "Gộp dữ liệu thành công!",
-            "new_files_count": new_files_count,
-            "latest_merged": latest_merged
-        })
+        _evict_jobs()
+        job_id = uuid.uuid4().hex
+        _JOBS[job_id] = {
+            "job_id": job_id,
+            "started_at": _now(),
+            "finished_at": None,
+            "finished_ts": None,
+            "done": False,
+            "error": None,
+            "logs": [],
+            "progress": {"pct": 0, "step": "Khởi tạo"},
+            "stats": {
+                "files_total": 0,
+                "files_done": 0,
+                "files_failed": 0,
+                "rows_appended": 0,
+                "rows_skipped": 0,
+                "rows_per_sec": 0.0,
+                "elapsed_s": 0.0,
+                "current_file": None,
+            },
+            "result": None,
+            "pid": None,
+        }
+        _ACTIVE_JOB["job_id"] = job_id
 
-    except Exception as e:
-        return JsonResponse({"success": False, "message": f"Lỗi: {str(e)}"})
\ No newline at end of file
+    t = threading.Thread(target=_worker, args=(job_id,), daemon=True)
+    t.start()
+    return JsonResponse({"success": True, "job_id": job_id, "already_running": False})
+
+
+@require_http_methods(["GET"])
+def merge_data_tail_view(request):
+    job_id = (request.GET.get("job_id") or "").strip()
+    since = request.GET.get("since", "0")
+    try:
+        since_i = max(0, int(since))
+    except Exception:
+        since_i = 0
+
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if job:
+            logs = job["logs"]
+            new_lines = logs[since_i:]
+            payload = {
+                "ok": True,
+                "job_id": job_id,
+                "done": job["done"],
+                "error": job["error"],
+                "progress": job["progress"],
+                "stats": dict(job["stats"]),
+                "started_at": job["started_at"],
+                "finished_at": job["finished_at"],
+                "lines": new_lines,
+                "next_since": since_i + len(new_lines),
+                "result": job["result"],
+            }
+
+    if not job:
+        return JsonResponse({"ok": False, "message": "job_id không tồn tại"}, status=404)
+    return JsonResponse(payload)